@@ -0,0 +1,87 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+from langchain_core.prompts import PromptTemplate
+from schemas import BaziContext
+from utils.llm_router import LLMRouter
+from utils.tracing import traced
+
+load_dotenv()
+
+
+def _read_prompt(filename: str) -> str:
+    current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(current_dir, "prompt", filename), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# 提示词布局（利于 provider 前缀缓存）：
+# system = 固定指令（所有会话字节级一致）；human = 排盘与日期信息（会话内不变）+ 此前对话摘要（压缩时才变化）；
+# ai = 固定确认语；其后为未压缩的对话记录（只追加）与本轮问题
+system_prompt = _read_prompt("chat_prompt.txt").strip()
+context_template = PromptTemplate.from_template(_read_prompt("chat_context.txt"))
+summary_prompt = _read_prompt("chat_summary_prompt.txt").strip()
+CONTEXT_ACK = "好的，我已了解命主的排盘与日期信息，请提问。"
+ROLE_NAMES = {"human": "命主", "ai": "扶摇子"}
+
+Messages = List[Tuple[str, str]]
+
+
+class ChatAgent:
+
+    def __init__(
+            self,
+            router: Optional[LLMRouter] = None,
+            provider: Optional[str] = None,
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            timeout: int = 300,
+            max_retries: int = 3,
+    ):
+        self.router = router or LLMRouter.shared(
+            provider=provider,
+            model=model,
+            temperature=temperature,
+            timeout=timeout,
+            max_retries=max_retries,
+            default_provider="deepseek",
+        )
+
+    @staticmethod
+    def render_context(context: BaziContext, natal_summary: Optional[str] = None) -> str:
+        """会话的排盘提示词（创建会话时渲染一次并保存）"""
+        return context_template.format(
+            nowtime=context.nowtime,
+            calendar=context.calendar,
+            name=context.name,
+            gender=context.gender,
+            isTai=context.isTai,
+            birth_correct=context.birth_correct,
+            city=context.city,
+            bazi=context.bazi,
+            dayun_time=context.dayun_time,
+            qiyun_time=context.qiyun_time,
+            jiaoyun_time=context.jiaoyun_time,
+            liunian_block=f"\n\n- 流年\n{context.liunian_time}" if context.liunian_time else "",
+            natal_block=f"\n\n### 命盘摘要\n\n{natal_summary}" if natal_summary else "",
+        ).strip()
+
+    @staticmethod
+    @traced("prompt.render_chat")
+    def build_messages(context_prompt: str, summary: str, history: Sequence[Tuple[str, str]], question: str) -> Messages:
+        first = f"{context_prompt}\n\n### 此前对话摘要\n\n{summary}" if summary else context_prompt
+        messages: Messages = [("system", system_prompt), ("human", first), ("ai", CONTEXT_ACK)]
+        messages.extend(history)
+        messages.append(("human", question))
+        return messages
+
+    async def astream_reply(self, messages: Messages, caller: str = "chat"):
+        async for chunk in self.router.astream(messages, caller=caller):
+            yield chunk
+
+    @traced("agent.chat.summarize")
+    def summarize(self, summary: str, history: Sequence[Tuple[str, str]], caller: str = "chat") -> str:
+        """把已有摘要与较早的对话记录合并为新的滚动摘要"""
+        dialog = "\n".join(f"{ROLE_NAMES.get(role, role)}：{content}" for role, content in history)
+        user_message = f"### 已有摘要\n\n{summary or '（无）'}\n\n### 新增对话\n\n{dialog}"
+        return self.router.invoke([("system", summary_prompt), ("human", user_message)], caller=caller).strip()
@@ -1,23 +1,37 @@
 import os
+import re
 from datetime import date
 from typing import Optional
 
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 import jinja2
 import json
 
 from schemas import BaziContext
 from utils.prompt_utils import load_prompt_split
 from utils.llm_router import LLMRouter
+from utils.tracing import traced
 
 load_dotenv()
 
 
 class FortuneResult(BaseModel):
-    emotion: int
-    health: int
-    wealth: int
+    emotion: int = Field(..., ge=0, le=100)
+    health: int = Field(..., ge=0, le=100)
+    wealth: int = Field(..., ge=0, le=100)
+
+
+# 三个整数的 JSON 输出很短，限制输出 token 以降低延迟与成本
+SCORE_MAX_TOKENS = 64
+# 修复阶段只回传有限长度的原始输出
+REPAIR_INPUT_CHARS = 500
+
+REPAIR_SYSTEM_PROMPT = (
+    "将用户给出的内容修正为严格的 JSON 对象，"
+    "只包含 emotion、health、wealth 三个字段，取值为 0 到 100 的整数。"
+    "只输出 JSON，不要输出任何其他字符。"
+)
 
 
 class FortuneScoreAgent:
@@ -31,11 +45,13 @@ class FortuneScoreAgent:
     def __init__(
         self,
         prompt_path: Optional[str] = None,
+        router: Optional[LLMRouter] = None,
         provider: Optional[str] = None,
         model: Optional[str] = None,
         temperature: float = 0.2,
         timeout: int = 600,
         max_retries: int = 3,
+        repair_attempts: int = 1,
     ):
         # 模板路径
         if prompt_path and os.path.exists(prompt_path):
@@ -44,16 +60,22 @@ class FortuneScoreAgent:
             project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             self.prompt_path = os.path.join(project_root, "prompt", "predict_fortune.md")
 
-        # 使用统一路由（默认 gemini-2.5-flash）
-        self.router = LLMRouter(
-            provider=provider or os.getenv("LLM_PROVIDER", "gemini"),
-            model=model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+        # 使用进程级共享路由（默认 gemini-2.5-flash）
+        # provider 未指定时跟随配置（settings.yaml > LLM_PROVIDER > gemini），支持热切换
+        self.router = router or LLMRouter.shared(
+            provider=provider,
+            model=model,
             temperature=temperature,
             timeout=timeout,
             max_retries=max_retries,
+            default_provider="gemini",
         )
+        self.repair_attempts = repair_attempts
 
-    def _render_messages(self, context: BaziContext, dimension: str) -> list[tuple[str, str]]:
+    @traced("prompt.render_score")
+    def _render_messages(
+            self, context: BaziContext, dimension: str, prior: Optional[dict] = None
+    ) -> list[tuple[str, str]]:
         """
         读取并渲染 predict_fortune.md：
         - 使用 utils.prompt_utils.load_prompt_split 以 '---' 切分为 system / user
@@ -82,6 +104,12 @@ class FortuneScoreAgent:
             except Exception:
                 other_info = ""
 
+        # 本地规则参考分：放在 user 部分，system 指令保持不变
+        if prior:
+            prior_text = (f"规则引擎参考分（可在此基础上结合命理调整）："
+                          f"情感 {prior['emotion']}，健康 {prior['health']}，财富 {prior['wealth']}")
+            other_info = f"{other_info}\n{prior_text}" if other_info else prior_text
+
         system_text = sys_template.render(**context.model_dump())
         user_text = user_template.render(
             dimension=dimension,
@@ -90,40 +118,106 @@ class FortuneScoreAgent:
         )
         return [("system", system_text), ("human", user_text)]
 
-    def predict_scores(self, context: BaziContext, dimension: str) -> dict:
+    @traced("agent.score.predict_scores")
+    def predict_scores(
+            self, context: BaziContext, dimension: str, caller: str = "score", prior: Optional[dict] = None
+    ) -> dict:
         """
         同步获取结构化打分结果（返回 dict: {emotion, health, wealth}，均为整数）
+        - prior 为本地规则参考分（可选），随提示词交给模型微调
+        - 使用 provider 原生 JSON 模式 + 输出 token 上限
+        - 解析失败时先做本地修复，仍失败则发起有限次数的低成本修复调用
         """
-        messages = self._render_messages(context, dimension)
-        text = self.router.invoke(messages)
+        messages = self._render_messages(context, dimension, prior)
+        text = self.router.invoke_json(messages, FortuneResult, max_tokens=SCORE_MAX_TOKENS, caller=caller)
 
         if not text or not text.strip():
             # 明确抛出空响应错误，便于调用方感知
             raise ValueError("LLM_EMPTY_RESPONSE")
 
-        # 解析并校验为结构化结果
+        parsed = parse_scores(text)
+        attempts = 0
+        while parsed is None and attempts < self.repair_attempts:
+            attempts += 1
+            repair_messages = [
+                ("system", REPAIR_SYSTEM_PROMPT),
+                ("human", text.strip()[:REPAIR_INPUT_CHARS]),
+            ]
+            text = self.router.invoke_json(repair_messages, FortuneResult, max_tokens=SCORE_MAX_TOKENS, caller=caller)
+            parsed = parse_scores(text or "")
+
+        if parsed is None:
+            raise ValueError("LLM_JSON_NOT_FOUND")
+        return parsed.model_dump()
+
+
+def _to_score(v) -> Optional[int]:
+    """将单个分值规整为 0-100 的整数，无法识别时返回 None"""
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return max(0, min(100, int(v)))
+    if isinstance(v, str):
+        m = re.search(r"-?\d+", v)
+        if m:
+            return max(0, min(100, int(m.group(0))))
+    return None
+
+
+def _first_json_object(text: str) -> Optional[str]:
+    """按括号配对提取首个完整的 JSON 对象（非贪婪，避免吞掉多段内容）"""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_str = False
+        escaped = False
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_str:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_str = False
+            elif ch == '"':
+                in_str = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        start = text.find("{", start + 1)
+    return None
+
+
+def parse_scores(text: str) -> Optional[FortuneResult]:
+    """
+    解析模型输出为 FortuneResult，失败返回 None
+    1. 严格 JSON 校验
+    2. 提取首个 JSON 对象并规整分值
+    3. 兜底按 "emotion: 80" 形式的键值对提取
+    """
+    try:
+        return FortuneResult.model_validate_json(text)
+    except ValidationError:
+        pass
+
+    data: dict = {}
+    obj = _first_json_object(text)
+    if obj:
         try:
-            parsed = FortuneResult.model_validate_json(text)  # pydantic v2
-        except Exception:
-            import re
-            # 容错：从输出中提取首个 JSON 对象
-            m = re.search(r"\{[\s\S]*\}", text)
-            if not m:
-                raise ValueError("LLM_JSON_NOT_FOUND")
-            data = json.loads(m.group(0))
-
-            def to_int(v):
-                if isinstance(v, (int, float)):
-                    return max(0, min(100, int(v)))
-                if isinstance(v, str):
-                    m2 = re.search(r"-?\d+", v)
-                    if m2:
-                        return max(0, min(100, int(m2.group(0))))
-                raise ValueError("INVALID_SCORE_VALUE")
-
-            parsed = FortuneResult(
-                emotion=to_int(data.get("emotion")),
-                health=to_int(data.get("health")),
-                wealth=to_int(data.get("wealth")),
-            )
-        return parsed.model_dump()
\ No newline at end of file
+            loaded = json.loads(obj)
+            if isinstance(loaded, dict):
+                data = loaded
+        except json.JSONDecodeError:
+            data = {}
+    if not data:
+        for k, v in re.findall(r'"?(emotion|health|wealth)"?\s*[:：=]\s*"?(-?\d+)', text):
+            data.setdefault(k, v)
+
+    scores = {k: _to_score(data.get(k)) for k in ("emotion", "health", "wealth")}
+    if any(v is None for v in scores.values()):
+        return None
+    return FortuneResult(**scores)
@@ -1,28 +1,84 @@
 
-import os
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import threading
 from typing import Optional
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
+from db.natal_store import natal_store
 from schemas import BaziContext
 from utils.llm_router import LLMRouter
+from utils.tracing import traced
 
 load_dotenv()
-logging.basicConfig(
-    level=os.getenv("LOG_LEVEL", "INFO").upper(),
-    format="%(asctime)s - %(levelname)s - %(message)s",
+
+logger = logging.getLogger(__name__)
+
+
+def _read_prompt(filename: str) -> str:
+    try:
+        with open(os.path.join("prompt", filename), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        prompt_path = os.path.join(current_dir, "prompt", filename)
+        with open(prompt_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+
+# 提示词布局（利于 provider 前缀缓存）：
+# system = 固定指令（所有请求字节级一致）；human = 本周日历（同一周所有用户一致）+ 命主信息（每人不同）
+system_prompt = _read_prompt("system_prompt.txt").strip()
+prompt_template = PromptTemplate.from_template(_read_prompt("weekly_context.txt"))
+
+# 两阶段生成：命盘解读（与日期无关）按命盘生成一次并持久缓存；报告标题与「命盘解读」由服务端拼接，
+# 模型只看命盘摘要与本周日历、只写「流日分析」之后的部分；解读失败时退回单阶段（完整命盘信息）
+two_stage = os.getenv("WEEKLY_TWO_STAGE", "true").lower() in ("1", "true", "yes")
+weekly_system_prompt = _read_prompt("weekly_system_prompt.txt").strip()
+_natal_system = _read_prompt("natal_prompt.txt").strip()
+_natal_text = _read_prompt("natal_context.txt")
+natal_template = PromptTemplate.from_template(_natal_text)
+delta_template = PromptTemplate.from_template(_read_prompt("weekly_delta_context.txt"))
+# 解读提示词的版本：修改提示词后缓存自动失效
+_natal_version = hashlib.sha256((_natal_system + _natal_text).encode("utf-8")).hexdigest()[:12]
+_NATAL_FIELDS = ("gender", "isTai", "birth_correct", "bazi", "dayun_time", "qiyun_time", "jiaoyun_time")
+
+# 分段生成：报告按输出格式拆成互不依赖的段落并发生成（开头解读、逐日分析、总结展望），按顺序拼接输出
+# 各段共用同一组 system + human 消息（前缀可命中缓存），只在末尾追加本段的输出要求
+SECTION_CONCURRENCY = max(1, int(os.getenv("REPORT_SECTION_CONCURRENCY", "4")))
+SECTION_SEPARATOR = "\n\n---\n\n"
+_SECTION_HEAD = "本次只输出报告中的一部分："
+_OVERVIEW_SECTION = (
+    "从报告标题开始，输出「命盘解读」与「流日分析」中的「当下大环境」，到此为止；不要输出每日分析与总结展望。"
+)
+_DAY_SECTION = (
+    "只输出「{day}」这一天的分析（标题行、分析、建议），遵循周一至周日分析统一规则；"
+    "不要输出报告标题、命盘解读、其他日期与总结展望。"
 )
+_WEEKLY_OVERVIEW_SECTION = "只输出「流日分析」标题与其中的「当下大环境」，到此为止；不要输出每日分析与总结展望。"
+_SUMMARY_SECTION = "只输出「总结展望」部分（本周运势、关键事件与本周到下周变化的一句话概括），不要输出前面的内容。"
 
-try:
-    with open("prompt/system_prompt.txt", "r", encoding="utf-8") as f:
-        _template_string = f.read()
-except FileNotFoundError:
-    current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    prompt_path = os.path.join(current_dir, "prompt", "system_prompt.txt")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        _template_string = f.read()
 
-prompt_template = PromptTemplate.from_template(_template_string)
+def natal_key(context: BaziContext) -> str:
+    """命盘指纹：只取与日期无关的命盘字段（不含姓名、所在城市）"""
+    fields = {name: getattr(context, name) for name in _NATAL_FIELDS}
+    raw = json.dumps([_natal_version, fields], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def report_head(context: BaziContext) -> str:
+    """两阶段报告的标题（与单阶段时模型输出的标题格式一致）"""
+    days = [line.split()[-1] for line in context.calendar.splitlines() if line.strip()][:7]
+    period = f"{days[0]} - {days[-1]}" if days else ""
+    return f"### **{context.name}专属五行能量周报（{period}）**"
+
+
+def natal_section(context: BaziContext, natal_summary: str) -> str:
+    """拼接在模型输出之前的部分：报告标题 + 命盘解读（缓存的命盘摘要）"""
+    return f"{report_head(context)}{SECTION_SEPARATOR}{natal_summary.strip()}{SECTION_SEPARATOR}"
 
 
 class WeeklyFortuneAgent:
@@ -36,16 +92,108 @@ class WeeklyFortuneAgent:
             timeout: int = 600,
             max_retries: int = 3,
     ):
-        self.router = router or LLMRouter(
-            provider=provider or os.getenv("LLM_PROVIDER", "deepseek"),# gemini
-            model=model or os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),# gemini-2.5-flash
+        # provider 未指定时跟随配置（settings.yaml > LLM_PROVIDER > deepseek），支持热切换
+        self.router = router or LLMRouter.shared(
+            provider=provider,
+            model=model,
             temperature=temperature,
             timeout=timeout,
             max_retries=max_retries,
+            default_provider="deepseek",
         )
+        # 同一命盘同时只生成一次解读（其余请求等待后读缓存）
+        self._natal_locks: dict[str, threading.Lock] = {}
+        self._natal_guard = threading.Lock()
+
+    @traced("agent.weekly.natal_summary")
+    def natal_summary(self, context: BaziContext, caller: str = "analyze") -> Optional[str]:
+        """命盘摘要：先查缓存，未命中时调用 LLM 生成并入库；失败返回 None"""
+        key = natal_key(context)
+        summary = natal_store.get(key)
+        if summary:
+            return summary
+        with self._natal_guard:
+            lock = self._natal_locks.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                summary = natal_store.get(key)
+                if summary:
+                    return summary
+                try:
+                    summary = (self.router.invoke(self._natal_messages(context), caller=caller) or "").strip()
+                except Exception as e:
+                    logger.warning(f"[weekly] 命盘解读生成失败，退回单阶段: {e}")
+                    return None
+                if not summary:
+                    return None
+                natal_store.put(key, summary, f"{self.router.provider}:{self.router.model}")
+        finally:
+            # 只移除自己登记的锁：等待者醒来时可能已有新的调用者登记了新锁
+            with self._natal_guard:
+                if self._natal_locks.get(key) is lock:
+                    del self._natal_locks[key]
+        return summary
 
-    def _build_messages(self, context: BaziContext) -> list[tuple[str, str]]:
-        system_message = prompt_template.format(
+    @staticmethod
+    def _natal_messages(context: BaziContext) -> list[tuple[str, str]]:
+        user_message = natal_template.format(**{name: getattr(context, name) for name in _NATAL_FIELDS})
+        return [("system", _natal_system), ("human", user_message.strip())]
+
+    async def _astream_natal(self, context: BaziContext, caller: str, result: list[str]):
+        """
+        两阶段报告的开头（标题 + 命盘解读）：缓存命中时一次给出；未命中时流式生成解读并随报告输出，
+        完成后入库，不额外等待一次非流式调用。得到的命盘摘要追加到 result（没有时调用方退回单阶段）
+        """
+        key = natal_key(context)
+        summary = await asyncio.to_thread(natal_store.get, key)
+        if summary:
+            result.append(summary)
+            yield natal_section(context, summary)
+            return
+        parts: list[str] = []
+        try:
+            async for chunk in self.router.astream(self._natal_messages(context), caller=caller):
+                if not chunk:
+                    continue
+                if not parts:
+                    yield f"{report_head(context)}{SECTION_SEPARATOR}"
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            # 已输出部分解读时无法再退回单阶段
+            if parts:
+                raise
+            logger.warning(f"[weekly] 命盘解读生成失败，退回单阶段: {e}")
+        summary = "".join(parts).strip()
+        if not summary:
+            return
+        await asyncio.to_thread(natal_store.put, key, summary, f"{self.router.provider}:{self.router.model}")
+        result.append(summary)
+        yield SECTION_SEPARATOR
+
+    @staticmethod
+    def _sections(context: BaziContext, natal_summary: Optional[str] = None) -> list[tuple[str, str]]:
+        """(段落分隔符, 段落要求)：开头解读（两阶段时只有当下大环境）+ 本周七天 + 总结展望"""
+        days = [line.strip() for line in context.calendar.splitlines() if line.strip()][:7]
+        sections = [("", _WEEKLY_OVERVIEW_SECTION if natal_summary else _OVERVIEW_SECTION)]
+        sections += [(SECTION_SEPARATOR if i == 0 else "\n\n", _DAY_SECTION.format(day=day)) for i, day in enumerate(days)]
+        sections.append((SECTION_SEPARATOR, _SUMMARY_SECTION))
+        return sections
+
+    @traced("prompt.render_weekly")
+    def _build_messages(self, context: BaziContext, natal_summary: Optional[str] = None) -> list[tuple[str, str]]:
+        liunian_block = f"\n\n- 流年\n{context.liunian_time}" if context.liunian_time else ""
+        if natal_summary:
+            user_message = delta_template.format(
+                nowtime=context.nowtime,
+                calendar=context.calendar,
+                gender=context.gender,
+                bazi=context.bazi,
+                liunian_block=liunian_block,
+                natal_summary=natal_summary,
+            )
+            return [("system", weekly_system_prompt), ("human", user_message.strip())]
+        user_message = prompt_template.format(
             nowtime=context.nowtime,
             calendar=context.calendar,
             name=context.name,
@@ -57,19 +205,70 @@ class WeeklyFortuneAgent:
             dayun_time=context.dayun_time,
             qiyun_time=getattr(context, "qiyun_time", ""),
             jiaoyun_time=context.jiaoyun_time,
+            liunian_block=liunian_block,
         )
-        user_message = "请严格按照规则所示的输出格式生成分析报告，不要输出任何无关字符"
-        return [("system", system_message), ("human", user_message)]
+        return [("system", system_prompt), ("human", user_message.strip())]
 # 非流式同步
-    def generate_report(self, context: BaziContext) -> str:
-        messages = self._build_messages(context)
-        return self.router.invoke(messages)
+    @traced("agent.weekly.generate_report")
+    def generate_report(self, context: BaziContext, caller: str = "analyze") -> str:
+        summary = self.natal_summary(context, caller) if two_stage else None
+        report = self.router.invoke(self._build_messages(context, summary), caller=caller)
+        return natal_section(context, summary) + report if summary else report
 # 流式同步
-    def stream_report(self, context):
-        messages = self._build_messages(context)
-        return self.router.stream(messages)
+    def stream_report(self, context, caller: str = "stream"):
+        summary = self.natal_summary(context, caller) if two_stage else None
+        if summary:
+            yield natal_section(context, summary)
+        yield from self.router.stream(self._build_messages(context, summary), caller=caller)
 # 流式异步
-    async def astream_report(self, context):
-        messages = self._build_messages(context)
-        async for chunk in self.router.astream(messages):
-            yield chunk
\ No newline at end of file
+    async def astream_report(self, context, caller: str = "stream"):
+        result: list[str] = []
+        if two_stage:
+            async for chunk in self._astream_natal(context, caller, result):
+                yield chunk
+        messages = self._build_messages(context, result[0] if result else None)
+        async for chunk in self.router.astream(messages, caller=caller):
+            yield chunk
+# 分段并发（异步流式）
+    async def astream_sectioned_report(self, context, caller: str = "stream"):
+        """
+        各段并发生成（最多 SECTION_CONCURRENCY 段同时进行），按段落顺序输出：
+        当前段边生成边输出，后面已开始的段先缓冲，轮到时一次输出已缓冲部分再跟随；任一段失败即抛出
+        """
+        result: list[str] = []
+        if two_stage:
+            async for chunk in self._astream_natal(context, caller, result):
+                yield chunk
+        summary = result[0] if result else None
+        system, human = self._build_messages(context, summary)
+        sections = self._sections(context, summary)
+        semaphore = asyncio.Semaphore(SECTION_CONCURRENCY)
+        queues: list[asyncio.Queue] = [asyncio.Queue() for _ in sections]
+
+        async def produce(index: int, requirement: str) -> None:
+            queue = queues[index]
+            messages = [system, ("human", f"{human[1]}\n\n{_SECTION_HEAD}{requirement}")]
+            try:
+                async with semaphore:
+                    async for chunk in self.router.astream(messages, caller=caller):
+                        queue.put_nowait(chunk)
+                queue.put_nowait(None)
+            except Exception as e:
+                queue.put_nowait(e)
+
+        # 按段落顺序创建任务，信号量先到先得，保证靠前的段先开始
+        tasks = [asyncio.create_task(produce(i, requirement)) for i, (_, requirement) in enumerate(sections)]
+        try:
+            for (separator, _), queue in zip(sections, queues):
+                if separator:
+                    yield separator
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
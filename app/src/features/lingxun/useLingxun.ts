@@ -1,12 +1,53 @@
 "use client";
 import { useEffect, useState } from "react";
-import { flushSync } from "react-dom";
 import { format } from "date-fns";
 import { toast } from "sonner";
 import { regionData, codeToText } from "element-china-area-data";
 import type { HistoryEntry } from "@/features/lingxun/types";
 import { API_BASE_URL } from "@/config/api";
 
+// 断线后最多续传次数（服务端后台继续生成，续传不会重新计费）
+const MAX_RESUME_ATTEMPTS = 3;
+
+type SseEvent = { id: string; event: string; data: string };
+
+// 逐条解析 SSE 事件（忽略心跳注释）
+async function readSse(response: Response, onEvent: (ev: SseEvent) => void): Promise<void> {
+  const reader = response.body?.getReader();
+  if (!reader) {
+    throw new Error("无法获取reader");
+  }
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      return;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let sep: number;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const ev: SseEvent = { id: "", event: "message", data: "" };
+      const dataLines: string[] = [];
+      for (const line of block.split("\n")) {
+        if (!line || line.startsWith(":")) continue;
+        const idx = line.indexOf(":");
+        const field = idx === -1 ? line : line.slice(0, idx);
+        const val = idx === -1 ? "" : line.slice(idx + 1).replace(/^ /, "");
+        if (field === "id") ev.id = val;
+        else if (field === "event") ev.event = val;
+        else if (field === "data") dataLines.push(val);
+      }
+      if (dataLines.length) {
+        ev.data = dataLines.join("\n");
+        onEvent(ev);
+      }
+    }
+  }
+}
+
 export function useLingxun() {
   const [name, setName] = useState("");
   const [gender, setGender] = useState("");
@@ -139,62 +180,65 @@ export function useLingxun() {
     setResult("");
     saveHistory(payload);
 
-    try {
-      console.log("[handleAnalysis] 开始请求");
-
-      const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      });
-
-      console.log("[handleAnalysis] 收到响应头, 状态:", response.status);
-
-      if (!response.ok) {
-        throw new Error(`HTTP ${response.status}`);
-      }
-
-      const reader = response.body?.getReader();
-      if (!reader) {
-        throw new Error("无法获取reader");
-      }
-
-      const decoder = new TextDecoder();
-      let fullText = "";
-      let chunkCount = 0;
-      let firstChunk = true;  // ✅ 关键：标记是否收到第一个chunk
+    let fullText = "";
+    let streamId = "";
+    let lastEventId = "";
+    let finished = false;
+    let firstChunk = true;
 
-      console.log("[handleAnalysis] 开始读取 chunks");
-
-      while (true) {
-        const { done, value } = await reader.read();
-
-        if (done) {
-          console.log(`[handleAnalysis] ✅ 完成! 共 ${chunkCount} chunks`);
-          break;
+    // 服务端已按大小/时间窗口合并增量，每个 delta 事件渲染一次即可
+    const onEvent = (ev: SseEvent) => {
+      if (ev.id) lastEventId = ev.id;
+      const data = JSON.parse(ev.data);
+      if (ev.event === "start") {
+        streamId = data.stream_id;
+      } else if (ev.event === "delta") {
+        fullText += data.text;
+        setResult(fullText);
+        if (firstChunk) {
+          firstChunk = false;
+          setIsLoading(false);
         }
+      } else if (ev.event === "done") {
+        finished = true;
+      } else if (ev.event === "error") {
+        finished = true;
+        throw new Error(data.message);
+      }
+    };
 
-        if (value) {
-          const chunk = decoder.decode(value, { stream: true });
-          chunkCount++;
-
-          console.log(`[handleAnalysis] chunk ${chunkCount}: ${chunk.substring(0, 50)}`);
+    try {
+      console.log("[handleAnalysis] 开始请求");
 
-          fullText += chunk;
+      let attempt = 0;
+      while (!finished) {
+        try {
+          const response = streamId
+            ? await fetch(`${API_BASE_URL}/analyze/stream/${streamId}`, {
+                headers: { Accept: "text/event-stream", "Last-Event-ID": lastEventId },
+              })
+            : await fetch(`${API_BASE_URL}/analyze/stream`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+                body: JSON.stringify(payload),
+              });
 
-          // ✅ 使用 flushSync 强制同步更新，确保每个chunk都立即渲染
-          flushSync(() => {
-            setResult(fullText);
-          });
+          if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+          }
 
-          // ✅ 关键：收到第一个 chunk 时立即关闭加载状态
-          if (firstChunk) {
-            firstChunk = false;
-            flushSync(() => {
-              setIsLoading(false);
-            });
-            console.log("[handleAnalysis] 🎉 收到第一个chunk，取消加载状态");
+          await readSse(response, onEvent);
+          if (!finished) {
+            throw new Error("连接中断");
+          }
+        } catch (err) {
+          // 已拿到流 ID 时断线可续传，否则直接失败
+          if (finished || !streamId || attempt >= MAX_RESUME_ATTEMPTS) {
+            throw err;
           }
+          attempt++;
+          console.warn(`[handleAnalysis] 连接中断，第 ${attempt} 次续传`, err);
+          await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
         }
       }
 
@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.tracing import traced
+
+
+class ChatStore:
+    """
+    多轮对话库：SQLite
+    - 表：chat_sessions
+        id              TEXT PRIMARY KEY
+        owner           TEXT NOT NULL          -- JSON，UserInput
+        context         TEXT NOT NULL          -- JSON，会话创建时排好的 BaziContext
+        prompt          TEXT NOT NULL          -- 由 context 渲染的排盘提示词，同一周内不变（稳定前缀）
+        week            TEXT DEFAULT ''        -- context 所属周的周一（YYYY-MM-DD），换周后重新排盘渲染
+        summary         TEXT DEFAULT ''        -- 已压缩部分的滚动摘要
+        summarized_upto INTEGER DEFAULT 0      -- 摘要已覆盖到的消息序号
+        created_at      REAL NOT NULL
+        updated_at      REAL NOT NULL
+    - 表：chat_messages（只追加）
+        session_id      TEXT NOT NULL
+        seq             INTEGER NOT NULL       -- 从 1 开始
+        role            TEXT NOT NULL          -- human / ai
+        content         TEXT NOT NULL
+      PRIMARY KEY (session_id, seq)
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.db_path = db_path or os.path.join(project_root, "db", "chat.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                context TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                week TEXT DEFAULT '',
+                summary TEXT DEFAULT '',
+                summarized_upto INTEGER DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # 早期版本的库没有 week 列
+        columns = {row["name"] for row in cur.execute("PRAGMA table_info(chat_sessions)")}
+        if "week" not in columns:
+            cur.execute("ALTER TABLE chat_sessions ADD COLUMN week TEXT DEFAULT ''")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            )
+            """
+        )
+        self.conn.commit()
+
+    @traced("db.chat.create_session")
+    def create_session(
+            self, session_id: str, owner: Dict[str, Any], context: Dict[str, Any], prompt: str, week: str,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT INTO chat_sessions (id, owner, context, prompt, week, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    session_id, json.dumps(owner, ensure_ascii=False), json.dumps(context, ensure_ascii=False),
+                    prompt, week, now, now,
+                ),
+            )
+            self.conn.commit()
+
+    def update_context(self, session_id: str, context: Dict[str, Any], prompt: str, week: str) -> None:
+        """换周后替换会话的排盘信息与提示词（摘要与对话记录保留）"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE chat_sessions SET context=?, prompt=?, week=?, updated_at=? WHERE id=?",
+                (json.dumps(context, ensure_ascii=False), prompt, week, time.time(), session_id),
+            )
+            self.conn.commit()
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                """
+                SELECT id, owner, context, prompt, week, summary, summarized_upto, created_at, updated_at
+                FROM chat_sessions WHERE id=?
+                """,
+                (session_id,),
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        session = dict(row)
+        session["owner"] = json.loads(session["owner"])
+        session["context"] = json.loads(session["context"])
+        return session
+
+    @traced("db.chat.messages")
+    def messages(self, session_id: str, after: int = 0) -> List[Tuple[int, str, str]]:
+        """seq > after 的消息 [(seq, role, content)]"""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT seq, role, content FROM chat_messages WHERE session_id=? AND seq>? ORDER BY seq",
+                (session_id, after),
+            )
+            rows = cur.fetchall()
+        return [(int(row["seq"]), row["role"], row["content"]) for row in rows]
+
+    @traced("db.chat.append")
+    def append(self, session_id: str, messages: List[Tuple[str, str]]) -> None:
+        """追加一轮对话 [(role, content)]，序号接在已有消息之后"""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("SELECT COALESCE(MAX(seq), 0) FROM chat_messages WHERE session_id=?", (session_id,))
+            last = cur.fetchone()[0]
+            cur.executemany(
+                "INSERT INTO chat_messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, last + i, role, content) for i, (role, content) in enumerate(messages, 1)],
+            )
+            cur.execute("UPDATE chat_sessions SET updated_at=? WHERE id=?", (time.time(), session_id))
+            self.conn.commit()
+
+    def update_summary(self, session_id: str, summary: str, summarized_upto: int) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE chat_sessions SET summary=?, summarized_upto=?, updated_at=? WHERE id=?",
+                (summary, summarized_upto, time.time(), session_id),
+            )
+            self.conn.commit()
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM chat_sessions WHERE id=?", (session_id,))
+            self.conn.execute("DELETE FROM chat_messages WHERE session_id=?", (session_id,))
+            self.conn.commit()
+        return cur.rowcount > 0
+
+
+# 模块级单例
+chat_store = ChatStore()
@@ -2,6 +2,9 @@ import os
 import sqlite3
 from typing import Optional, Dict, Any
 
+from utils.tracing import traced
+
+
 class DBManager:
     """
     评分库管理：SQLite
@@ -46,6 +49,7 @@ class DBManager:
         )
         self.conn.commit()
 
+    @traced("db.get_score")
     def get_score(self, dimension: str, key: str) -> Optional[Dict[str, Any]]:
         cur = self.conn.cursor()
         cur.execute(
@@ -64,6 +68,7 @@ class DBManager:
             "updated_at": row["updated_at"],
         }
 
+    @traced("db.upsert_score")
     def upsert_score(self, dimension: str, key: str, scores: Dict[str, int], source: str = "model") -> None:
         cur = self.conn.cursor()
         cur.execute(
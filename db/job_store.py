@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, List
+
+from utils.tracing import traced
+
+
+class JobStore:
+    """
+    后台任务队列库：SQLite
+    - 表：jobs
+        id           TEXT PRIMARY KEY
+        kind         TEXT NOT NULL          -- 任务类型（analyze / predict_fortune ...）
+        payload      TEXT NOT NULL          -- JSON 入参
+        priority     INTEGER NOT NULL       -- 越小越优先
+        status       TEXT NOT NULL          -- queued / running / done / dead
+        attempts     INTEGER NOT NULL       -- 已执行次数
+        max_attempts INTEGER NOT NULL
+        run_after    REAL NOT NULL          -- 最早可执行时间（epoch 秒），用于重试退避
+        lease_until  REAL                   -- 执行租约到期时间，过期视为执行方已退出
+        result       TEXT                   -- JSON 结果
+        error        TEXT                   -- 最近一次错误
+        created_at   REAL NOT NULL
+        updated_at   REAL NOT NULL
+    - 认领使用 BEGIN IMMEDIATE 事务，多进程共享同一个库文件时也不会重复认领
+    - 续期与结算按 (status='running', attempts) 校验：租约过期后被重新认领的任务，原执行方不能再覆盖其结果
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.db_path = db_path or os.path.join(project_root, "db", "jobs.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self._lock:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 5,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 3,
+                    run_after REAL NOT NULL,
+                    lease_until REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, run_after, created_at)"
+            )
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    @traced("db.jobs.submit")
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 5, max_attempts: int = 3) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT INTO jobs (id, kind, payload, priority, status, attempts, max_attempts, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)
+                """,
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), priority, max_attempts, now, now, now),
+            )
+        return job_id
+
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """认领一个可执行的任务（优先级最高、最早提交），并标记为 running"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE (status='queued' AND run_after<=?) OR (status='running' AND lease_until<?)
+                    ORDER BY priority, run_after, created_at
+                    LIMIT 1
+                    """,
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status='running', attempts=attempts+1, lease_until=?, updated_at=? WHERE id=?",
+                    (now + lease_seconds, now, row["id"]),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        job = self._row(row)
+        job["attempts"] += 1
+        job["status"] = "running"
+        return job
+
+    def renew(self, job_id: str, attempts: int, lease_seconds: float) -> bool:
+        """续期执行租约；任务已被重新认领或已结束时返回 False"""
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE jobs SET lease_until=?, updated_at=? WHERE id=? AND status='running' AND attempts=?",
+                (now + lease_seconds, now, job_id, attempts),
+            )
+        return cur.rowcount > 0
+
+    @traced("db.jobs.complete")
+    def complete(self, job_id: str, attempts: int, result: Any) -> bool:
+        """
+        第 attempts 次执行成功；任务已被重新认领或已结束时不写入，返回 False
+        result 无法序列化为 JSON 时抛出 TypeError / ValueError
+        """
+        data = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            cur = self.conn.execute(
+                """
+                UPDATE jobs SET status='done', result=?, error=NULL, lease_until=NULL, updated_at=?
+                WHERE id=? AND status='running' AND attempts=?
+                """,
+                (data, time.time(), job_id, attempts),
+            )
+        return cur.rowcount > 0
+
+    @traced("db.jobs.fail")
+    def fail(self, job_id: str, attempts: int, error: str, retry_at: Optional[float]) -> bool:
+        """第 attempts 次执行失败：retry_at 不为空时重新排队，否则进入死信（dead）；校验同 complete"""
+        with self._lock:
+            if retry_at is None:
+                cur = self.conn.execute(
+                    """
+                    UPDATE jobs SET status='dead', error=?, lease_until=NULL, updated_at=?
+                    WHERE id=? AND status='running' AND attempts=?
+                    """,
+                    (error, time.time(), job_id, attempts),
+                )
+            else:
+                cur = self.conn.execute(
+                    """
+                    UPDATE jobs SET status='queued', error=?, run_after=?, lease_until=NULL, updated_at=?
+                    WHERE id=? AND status='running' AND attempts=?
+                    """,
+                    (error, retry_at, time.time(), job_id, attempts),
+                )
+        return cur.rowcount > 0
+
+    def requeue(self, job_id: str) -> bool:
+        """把死信任务重新排队（重置执行次数），返回是否成功"""
+        now = time.time()
+        with self._lock:
+            cur = self.conn.execute(
+                """
+                UPDATE jobs SET status='queued', attempts=0, run_after=?, lease_until=NULL, updated_at=?
+                WHERE id=? AND status='dead'
+                """,
+                (now, now, job_id),
+            )
+        return cur.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            if status:
+                rows = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status=? ORDER BY updated_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = self.conn.execute("SELECT * FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: int(row["n"]) for row in rows}
+
+
+# 模块级单例
+job_store = JobStore()
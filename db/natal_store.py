@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from utils.tracing import traced
+
+
+class NatalStore:
+    """
+    命盘解读缓存库：SQLite
+    - 表：natal_analyses
+        chart_key   TEXT PRIMARY KEY       -- 命盘指纹（四柱、大运、性别等 + 解读提示词版本）
+        summary     TEXT NOT NULL          -- 命盘摘要（LLM 输出）
+        model       TEXT                   -- 生成所用 provider:model
+        hits        INTEGER DEFAULT 0      -- 命中次数
+        created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        used_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    命盘不随时间变化，条目不过期；解读提示词修改后指纹随之变化，旧条目不再命中
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.db_path = db_path or os.path.join(project_root, "db", "natal.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS natal_analyses (
+                chart_key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                model TEXT,
+                hits INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        self.conn.commit()
+
+    @traced("db.natal.get")
+    def get(self, chart_key: str) -> Optional[str]:
+        """读取命盘摘要，命中时累计命中次数"""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("SELECT summary FROM natal_analyses WHERE chart_key=?", (chart_key,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            cur.execute(
+                "UPDATE natal_analyses SET hits=hits+1, used_at=CURRENT_TIMESTAMP WHERE chart_key=?",
+                (chart_key,),
+            )
+            self.conn.commit()
+        return row["summary"]
+
+    @traced("db.natal.put")
+    def put(self, chart_key: str, summary: str, model: Optional[str] = None) -> None:
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT INTO natal_analyses (chart_key, summary, model) VALUES (?, ?, ?)
+                ON CONFLICT(chart_key) DO UPDATE SET
+                    summary=excluded.summary, model=excluded.model, used_at=CURRENT_TIMESTAMP
+                """,
+                (chart_key, summary, model),
+            )
+            self.conn.commit()
+
+    def delete(self, chart_key: str) -> bool:
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM natal_analyses WHERE chart_key=?", (chart_key,))
+            self.conn.commit()
+        return cur.rowcount > 0
+
+
+# 模块级单例
+natal_store = NatalStore()
@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from utils.tracing import traced
+
+
+class PrefetchStore:
+    """
+    周报预生成库：SQLite
+    - 表：owner_activity（最近请求过周报的命主）
+        owner_key   TEXT PRIMARY KEY       -- 命主信息指纹
+        payload     TEXT NOT NULL          -- JSON，UserInput
+        requests    INTEGER DEFAULT 0      -- 请求次数
+        last_seen   REAL NOT NULL          -- 最近一次请求（epoch 秒）
+    - 表：prefetched_reports（预生成的周报）
+        request_key TEXT PRIMARY KEY       -- 与 /analyze/stream 相同的请求指纹（含本周日历，换周即失效）
+        week        TEXT NOT NULL          -- 所属周的周一（YYYY-MM-DD）
+        owner_key   TEXT NOT NULL
+        report      TEXT NOT NULL
+        served      INTEGER DEFAULT 0      -- 被读取次数
+        created_at  REAL NOT NULL
+    - 表：prefetch_runs（每周只调度一次）
+        week        TEXT PRIMARY KEY
+        scheduled   INTEGER NOT NULL       -- 提交的预生成任务数
+        created_at  REAL NOT NULL
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.db_path = db_path or os.path.join(project_root, "db", "prefetch.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS owner_activity (
+                owner_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                requests INTEGER DEFAULT 0,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_owner_activity_seen ON owner_activity (last_seen)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prefetched_reports (
+                request_key TEXT PRIMARY KEY,
+                week TEXT NOT NULL,
+                owner_key TEXT NOT NULL,
+                report TEXT NOT NULL,
+                served INTEGER DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_prefetched_week ON prefetched_reports (week)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prefetch_runs (
+                week TEXT PRIMARY KEY,
+                scheduled INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def touch(self, owner_key: str, payload: Dict[str, Any]) -> None:
+        """记录一次周报请求"""
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT INTO owner_activity (owner_key, payload, requests, last_seen) VALUES (?, ?, 1, ?)
+                ON CONFLICT(owner_key) DO UPDATE SET
+                    payload=excluded.payload, requests=requests+1, last_seen=excluded.last_seen
+                """,
+                (owner_key, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            self.conn.commit()
+
+    @traced("db.prefetch.active_owners")
+    def active_owners(self, since: float, limit: int) -> List[Dict[str, Any]]:
+        """since 之后请求过的命主，最近活跃的在前"""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT owner_key, payload FROM owner_activity WHERE last_seen>=? ORDER BY last_seen DESC LIMIT ?",
+                (since, limit),
+            )
+            rows = cur.fetchall()
+        return [{"owner_key": row["owner_key"], "payload": json.loads(row["payload"])} for row in rows]
+
+    def purge_inactive(self, before: float) -> int:
+        """删除 before 之前最后一次请求的命主记录（不再参与预生成，也不长期保留其出生信息）"""
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM owner_activity WHERE last_seen<?", (before,))
+            self.conn.commit()
+        return cur.rowcount
+
+    @traced("db.prefetch.get_report")
+    def get_report(self, request_key: str) -> Optional[str]:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("SELECT report FROM prefetched_reports WHERE request_key=?", (request_key,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            cur.execute("UPDATE prefetched_reports SET served=served+1 WHERE request_key=?", (request_key,))
+            self.conn.commit()
+        return row["report"]
+
+    def has_report(self, request_key: str) -> bool:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("SELECT 1 FROM prefetched_reports WHERE request_key=?", (request_key,))
+            return cur.fetchone() is not None
+
+    def put_report(self, request_key: str, week: str, owner_key: str, report: str) -> None:
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO prefetched_reports (request_key, week, owner_key, report, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (request_key, week, owner_key, report, time.time()),
+            )
+            self.conn.commit()
+
+    def claim_run(self, week: str) -> bool:
+        """登记本周的调度；已登记过返回 False（多进程共享库文件时也只调度一次）"""
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO prefetch_runs (week, scheduled, created_at) VALUES (?, 0, ?)",
+                (week, time.time()),
+            )
+            self.conn.commit()
+        return cur.rowcount > 0
+
+    def release_run(self, week: str) -> None:
+        """撤销本周的调度登记（调度中途失败时），下次检查时重新调度"""
+        with self._lock:
+            self.conn.execute("DELETE FROM prefetch_runs WHERE week=?", (week,))
+            self.conn.commit()
+
+    def finish_run(self, week: str, scheduled: int) -> None:
+        with self._lock:
+            self.conn.execute("UPDATE prefetch_runs SET scheduled=? WHERE week=?", (scheduled, week))
+            self.conn.commit()
+
+    def purge_before(self, week: str) -> int:
+        """删除 week 之前各周的预生成周报"""
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM prefetched_reports WHERE week<?", (week,))
+            self.conn.commit()
+        return cur.rowcount
+
+    def stats(self, week: str) -> Dict[str, Any]:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT COUNT(*) AS reports, COALESCE(SUM(served > 0), 0) AS served FROM prefetched_reports WHERE week=?",
+                (week,),
+            )
+            row = dict(cur.fetchone())
+            cur.execute("SELECT scheduled FROM prefetch_runs WHERE week=?", (week,))
+            run = cur.fetchone()
+        row["scheduled"] = run["scheduled"] if run else None
+        return row
+
+
+# 模块级单例
+prefetch_store = PrefetchStore()
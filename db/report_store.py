@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.tracing import traced
+
+
+class ReportStore:
+    """
+    报告生成任务库：SQLite（只追加写入事件）
+    - 表：report_jobs
+        id          TEXT PRIMARY KEY       -- 任务 ID（即流 ID）
+        request_key TEXT NOT NULL          -- 请求指纹，相同请求合并到同一任务
+        status      TEXT NOT NULL          -- running / done / error
+        chars       INTEGER                -- 已输出字符数
+        error       TEXT
+        created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    - 表：report_events
+        job_id      TEXT NOT NULL
+        seq         INTEGER NOT NULL       -- 事件序号，从 1 开始
+        event       TEXT NOT NULL          -- start / delta / done / error
+        data        TEXT NOT NULL          -- JSON
+      PRIMARY KEY (job_id, seq)
+    进程重启时仍为 running 的任务已无人生成，启动时标记为 error（interrupted）
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.db_path = db_path or os.path.join(project_root, "db", "reports.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        cur = self.conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id TEXT PRIMARY KEY,
+                request_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chars INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_key ON report_jobs (request_key, status)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+            """
+        )
+        cur.execute(
+            """
+            UPDATE report_jobs SET status='error', error='interrupted', updated_at=CURRENT_TIMESTAMP
+            WHERE status='running'
+            """
+        )
+        self.conn.commit()
+
+    @traced("db.report.create_job")
+    def create_job(self, job_id: str, request_key: str) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO report_jobs (id, request_key, status) VALUES (?, ?, 'running')",
+                (job_id, request_key),
+            )
+            self.conn.commit()
+
+    def append_events(self, job_id: str, events: List[Tuple[int, str, dict]]) -> None:
+        """追加事件（已存在的序号忽略，便于重试）"""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO report_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                [(job_id, seq, event, json.dumps(data, ensure_ascii=False)) for seq, event, data in events],
+            )
+            self.conn.commit()
+
+    @traced("db.report.finish_job")
+    def finish_job(self, job_id: str, status: str, chars: int, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE report_jobs SET status=?, chars=?, error=?, updated_at=CURRENT_TIMESTAMP WHERE id=?",
+                (status, chars, error, job_id),
+            )
+            self.conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT id, request_key, status, chars, error, created_at, updated_at FROM report_jobs WHERE id=?",
+                (job_id,),
+            )
+            row = cur.fetchone()
+        return dict(row) if row else None
+
+    @traced("db.report.events")
+    def get_events(self, job_id: str, after: int = 0) -> List[Tuple[int, str, dict]]:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(
+                "SELECT seq, event, data FROM report_events WHERE job_id=? AND seq>? ORDER BY seq",
+                (job_id, after),
+            )
+            rows = cur.fetchall()
+        return [(int(row["seq"]), row["event"], json.loads(row["data"])) for row in rows]
+
+
+# 模块级单例
+report_store = ReportStore()
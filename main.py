@@ -1,33 +1,56 @@
 import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from schemas import UserInput
 from prompt.context_builder import BaziContextBuilder
 from agents.weekly_fortune_agent import WeeklyFortuneAgent
 from pydantic import BaseModel
 from agents.fortune_score_agent import FortuneScoreAgent
-from services.get_fortune_score import get_fortune_score, OwnerConfigNotFound
-from utils.settings_manager import load_settings, save_settings
+from services.get_fortune_score import get_fortune_score, score_range_local, OwnerConfigNotFound
+from utils.settings_manager import load_settings, update_settings as update_settings_file
+from utils.llm_health import snapshot_all as llm_health_snapshot
+from utils.rate_limiter import snapshot_all as rate_limit_snapshot
+from utils.metrics import render_prometheus, start_request_usage
+from utils import tracing
+from utils.log_pipeline import StreamLog, setup_logging
+from services.stream_hub import hub as stream_hub, parse_event_id, request_key
+from services.job_queue import DEFAULT_PRIORITY, UnknownJobKind, job_queue
+from services.bazi_batch import MAX_BATCH_ITEMS, iter_ndjson
+from services.day_search import search_auspicious_days
+from services.prefetch import PREFETCH_CALLER, PREFETCH_KIND, prefetcher, week_of
+from services.chat_service import ChatSessionNotFound, chat_service
+from services.calendar_service import calendar_columns, iter_calendar_ndjson, parse_range as parse_calendar_range
+from utils.bazi_reverse import MAX_YEAR as REVERSE_MAX_YEAR, MIN_YEAR as REVERSE_MIN_YEAR, find_birth_times
+from utils.bazi_chart import normalize_parts
 import logging
 import time
+from datetime import date
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("app.log")
-    ]
-)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    job_queue.start()
+    prefetcher.start()
+    yield
+    prefetcher.stop()
+    job_queue.stop()
+
+
 app = FastAPI(
     title="周运势分析API",
     description="提供运势排盘和运势分析功能",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -38,6 +61,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def llm_usage_middleware(request: Request, call_next):
+    """
+    为每个请求创建 LLM 用量累加器；设置 LLM_USAGE_HEADER=true 或请求头 X-LLM-Usage: 1 时，
+    在响应头 X-LLM-Usage 中返回本次请求的用量（流式响应在返回头时尚未调用模型，不附带）
+    """
+    usage = start_request_usage()
+    response = await call_next(request)
+    wanted = request.headers.get("X-LLM-Usage") == "1" or os.getenv("LLM_USAGE_HEADER", "false").lower() == "true"
+    if wanted and response.headers.get("content-type", "").startswith("application/json"):
+        response.headers["X-LLM-Usage"] = usage.header_value()
+    return response
+
+
+@app.middleware("http")
+async def request_trace_middleware(request: Request, call_next):
+    """
+    请求 ID 与链路追踪：沿用请求头 X-Request-ID（32 位十六进制）或新生成，作为 trace ID 写回响应头；
+    追踪启用时以整个请求为根 span（流式响应只覆盖到返回响应头，流式 LLM 调用作为其子 span 单独计时）
+    """
+    request_id = tracing.start_request(request.headers.get("X-Request-ID"))
+    with tracing.span(
+            f"{request.method} {request.url.path}",
+            kind=tracing.SPAN_KIND_SERVER,
+            **{"http.method": request.method, "http.route": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        if span is not None:
+            span.set("http.status_code", response.status_code)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 agent = WeeklyFortuneAgent()
 context_builder = BaziContextBuilder()
 fortune_agent = FortuneScoreAgent()
@@ -53,70 +110,249 @@ class FortunePredictInput(UserInput):
 
 
 @app.post("/analyze")
-async def analyze_bazi(request: UserInput):
-    """运势分析接口 - 同步方式"""
+async def analyze_bazi(request: UserInput, mode: str | None = None, sections: bool = False):
+    """
+    运势分析接口 - 同步方式；?mode=async 时提交到后台任务队列，立即返回任务 ID
+    ?sections=true 时报告分段并发生成后按顺序拼接（分段并发依赖事件循环，不支持与 ?mode=async 同时使用）
+    """
     try:
-        loop = asyncio.get_event_loop()
-        context = await loop.run_in_executor(None, context_builder.build_context, request)
-        analysis_text = await loop.run_in_executor(None, agent.generate_report, context)
+        if mode == "async":
+            if sections:
+                raise ValueError("sections=true 不支持 mode=async，请使用同步或流式接口")
+            return await asyncio.to_thread(_submit_job, "analyze", request.model_dump())
+        await asyncio.to_thread(prefetcher.record_activity, request.model_dump())
+        context = await asyncio.to_thread(context_builder.build_context, request)
+        prefetched = await asyncio.to_thread(prefetcher.lookup, context)
+        if prefetched is not None:
+            analysis_text = prefetched
+        elif sections:
+            analysis_text = "".join([chunk async for chunk in agent.astream_sectioned_report(context, caller="analyze")])
+        else:
+            analysis_text = await asyncio.to_thread(agent.generate_report, context)
         return {"result": analysis_text}
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
     except Exception as e:
         logger.error(f"[/analyze] 错误: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
 @app.post("/predict_fortune")
-async def predict_fortune(request: FortunePredictInput):
+async def predict_fortune(request: FortunePredictInput, mode: str | None = None):
     try:
-        loop = asyncio.get_event_loop()
+        if mode == "async":
+            # 打分任务输出短、耗时少，优先于整篇报告
+            return await asyncio.to_thread(_submit_job, "predict_fortune", request.model_dump(), DEFAULT_PRIORITY - 2)
         base_user = UserInput(**request.model_dump(exclude={"dimension"}))
-        context = await loop.run_in_executor(None, context_builder.build_context, base_user)
-        result = await loop.run_in_executor(
-            None,
-            lambda: fortune_agent.predict_scores(context, dimension=request.dimension)
-        )
+        context = await asyncio.to_thread(context_builder.build_context, base_user)
+        result = await asyncio.to_thread(fortune_agent.predict_scores, context, dimension=request.dimension)
         return {"result": result}
     except Exception as e:
         logger.error(f"[/predict_fortune] 错误: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
-@app.post("/analyze/stream")
-async def analyze_bazi_sse(request: UserInput):
+# ---------- 后台任务队列 ----------
+
+def _analyze_job(payload: dict) -> dict:
+    context = context_builder.build_context(UserInput(**payload))
+    return {"result": agent.generate_report(context)}
+
+
+def _prefetch_report_job(payload: dict) -> dict:
+    """周报预生成（services/prefetch.py 调度），结果入库供本周首次打开时直接返回"""
+    context = context_builder.build_context(UserInput(**payload))
+    if prefetcher.has_report(context):
+        return {"skipped": True}
+    report = agent.generate_report(context, caller=PREFETCH_CALLER)
+    prefetcher.save(payload, context, report)
+    return {"chars": len(report)}
+
+
+def _predict_fortune_job(payload: dict) -> dict:
+    request = FortunePredictInput(**payload)
+    context = context_builder.build_context(UserInput(**request.model_dump(exclude={"dimension"})))
+    return {"result": fortune_agent.predict_scores(context, dimension=request.dimension)}
+
+
+# 可通过 /jobs 提交的任务类型 -> (入参模型, 处理函数)
+JOB_KINDS = {
+    "analyze": (UserInput, _analyze_job),
+    "predict_fortune": (FortunePredictInput, _predict_fortune_job),
+}
+for _kind, (_, _handler) in JOB_KINDS.items():
+    job_queue.register(_kind, _handler)
+# 周报预生成只由 services/prefetch.py 按预算调度，不对外开放提交
+job_queue.register(PREFETCH_KIND, _prefetch_report_job)
+
+
+class JobSubmitRequest(BaseModel):
+    kind: str
+    payload: dict
+    priority: int = DEFAULT_PRIORITY
+    max_attempts: int | None = None
+
+
+def _submit_job(kind: str, payload: dict, priority: int = DEFAULT_PRIORITY, max_attempts: int | None = None):
+    job_id = job_queue.submit(kind, payload, priority, max_attempts)
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+
+def _job_view(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+@app.post("/jobs")
+async def submit_job(req: JobSubmitRequest):
+    """提交后台任务（kind: analyze / predict_fortune），立即返回任务 ID"""
     try:
-        logger.info("[/analyze/stream] 请求开始")
-        start = time.time()
+        model = JOB_KINDS.get(req.kind, (None,))[0]
+        if model is None:
+            raise UnknownJobKind(f"不支持的任务类型: {req.kind}")
+        payload = model(**req.payload).model_dump()
+        return await asyncio.to_thread(_submit_job, req.kind, payload, req.priority, req.max_attempts)
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
 
-        context = context_builder.build_context(request)
 
-        async def stream_generator():
-            logger.info("[stream_generator] 开始生成")
-            stream_start = time.time()
-            chunk_count = 0
+@app.get("/jobs")
+async def list_jobs(status: str | None = None, limit: int = 50):
+    """任务列表（status=dead 即死信队列）与各状态计数"""
+    jobs = await asyncio.to_thread(job_queue.store.list, status, min(limit, 500))
+    counts = await asyncio.to_thread(job_queue.store.counts)
+    return {"counts": counts, "jobs": [_job_view(job) for job in jobs]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询任务状态"""
+    job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "JOB_NOT_FOUND"})
+    return _job_view(job)
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """获取任务结果：完成返回 200；排队或执行中返回 202；进入死信返回 500"""
+    job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "JOB_NOT_FOUND"})
+    if job["status"] == "done":
+        return job["result"]
+    if job["status"] == "dead":
+        return JSONResponse(status_code=500, content={"error": "JOB_FAILED", "message": job["error"]})
+    return JSONResponse(status_code=202, content=_job_view(job))
+
+
+@app.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    """把死信任务重新排队"""
+    if not await asyncio.to_thread(job_queue.requeue, job_id):
+        return JSONResponse(status_code=409, content={"error": "JOB_NOT_DEAD", "message": "只有死信任务可以重试"})
+    return {"job_id": job_id, "status": "queued"}
+
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def _wants_sse(http_request: Request, mode: str | None) -> bool:
+    return mode == "sse" or "text/event-stream" in http_request.headers.get("accept", "")
+
+
+def _sse_response(buf, after: int = 0) -> StreamingResponse:
+    return StreamingResponse(
+        stream_hub.subscribe(buf, after),
+        media_type="text/event-stream; charset=utf-8",
+        headers={**STREAM_HEADERS, "X-Stream-ID": buf.stream_id},
+    )
+
+
+async def _start_report_job(request: UserInput, sections: bool = False):
+    """
+    启动（或合并到）报告生成任务：生成在后台进行，与 HTTP 连接无关
+    相同命主信息、同一周的请求在生成期间合并为同一任务；sections=True 时分段并发生成、按顺序输出
+    """
+    await asyncio.to_thread(prefetcher.record_activity, request.model_dump())
+    context = await asyncio.to_thread(context_builder.build_context, request)
+    stream_log = StreamLog(logger, "report_job", request_id=tracing.get_request_id())
+    produce = agent.astream_sectioned_report if sections else agent.astream_report
+    # 本周已预生成时直接输出存储的周报
+    prefetched = await asyncio.to_thread(prefetcher.lookup, context)
+
+    async def report_chunks():
+        if prefetched is not None:
+            stream_log.chunk(prefetched)
+            yield prefetched
+            return
+        async for chunk in produce(context):
+            if chunk:
+                stream_log.chunk(chunk)
+                yield chunk
+
+    buf, joined = await stream_hub.start(
+        report_chunks,
+        key=request_key({"report": "weekly_sections" if sections else "weekly", **context.model_dump()}),
+        on_finish=stream_log.finish,
+    )
+    logger.info(f"[report_job] {'合并到已有任务' if joined else '新建任务'} {buf.stream_id}")
+    return buf, joined
 
-            try:
-                async for chunk in agent.astream_report(context):
-                    if chunk:
-                        chunk_count += 1
-                        logger.info(f"[stream_generator] chunk #{chunk_count}: {repr(chunk[:30])}")
-                        yield chunk
 
-                logger.info(f"[stream_generator] 完成！共 {chunk_count} 个 chunk，耗时 {time.time() - stream_start:.2f}s")
+@app.post("/analyze/stream")
+async def analyze_bazi_sse(request: UserInput, http_request: Request, mode: str | None = None, sections: bool = False):
+    """
+    流式运势分析（后台任务 + 跟随输出，客户端断开不会中断生成）
+    - 默认：text/plain 纯文本增量（按 256 字节 / 30ms 合并输出）
+    - SSE：?mode=sse 或 Accept: text/event-stream；断线后带 Last-Event-ID 重连可续传
+    - ?sections=true：报告分段并发生成，仍按顺序输出（后面的段先缓冲）
+    """
+    try:
+        logger.info("[/analyze/stream] 请求开始")
+        start = time.time()
+        sse = _wants_sse(http_request, mode)
 
-            except Exception as e:
-                logger.error(f"[stream_generator] 异常: {e}", exc_info=True)
-                yield f"data: [ERROR] {str(e)}\n\n"
+        if sse:
+            stream_id, after = parse_event_id(http_request.headers.get("Last-Event-ID"))
+            buf = await stream_hub.attach(stream_id)
+            if buf is not None:
+                logger.info(f"[/analyze/stream] 续传 {stream_id} 自 #{after}")
+                return _sse_response(buf, after)
 
+        buf, _ = await _start_report_job(request, sections)
         logger.info(f"[/analyze/stream] 返回响应，准备耗时: {time.time() - start:.2f}s")
 
+        if sse:
+            return _sse_response(buf)
+
+        async def stream_generator():
+            async for item in stream_hub.follow(buf):
+                if item is None:
+                    continue
+                _, event, data = item
+                if event == "delta":
+                    yield data["text"]
+                elif event == "error":
+                    yield f"data: [ERROR] {data['message']}\n\n"
+
         return StreamingResponse(
             stream_generator(),
             media_type="text/plain; charset=utf-8",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            }
+            headers={**STREAM_HEADERS, "X-Stream-ID": buf.stream_id},
         )
 
     except Exception as e:
@@ -133,6 +369,43 @@ async def analyze_bazi_sse(request: UserInput):
         )
 
 
+@app.get("/analyze/stream/{stream_id}")
+@app.get("/reports/{stream_id}/events")
+async def resume_analyze_stream(stream_id: str, http_request: Request, last_event_id: str | None = None):
+    """
+    SSE 附加到报告任务：从 Last-Event-ID（或 ?last_event_id=）之后回放并跟随，
+    任务已结束时回放完整输出；任务不存在时返回 404
+    """
+    buf = await stream_hub.attach(stream_id)
+    if buf is None:
+        return JSONResponse(status_code=404, content={"error": "REPORT_NOT_FOUND", "message": "任务不存在"})
+    event_stream_id, after = parse_event_id(http_request.headers.get("Last-Event-ID") or last_event_id)
+    return _sse_response(buf, after if event_stream_id == stream_id else 0)
+
+
+@app.post("/reports")
+async def create_report(request: UserInput, sections: bool = False):
+    """提交报告生成任务后立即返回任务 ID，之后可通过 /reports/{id} 或 /reports/{id}/events 获取结果"""
+    try:
+        buf, joined = await _start_report_job(request, sections)
+        return {"job_id": buf.stream_id, "status": buf.status, "joined": joined}
+    except Exception as e:
+        logger.error(f"[/reports] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/reports/{job_id}")
+async def get_report(job_id: str):
+    """查询报告任务状态与当前已生成的内容"""
+    buf = await stream_hub.attach(job_id)
+    if buf is None:
+        return JSONResponse(status_code=404, content={"error": "REPORT_NOT_FOUND", "message": "任务不存在"})
+    result = {"job_id": job_id, "status": buf.status, "result": buf.text()}
+    if buf.status == "error":
+        result["error"] = buf.events[-1][2].get("message")
+    return result
+
+
 class GetScoreRequest(BaseModel):
     dimension: str
     owner: dict | None = None
@@ -141,9 +414,8 @@ class GetScoreRequest(BaseModel):
 @app.post("/get_fortune_score")
 async def get_fortune_score_api(req: GetScoreRequest):
     try:
-        loop = asyncio.get_event_loop()
         # 传入 owner 数据
-        result = await loop.run_in_executor(None, get_fortune_score, req.dimension, req.owner)
+        result = await asyncio.to_thread(get_fortune_score, req.dimension, req.owner)
         return result
     except OwnerConfigNotFound:
         return JSONResponse(
@@ -157,26 +429,230 @@ async def get_fortune_score_api(req: GetScoreRequest):
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+class LocalScoreRangeRequest(BaseModel):
+    owner: dict
+    start: str
+    end: str
+
+
+@app.post("/fortune_score/local")
+async def fortune_score_local(req: LocalScoreRangeRequest):
+    """日期区间逐日本地规则打分（不调用 LLM，不入库），用于历史区间批量打分"""
+    try:
+        items = await asyncio.to_thread(score_range_local, req.owner, req.start, req.end)
+        return {"dimension": "流日", "source": "local", "items": items}
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    except Exception as e:
+        logger.error(f"[/fortune_score/local] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+class AuspiciousDaysRequest(BaseModel):
+    owner: dict
+    start: str
+    end: str
+    avoid_clash: bool = True
+    elements: list[str] | None = None
+    ten_gods: list[str] | None = None
+    rank_by: str = "total"
+    limit: int = 10
+
+
+@app.post("/auspicious_days")
+async def auspicious_days(req: AuspiciousDaysRequest):
+    """
+    择日：在 [start, end] 内按规则（避冲、喜用五行、十神）筛选，按本地规则分排序返回前 limit 天
+    elements 为空时使用命局喜用五行，传 [] 表示不限五行
+    """
+    try:
+        return await asyncio.to_thread(
+            search_auspicious_days, req.owner, req.start, req.end,
+            **req.model_dump(exclude={"owner", "start", "end"}),
+        )
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    except Exception as e:
+        logger.error(f"[/auspicious_days] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/calendar")
+async def calendar(start: str | None = None, end: str | None = None, format: str = "columns"):
+    """
+    干支日历：[start, end]（YYYY-MM-DD，默认本周一起两周）逐日的日柱、月柱、年柱、农历与节气
+    format=columns 返回列式数据（整数列 + 名称表），format=ndjson 逐日流式返回
+    """
+    if format not in ("columns", "ndjson"):
+        return JSONResponse(status_code=400, content={"error": "format 可选: columns, ndjson"})
+    try:
+        start_date, end_date = parse_calendar_range(start, end)
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    if format == "ndjson":
+        return StreamingResponse(
+            iter_calendar_ndjson(start_date, end_date),
+            media_type="application/x-ndjson; charset=utf-8",
+            headers={"X-Accel-Buffering": "no"},
+        )
+    try:
+        return await asyncio.to_thread(calendar_columns, start_date, end_date)
+    except Exception as e:
+        logger.error(f"[/calendar] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
 @app.post("/calc_bazi")
-async def calc_bazi(req: UserInput):
+async def calc_bazi(req: UserInput, parts: str = "pillars"):
+    """
+    排盘：parts 为逗号分隔的部分（pillars / lunar / luck / relations / liunian），默认只排四柱
+    只计算请求的部分，不生成日历与提示词上下文
+    """
     try:
-        loop = asyncio.get_event_loop()
-        ctx = await loop.run_in_executor(None, context_builder.build_context, req)
-        parts = (ctx.bazi or "").split()
-        if len(parts) == 4:
-            return {
-                "bazi": ctx.bazi,
-                "year": parts[0],
-                "month": parts[1],
-                "day": parts[2],
-                "hour": parts[3],
-            }
-        return {"bazi": ctx.bazi}
+        wanted = normalize_parts(parts.split(","))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    try:
+        return await asyncio.to_thread(context_builder.build_chart, req, wanted)
     except Exception as e:
         logger.error(f"[/calc_bazi] 错误: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+@app.get("/calc_bazi/reverse")
+async def calc_bazi_reverse(bazi: str, start_year: int = REVERSE_MIN_YEAR, end_year: int = REVERSE_MAX_YEAR):
+    """四柱反查：返回年份区间内所有排出该四柱的出生时间窗口（真太阳时，左闭右开）"""
+    try:
+        windows = await asyncio.to_thread(find_birth_times, bazi, start_year, end_year)
+        return {"bazi": bazi, "count": len(windows), "windows": windows}
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    except Exception as e:
+        logger.error(f"[/calc_bazi/reverse] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+class CalcBaziBatchRequest(BaseModel):
+    items: list[Any]
+
+
+@app.post("/calc_bazi/batch")
+async def calc_bazi_batch(req: CalcBaziBatchRequest, parts: str = "pillars,luck"):
+    """
+    批量排盘：items 为 UserInput 列表，parts 同 /calc_bazi（默认四柱与大运）
+    以 NDJSON 按输入顺序逐行返回，每行带 index；单条失败返回 ok=false 与 error，不影响其他条目
+    """
+    if len(req.items) > MAX_BATCH_ITEMS:
+        return JSONResponse(status_code=400, content={"error": f"单次最多 {MAX_BATCH_ITEMS} 条"})
+    try:
+        wanted = normalize_parts(parts.split(","))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return StreamingResponse(
+        iter_ndjson(req.items, wanted),
+        media_type="application/x-ndjson; charset=utf-8",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+# ---------- 多轮对话 ----------
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: str | None = None
+    owner: UserInput | None = None
+
+
+def _chat_not_found(session_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"error": "CHAT_SESSION_NOT_FOUND", "message": f"会话不存在: {session_id}"})
+
+
+@app.post("/chat/sessions")
+async def create_chat_session(request: UserInput):
+    """创建对话会话：排盘一次并保存，之后每轮对话复用"""
+    try:
+        session_id = await asyncio.to_thread(chat_service.create_session, request)
+        return {"session_id": session_id}
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    except Exception as e:
+        logger.error(f"[/chat/sessions] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.post("/chat")
+async def chat(req: ChatRequest):
+    """
+    多轮对话（text/plain 流式输出）：传 session_id 继续已有会话；不传时需传 owner，自动创建会话
+    会话 ID 见响应头 X-Chat-Session；生成中途出错时输出 [ERROR] 行，该轮不计入会话记录
+    """
+    try:
+        session_id = req.session_id
+        if session_id is None:
+            if req.owner is None:
+                return JSONResponse(status_code=400, content={"error": "session_id 与 owner 至少传一个"})
+            chat_service.check_message(req.message)
+            session_id = await asyncio.to_thread(chat_service.create_session, req.owner)
+        await asyncio.to_thread(chat_service.check, session_id, req.message)
+    except ChatSessionNotFound:
+        return _chat_not_found(req.session_id)
+    except ValueError as ve:
+        return JSONResponse(status_code=400, content={"error": str(ve)})
+    except Exception as e:
+        logger.error(f"[/chat] 错误: {e}", exc_info=True)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    async def reply_generator():
+        try:
+            async for chunk in chat_service.stream_reply(session_id, req.message):
+                yield chunk
+        except Exception as e:
+            logger.error(f"[/chat] 会话 {session_id} 生成失败: {e}", exc_info=True)
+            yield f"data: [ERROR] {e}\n\n"
+
+    return StreamingResponse(
+        reply_generator(),
+        media_type="text/plain; charset=utf-8",
+        headers={**STREAM_HEADERS, "X-Chat-Session": session_id},
+    )
+
+
+@app.get("/chat/{session_id}")
+async def chat_history(session_id: str):
+    """会话记录：滚动摘要与全部消息"""
+    try:
+        return await asyncio.to_thread(chat_service.history, session_id)
+    except ChatSessionNotFound:
+        return _chat_not_found(session_id)
+
+
+@app.delete("/chat/{session_id}")
+async def delete_chat_session(session_id: str):
+    if not await asyncio.to_thread(chat_service.store.delete_session, session_id):
+        return _chat_not_found(session_id)
+    return {"deleted": True}
+
+
+@app.get("/prefetch")
+async def prefetch_stats():
+    """周报预生成：配置与本周的预生成 / 命中情况"""
+    week = week_of(date.today())
+    stats = await asyncio.to_thread(prefetcher.store.stats, week) if prefetcher.enabled else None
+    return {"enabled": prefetcher.enabled, "budget": prefetcher.budget, "week": week, "stats": stats}
+
+
+@app.get("/llm/health")
+async def llm_health():
+    """各 LLM 线路的健康度（延迟/错误率 EWMA、p95）与限流状态"""
+    return {"routes": llm_health_snapshot(), "rate_limits": rate_limit_snapshot()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """LLM 调用指标（Prometheus 文本格式）：调用次数、token 用量、首 token 延迟、总延迟、重试次数"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/settings")
 async def get_settings():
     """获取系统配置（API keys 等）"""
@@ -201,19 +677,20 @@ async def update_settings(data: dict):
     """更新系统配置"""
     try:
         loop = asyncio.get_event_loop()
-        # 读取现有配置
-        settings = await loop.run_in_executor(None, load_settings)
-
-        # 更新配置
+        # 只写入请求中给出的字段；未给出的（如 llm_provider）保持配置文件原样，不写入默认值
+        changes = {}
         if "gemini_api_key" in data:
-            settings["gemini_api_key"] = data["gemini_api_key"]
+            changes["gemini_api_key"] = data["gemini_api_key"]
         if "deepseek_api_key" in data:
-            settings["deepseek_api_key"] = data["deepseek_api_key"]
+            changes["deepseek_api_key"] = data["deepseek_api_key"]
         if "llm_provider" in data:
-            settings["llm_provider"] = data["llm_provider"]
+            provider = str(data["llm_provider"]).lower()
+            if provider not in ("gemini", "deepseek"):
+                return JSONResponse(status_code=400, content={"error": f"不支持的 llm_provider: {provider}"})
+            changes["llm_provider"] = provider
 
-        # 保存配置
-        await loop.run_in_executor(None, save_settings, settings)
+        # 保存配置（各 LLMRouter 在下一次调用时自动切换到新的 provider / key，无需重启）
+        await loop.run_in_executor(None, update_settings_file, changes)
 
         return {"ok": True, "message": "配置已保存"}
     except Exception as e:
@@ -1,4 +1,5 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
 import sys
 import os
 
@@ -6,7 +7,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from schemas import BaziContext, UserInput
+from utils.bazi_chart import SEXAGENARY
 from utils.cal_tools import BaziEngine
+from utils.ganzhi_index import iter_days
+from utils.tracing import traced
 
 """
 计划:
@@ -18,41 +22,26 @@ from utils.cal_tools import BaziEngine
 class BaziContextBuilder:
     def __init__(self):
         self.engine = BaziEngine()
+        # 提示词中附带的流年数（从今年起），0 为不附带
+        self.liunian_years = int(os.getenv("LIUNIAN_PROMPT_YEARS", "0"))
 
-    def get_calendar(self):
-        """获取未来两周的干支历"""
-        current_time = self.engine.get_timenow()
-        today_weekday = current_time.weekday()
-        days_from_monday = timedelta(days=today_weekday)
-        monday_of_this_week = current_time - days_from_monday
-        
-        start_date = datetime(monday_of_this_week.year, monday_of_this_week.month, monday_of_this_week.day)
-        
-        end_date = start_date + timedelta(days=13)
-        
+    @traced("context.calendar")
+    def get_calendar(self, start: Optional[date] = None, days: int = 14):
+        """获取干支历，默认从本周一起两周（日柱取自逐日干支索引）"""
+        if start is None:
+            today = self.engine.get_timenow().date()
+            start = today - timedelta(days=today.weekday())
 
         weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
-        calendar_items = []
+        # 格式化为"周一 甲子日 6月24日"
+        return "\n".join(
+            f"周{weekday_names[d.weekday()]} {SEXAGENARY[table.days[i]].name}日 {d.month}月{d.day}日"
+            for d, table, i in iter_days(start, start + timedelta(days=days - 1))
+        )
 
-        for i in range(14):
-            date = start_date + timedelta(days=i)
-            weekday = weekday_names[date.weekday()]
-            
-            # 获取干支信息
-            ganzhi_info = self.engine.get_ganzhi_info(date)
-            day_ganzhi = ganzhi_info['day_ganzhi']
-            
-            # 格式化为"6月24日 周一 甲子日"
-            calendar_item = f"周{weekday} {day_ganzhi}日 {date.month}月{date.day}日"
-            calendar_items.append(calendar_item)
-        
-        # 合并为一个字符串
-        calendar = "\n".join(calendar_items)
-        return calendar
+    def resolve_birth_time(self, user_info: UserInput) -> datetime:
+        """根据用户输入解析出生时间（农历先转换为公历）"""
 
-    def build_context(self, user_info: UserInput) -> BaziContext:
-        """根据用户输入调用计算工具得到完整排盘信息输出一个BaziContext对象"""
-        
         # 根据is_lunar字段处理日期
         if user_info.is_lunar:
             # 使用断言确保农历年月日都已提供，并帮助类型检查器
@@ -72,18 +61,33 @@ class BaziContextBuilder:
             birth_time_str = f"{lunar_date.strftime('%Y-%m-%d')} {time_str}"
             # 兼容两种时间格式
             try:
-                birth_time = datetime.strptime(birth_time_str, '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                birth_time = datetime.strptime(birth_time_str, '%Y-%m-%d %H:%M')
-        else:
-            # 保持原有逻辑，处理公历日期
-            if not user_info.birth_time:
-                raise ValueError("公历出生时间 (birth_time) 未提供。")
-            # 兼容两种时间格式
-            try:
-                birth_time = datetime.strptime(user_info.birth_time, '%Y-%m-%d %H:%M:%S')
+                return datetime.strptime(birth_time_str, '%Y-%m-%d %H:%M:%S')
             except ValueError:
-                birth_time = datetime.strptime(user_info.birth_time, '%Y-%m-%d %H:%M')
+                return datetime.strptime(birth_time_str, '%Y-%m-%d %H:%M')
+
+        # 保持原有逻辑，处理公历日期
+        if not user_info.birth_time:
+            raise ValueError("公历出生时间 (birth_time) 未提供。")
+        # 兼容两种时间格式
+        try:
+            return datetime.strptime(user_info.birth_time, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return datetime.strptime(user_info.birth_time, '%Y-%m-%d %H:%M')
+
+    @traced("context.chart")
+    def build_chart(self, user_info: UserInput, parts: Optional[Iterable[str]] = None) -> dict:
+        """
+        只排盘（不生成日历与提示词文本），用于排盘接口
+        parts 指定需要的部分（pillars / lunar / luck / relations / liunian，默认全部），未请求的部分不会计算
+        """
+        birth_time = self.resolve_birth_time(user_info)
+        chart = self.engine.chart(birth_time, user_info.gender, user_info.birth_location)
+        return chart.to_dict(parts)
+
+    @traced("context.build")
+    def build_context(self, user_info: UserInput) -> BaziContext:
+        """根据用户输入调用计算工具得到完整排盘信息输出一个BaziContext对象"""
+        birth_time = self.resolve_birth_time(user_info)
 
         current_time = self.engine.get_timenow()
         current_ganzhi = self.engine.get_ganzhi_info(current_time)
@@ -94,23 +98,21 @@ class BaziContextBuilder:
         nowtime_month = f"{current_ganzhi['year_ganzhi']}年{current_ganzhi['month_ganzhi']}月"
         calendar = self.get_calendar()
 
-        dayun_info = self.engine.calculate_dayun(birth_time, user_info.gender, user_info.birth_location)
-
-        dayun_list_str = " -> ".join([f"{dayun['age']}岁 {dayun['year']}年 {dayun['ganzhi']} {dayun['ming_li']}" for dayun in dayun_info["dayun_list"]])
-        dayun_time = f"{dayun_list_str}"
-        
-        birth_solar = dayun_info['birth_solar']
-        birth_lunar = dayun_info['birth_lunar']
-        birth_correct = f"{birth_solar['year']}年{birth_solar['month']}月{birth_solar['day']}日{birth_solar['hour']}:{birth_solar['minute']:02d} {birth_lunar['display']['full_string']}"
-        
-        bazi = f"{dayun_info['bazi']['year']} {dayun_info['bazi']['month']} {dayun_info['bazi']['day']} {dayun_info['bazi']['hour']}"
-        
-        qiyun_data = dayun_info['qiyun_data']
-        qiyun_time = f"出生后{qiyun_data['year']}年{qiyun_data['month']}月{qiyun_data['day']}日 上大运"
-        
-        jiaoyun_data = dayun_info['jiaoyun_data']
-        jiaoyun_time = f"{jiaoyun_data['year']}年{jiaoyun_data['month']}月交大运"
-        
+        # 命盘只存下标，提示词所需字符串在此渲染
+        chart = self.engine.chart(birth_time, user_info.gender, user_info.birth_location)
+        tst = chart.true_solar_time
+        birth_correct = f"{tst.year}年{tst.month}月{tst.day}日{tst.hour}:{tst.minute:02d} {chart.birth_lunar.display()}"
+        bazi = chart.bazi_string()
+        dayun_time = chart.dayun_string()
+
+        qiyun = chart.qiyun
+        qiyun_time = f"出生后{qiyun.years}年{qiyun.months}月{qiyun.days}日 上大运"
+
+        jiaoyun_year, jiaoyun_month = chart.jiaoyun
+        jiaoyun_time = f"{jiaoyun_year}年{jiaoyun_month}月交大运"
+
+        liunian_time = chart.liunian_string(current_time.year, self.liunian_years) if self.liunian_years > 0 else ""
+
         return BaziContext(
             nowtime=nowtime_month,
             calendar=calendar,
@@ -122,7 +124,8 @@ class BaziContextBuilder:
             bazi=bazi,
             dayun_time=dayun_time,
             qiyun_time=qiyun_time,
-            jiaoyun_time=jiaoyun_time
+            jiaoyun_time=jiaoyun_time,
+            liunian_time=liunian_time
         )
 
 
@@ -37,6 +37,7 @@ class BaziContext(BaseModel):
     dayun_time: str  # 大运信息，格式: 大运: 2岁 2003年 庚子 -> 12岁 2013年 辛丑 -> ...
     qiyun_time: str  # 起运时间，格式: 出生后4年5月8日18时 上大运
     jiaoyun_time: str  # 交运时间，格式: 逢丙、辛年 小暑后26天7小时 交大运
+    liunian_time: str = ""  # 近几年流年（可选，LIUNIAN_PROMPT_YEARS>0 时填充），格式: 2025年 24岁 乙巳 正财/七杀（癸卯运）
 
 class AnalysisContext(BaseModel):
     """完整分析上下文，包含原始输入和计算结果"""
@@ -0,0 +1,61 @@
+"""
+批量排盘
+- 每条输入默认只排四柱与大运（BaziContextBuilder.build_chart），不生成日历与提示词文本
+- 计算分发到进程内共享的线程池（地理位置查询为网络 I/O），结果按输入顺序以 NDJSON 逐行输出
+- 单条输入校验或计算失败只影响该条，输出 {"index": i, "ok": false, "error": ...}
+
+配置（环境变量）：
+    BAZI_BATCH_WORKERS   线程池大小，默认 8
+"""
+import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Sequence
+
+from pydantic import ValidationError
+
+from prompt.context_builder import BaziContextBuilder
+from schemas import UserInput
+
+# 单次请求最多条数
+MAX_BATCH_ITEMS = 1000
+# 同时在途的条数（按 worker 数的倍数），避免一次性占满线程池队列
+IN_FLIGHT_PER_WORKER = 4
+# 默认计算的命盘部分（见 utils/bazi_chart.py）
+DEFAULT_PARTS = ("pillars", "luck")
+
+_workers = int(os.getenv("BAZI_BATCH_WORKERS", "8"))
+_pool = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="bazi-batch")
+_builder = BaziContextBuilder()
+
+
+def compute_item(index: int, item: Any, parts: Sequence[str] = DEFAULT_PARTS) -> Dict[str, Any]:
+    """排一条命盘，异常转为该条的错误结果"""
+    try:
+        user = UserInput.model_validate(item)
+        return {"index": index, "ok": True, **_builder.build_chart(user, parts)}
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+        return {"index": index, "ok": False, "error": errors}
+    except Exception as e:
+        return {"index": index, "ok": False, "error": str(e) or type(e).__name__}
+
+
+async def iter_ndjson(items: List[Any], parts: Sequence[str] = DEFAULT_PARTS) -> AsyncIterator[str]:
+    """按输入顺序逐行输出 NDJSON；客户端断开时取消尚未开始的计算"""
+    window = max(1, _workers * IN_FLIGHT_PER_WORKER)
+    futures: Dict[int, Future] = {}
+    next_submit = 0
+    try:
+        for index in range(len(items)):
+            while next_submit < len(items) and next_submit < index + window:
+                ctx = contextvars.copy_context()
+                futures[next_submit] = _pool.submit(ctx.run, compute_item, next_submit, items[next_submit], parts)
+                next_submit += 1
+            result = await asyncio.wrap_future(futures.pop(index))
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    finally:
+        for future in futures.values():
+            future.cancel()
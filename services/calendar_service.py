@@ -0,0 +1,104 @@
+"""
+干支日历服务：任意日期区间（一个月、一年或多年）的逐日干支、农历与节气
+- 数据取自按年预先生成的逐日索引（utils/ganzhi_index.py），不逐日创建 sxtwl 对象
+- 两种输出：
+    calendar_columns()   列式：每列一个整数数组，配合 tables 中的名称表解码，体积小，适合一次取整年
+    iter_calendar_rows() 逐日生成器（NDJSON 流式输出），字段为可直接展示的字符串
+"""
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils.bazi_chart import LUNAR_DAY_NAMES, LUNAR_MONTH_NAMES, SEXAGENARY
+from utils.ganzhi_index import (
+    JIEQI_NAMES, LEAP_FLAG, MAX_YEAR, MIN_YEAR, NO_JIEQI, iter_days, range_jieqi, range_table
+)
+
+# 单次最多天数（约 20 年）
+MAX_CALENDAR_DAYS = 7320
+WEEKDAY_NAMES = ["一", "二", "三", "四", "五", "六", "日"]
+
+
+def parse_range(start: Optional[str], end: Optional[str], today: Optional[date] = None) -> Tuple[date, date]:
+    """解析 YYYY-MM-DD 区间；都不传时为本周一起两周，只传 start 时为 start 起两周"""
+    if start:
+        start_date = date.fromisoformat(start)
+    else:
+        today = today or date.today()
+        start_date = today - timedelta(days=today.weekday())
+    end_date = date.fromisoformat(end) if end else start_date + timedelta(days=13)
+    count = (end_date - start_date).days + 1
+    if count <= 0:
+        raise ValueError("结束日期不能早于开始日期")
+    if count > MAX_CALENDAR_DAYS:
+        raise ValueError(f"区间最多 {MAX_CALENDAR_DAYS} 天")
+    if start_date.year < MIN_YEAR or end_date.year > MAX_YEAR:
+        raise ValueError(f"年份范围 {MIN_YEAR}-{MAX_YEAR}")
+    return start_date, end_date
+
+
+def _lunar_name(month: int, day: int) -> str:
+    leap = "闰" if month & LEAP_FLAG else ""
+    return f"{leap}{LUNAR_MONTH_NAMES[(month & ~LEAP_FLAG) - 1]}{LUNAR_DAY_NAMES[day - 1]}"
+
+
+def calendar_columns(start: date, end: date) -> Dict[str, Any]:
+    """
+    列式日历：columns 中第 i 项对应 start + i 天
+        day_ganzhi / month_ganzhi / year_ganzhi  六十甲子下标，名称见 tables.ganzhi
+        lunar_month  1-12，lunar_leap 为 1 表示闰月；lunar_day 1-30
+        jieqi        当天交节气的下标（名称见 tables.jieqi），无节气为 -1
+    jieqi_times 为区间内各节气的交接时刻
+    """
+    cols = range_table(start, end)
+    lunar_months = cols["lunar_months"]
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "count": len(cols["days"]),
+        "start_weekday": start.weekday(),
+        "tables": {
+            "ganzhi": [p.name for p in SEXAGENARY],
+            "lunar_month": list(LUNAR_MONTH_NAMES),
+            "lunar_day": list(LUNAR_DAY_NAMES),
+            "jieqi": list(JIEQI_NAMES),
+        },
+        "columns": {
+            "day_ganzhi": list(cols["days"]),
+            "month_ganzhi": list(cols["months"]),
+            "year_ganzhi": list(cols["years"]),
+            "lunar_month": [m & ~LEAP_FLAG for m in lunar_months],
+            "lunar_leap": [1 if m & LEAP_FLAG else 0 for m in lunar_months],
+            "lunar_day": list(cols["lunar_days"]),
+            "jieqi": [-1 if j == NO_JIEQI else j for j in cols["jieqi"]],
+        },
+        "jieqi_times": [
+            {"offset": offset, "name": JIEQI_NAMES[index], "time": moment.strftime("%Y-%m-%d %H:%M:%S")}
+            for offset, index, moment in range_jieqi(start, end)
+        ],
+    }
+
+
+def iter_calendar_rows(start: date, end: date) -> Iterator[Dict[str, Any]]:
+    """逐日输出可直接展示的日历行"""
+    for d, table, i in iter_days(start, end):
+        jieqi = table.jieqi[i]
+        row = {
+            "date": d.isoformat(),
+            "weekday": f"周{WEEKDAY_NAMES[d.weekday()]}",
+            "ganzhi": SEXAGENARY[table.days[i]].name,
+            "month_ganzhi": SEXAGENARY[table.months[i]].name,
+            "year_ganzhi": SEXAGENARY[table.years[i]].name,
+            "lunar_year": table.lunar_year(i),
+            "lunar": _lunar_name(table.lunar_months[i], table.lunar_days[i]),
+            "jieqi": None,
+        }
+        if jieqi != NO_JIEQI:
+            row["jieqi"] = JIEQI_NAMES[jieqi]
+            row["jieqi_time"] = table.jieqi_times[i].strftime("%Y-%m-%d %H:%M:%S")
+        yield row
+
+
+def iter_calendar_ndjson(start: date, end: date) -> Iterator[str]:
+    for row in iter_calendar_rows(start, end):
+        yield json.dumps(row, ensure_ascii=False) + "\n"
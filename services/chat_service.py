@@ -0,0 +1,160 @@
+"""
+多轮对话（/chat）
+- 创建会话时排盘一次，BaziContext、渲染好的排盘提示词与对话记录存入 db/chat.sqlite3，之后每轮不再重新排盘；
+  提示词中的当前流月与本周日历按周有效，会话记录所属周，换周（周一）后的第一轮重新排盘并渲染提示词
+- 提示词前缀稳定（见 agents/chat_agent.py）：固定指令 + 会话排盘信息 + 滚动摘要 + 只追加的对话记录，
+  相邻两轮之间只在末尾追加内容，provider 前缀缓存可以命中
+- 未压缩记录的预估 token 超过 CHAT_HISTORY_TOKENS 时，把较早的记录连同旧摘要压缩成新摘要，
+  只保留最近 CHAT_KEEP_MESSAGES 条原文；压缩在本轮回复结束后于后台进行，不增加本轮延迟。
+  每轮输入因此不超过 排盘 + 摘要 + 预算，不随对话轮数增长
+- 同一会话的各轮串行执行；某轮生成失败时不记录该轮
+
+配置（环境变量）：
+    CHAT_HISTORY_TOKENS   未压缩对话记录的 token 预算，默认 3000
+    CHAT_KEEP_MESSAGES    压缩后保留的最近消息条数，默认 4（两轮）
+"""
+import asyncio
+import logging
+import math
+import os
+import uuid
+import weakref
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from agents.chat_agent import ChatAgent
+from agents.weekly_fortune_agent import natal_key
+from db.chat_store import ChatStore, chat_store
+from db.natal_store import natal_store
+from prompt.context_builder import BaziContextBuilder
+from schemas import UserInput
+from services.prefetch import week_of
+from utils.rate_limiter import TOKENS_PER_CHAR
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "3000"))
+# 按整轮（一问一答）保留
+KEEP_MESSAGES = max(1, int(os.getenv("CHAT_KEEP_MESSAGES", "4")) // 2) * 2
+MAX_MESSAGE_CHARS = 2000
+
+
+class ChatSessionNotFound(Exception):
+    pass
+
+
+def history_tokens(history: List[Tuple[int, str, str]]) -> int:
+    return int(math.ceil(sum(len(content) for _, _, content in history) * TOKENS_PER_CHAR))
+
+
+class ChatService:
+    def __init__(self, store: ChatStore, agent: Optional[ChatAgent] = None,
+                 builder: Optional[BaziContextBuilder] = None) -> None:
+        self.store = store
+        self.agent = agent or ChatAgent()
+        self.builder = builder or BaziContextBuilder()
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._compacting: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @traced("service.chat.create_session")
+    def create_session(self, owner: UserInput) -> str:
+        """排盘并创建会话；命盘解读已缓存时一并附带（不为此额外调用模型）"""
+        week = week_of(date.today())
+        context = self.builder.build_context(owner)
+        prompt = self.agent.render_context(context, natal_store.get(natal_key(context)))
+        session_id = uuid.uuid4().hex
+        self.store.create_session(session_id, owner.model_dump(), context.model_dump(), prompt, week)
+        return session_id
+
+    def refresh_context(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """会话排盘不属于本周时重新排盘、渲染提示词并保存，返回更新后的会话"""
+        week = week_of(date.today())
+        if session["week"] == week:
+            return session
+        context = self.builder.build_context(UserInput(**session["owner"]))
+        prompt = self.agent.render_context(context, natal_store.get(natal_key(context)))
+        self.store.update_context(session["id"], context.model_dump(), prompt, week)
+        logger.info(f"[chat] 会话 {session['id']} 换周，排盘信息更新至 {week}")
+        return {**session, "context": context.model_dump(), "prompt": prompt, "week": week}
+
+    def history(self, session_id: str) -> Dict[str, Any]:
+        session = self.store.get_session(session_id)
+        if session is None:
+            raise ChatSessionNotFound(session_id)
+        return {
+            "session_id": session_id,
+            "summary": session["summary"],
+            "summarized_upto": session["summarized_upto"],
+            "messages": [
+                {"seq": seq, "role": role, "content": content}
+                for seq, role, content in self.store.messages(session_id)
+            ],
+        }
+
+    @staticmethod
+    def check_message(message: str) -> None:
+        """校验消息内容；自动创建会话前先调用，避免无效消息留下空会话"""
+        if not message.strip():
+            raise ValueError("消息不能为空")
+        if len(message) > MAX_MESSAGE_CHARS:
+            raise ValueError(f"消息最多 {MAX_MESSAGE_CHARS} 字")
+
+    def check(self, session_id: str, message: str) -> None:
+        """开始流式输出前的校验（流开始后无法再返回错误状态码）"""
+        self.check_message(message)
+        if self.store.get_session(session_id) is None:
+            raise ChatSessionNotFound(session_id)
+
+    async def stream_reply(self, session_id: str, message: str) -> AsyncIterator[str]:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        async with lock:
+            session = await asyncio.to_thread(self.store.get_session, session_id)
+            if session is None:
+                raise ChatSessionNotFound(session_id)
+            session = await asyncio.to_thread(self.refresh_context, session)
+            history = await asyncio.to_thread(self.store.messages, session_id, session["summarized_upto"])
+            messages = self.agent.build_messages(
+                session["prompt"], session["summary"], [(role, content) for _, role, content in history], message
+            )
+            parts: List[str] = []
+            async for chunk in self.agent.astream_reply(messages):
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+            await asyncio.to_thread(self.store.append, session_id, [("human", message), ("ai", "".join(parts))])
+            pending = history_tokens(history) + int(math.ceil((len(message) + sum(map(len, parts))) * TOKENS_PER_CHAR))
+        if pending > HISTORY_TOKENS and session_id not in self._compacting:
+            self._compacting.add(session_id)
+            task = asyncio.create_task(self._compact(session_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _compact(self, session_id: str) -> None:
+        """把除最近 KEEP_MESSAGES 条以外的未压缩记录并入滚动摘要"""
+        try:
+            session = await asyncio.to_thread(self.store.get_session, session_id)
+            if session is None:
+                return
+            history = await asyncio.to_thread(self.store.messages, session_id, session["summarized_upto"])
+            fold = history[:-KEEP_MESSAGES]
+            if not fold:
+                return
+            summary = await asyncio.to_thread(
+                self.agent.summarize, session["summary"], [(role, content) for _, role, content in fold]
+            )
+            if summary:
+                await asyncio.to_thread(self.store.update_summary, session_id, summary, fold[-1][0])
+                logger.info(f"[chat] 会话 {session_id} 压缩至 #{fold[-1][0]}，摘要 {len(summary)} 字")
+        except Exception as e:
+            # 压缩失败不影响对话，下一轮结束后重试
+            logger.warning(f"[chat] 会话 {session_id} 压缩失败: {e}")
+        finally:
+            self._compacting.discard(session_id)
+
+
+# 模块级单例
+chat_service = ChatService(chat_store)
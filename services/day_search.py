@@ -0,0 +1,144 @@
+"""
+择日搜索：在日期区间内按规则筛选并排序候选日（不调用 LLM）
+- 区间内每天的日柱、月柱、年柱取自逐日干支索引（utils/ganzhi_index.py）
+- 每条规则是一张 六十甲子下标 -> 0/1 的 256 字节表，对整段日柱列做一次 bytes.translate 得到掩码，
+  多条规则的掩码按位与合并，只对通过的日期打分
+- 候选日按本地规则分（utils/local_scorer.py）排序，返回前 limit 个，供 LLM 只点评短名单
+
+规则：
+    avoid_clash   排除与命主日支（夫妻宫）、年支相冲的日子
+    elements      流日天干或地支五行属于给定五行（None 为命局喜用五行，空列表为不限）
+    ten_gods      流日天干相对日主的十神，可写十神名（正财）或类别（比劫 / 食伤 / 财 / 官杀 / 印）
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from prompt.context_builder import BaziContextBuilder
+from schemas import UserInput
+from utils.bazi_chart import SEXAGENARY, BaziChart
+from utils.bazi_relations import (
+    BRANCH_ELEMENT, CLASH, ELEMENT_NAMES, STEM_ELEMENT, TEN_GOD_NAMES, branch_relation, ten_god
+)
+from utils.ganzhi_index import range_columns
+from utils.local_scorer import LocalScorer, favorable_elements
+from utils.tracing import traced
+
+# 单次搜索最多天数
+MAX_SEARCH_DAYS = 732
+MAX_LIMIT = 100
+RANK_KEYS = ("total", "emotion", "health", "wealth")
+TEN_GOD_CATEGORIES = {"比劫": 0, "食伤": 1, "财": 2, "官杀": 3, "印": 4}
+WEEKDAY_NAMES = ["一", "二", "三", "四", "五", "六", "日"]
+
+_builder = BaziContextBuilder()
+
+
+def _mask_table(keep) -> bytes:
+    """bytes.translate 用的 256 字节表：六十甲子下标 i 满足 keep(i) 时为 1"""
+    return bytes(1 if i < 60 and keep(i) else 0 for i in range(256))
+
+
+def _parse_elements(names: Iterable[str]) -> frozenset:
+    result = set()
+    for name in names:
+        if name not in ELEMENT_NAMES:
+            raise ValueError(f"不支持的五行: {name}")
+        result.add(ELEMENT_NAMES.index(name))
+    return frozenset(result)
+
+
+def _parse_ten_gods(names: Iterable[str]) -> frozenset:
+    result = set()
+    for name in names:
+        if name in TEN_GOD_NAMES:
+            result.add(TEN_GOD_NAMES.index(name))
+        elif name in TEN_GOD_CATEGORIES:
+            category = TEN_GOD_CATEGORIES[name]
+            result.update((category * 2, category * 2 + 1))
+        else:
+            raise ValueError(f"不支持的十神: {name}")
+    return frozenset(result)
+
+
+def _and(a: bytes, b: bytes) -> bytes:
+    """两个 0/1 掩码按位与（整段转成大整数一次运算）"""
+    return (int.from_bytes(a, "big") & int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+
+def search_days(
+        chart: BaziChart,
+        start: date,
+        end: date,
+        avoid_clash: bool = True,
+        elements: Optional[List[str]] = None,
+        ten_gods: Optional[List[str]] = None,
+        rank_by: str = "total",
+        limit: int = 10,
+) -> Dict[str, Any]:
+    count = (end - start).days + 1
+    if count <= 0:
+        raise ValueError("结束日期不能早于开始日期")
+    if count > MAX_SEARCH_DAYS:
+        raise ValueError(f"区间最多 {MAX_SEARCH_DAYS} 天")
+    if rank_by not in RANK_KEYS:
+        raise ValueError(f"rank_by 可选: {', '.join(RANK_KEYS)}")
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    day_master = chart.day_master
+    guarded = (chart.pillars[2].zhi, chart.pillars[0].zhi)
+    wanted_elements = favorable_elements(chart)[1] if elements is None else _parse_elements(elements)
+    wanted_gods = _parse_ten_gods(ten_gods or [])
+
+    rules = []
+    if avoid_clash:
+        rules.append(_mask_table(lambda i: not any(branch_relation(i % 12, z) & CLASH for z in guarded)))
+    if wanted_elements:
+        rules.append(_mask_table(
+            lambda i: STEM_ELEMENT[i % 10] in wanted_elements or BRANCH_ELEMENT[i % 12] in wanted_elements
+        ))
+    if wanted_gods:
+        rules.append(_mask_table(lambda i: ten_god(day_master, i % 10) in wanted_gods))
+
+    days, months, years = range_columns(start, end)
+    mask = b"\x01" * count
+    for table in rules:
+        mask = _and(mask, days.translate(table))
+
+    scorer = LocalScorer(chart)
+    candidates = []
+    i = mask.find(1)
+    while i != -1:
+        scores = scorer.score_indices(days[i], months[i], years[i])
+        rank = sum(scores.values()) if rank_by == "total" else scores[rank_by]
+        candidates.append((rank, i, scores))
+        i = mask.find(1, i + 1)
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+
+    items = []
+    for rank, i, scores in candidates[:limit]:
+        d = start + timedelta(days=i)
+        day = SEXAGENARY[days[i]]
+        items.append({
+            "date": d.isoformat(),
+            "weekday": f"周{WEEKDAY_NAMES[d.weekday()]}",
+            "ganzhi": day.name,
+            "month_ganzhi": SEXAGENARY[months[i]].name,
+            "ten_god": TEN_GOD_NAMES[ten_god(day_master, day.gan)],
+            "element": f"{ELEMENT_NAMES[STEM_ELEMENT[day.gan]]}{ELEMENT_NAMES[BRANCH_ELEMENT[day.zhi]]}",
+            "scores": scores,
+        })
+    return {
+        "matched": len(candidates),
+        "total_days": count,
+        "elements": [ELEMENT_NAMES[e] for e in sorted(wanted_elements)],
+        "items": items,
+    }
+
+
+@traced("service.search_auspicious_days")
+def search_auspicious_days(owner_data: Dict[str, Any], start: str, end: str, **rules) -> Dict[str, Any]:
+    """按命主信息排盘后搜索；日期为 YYYY-MM-DD，规则见模块说明。异常：ValueError 参数非法"""
+    owner = UserInput(**owner_data)
+    birth_time = _builder.resolve_birth_time(owner)
+    chart = _builder.engine.chart(birth_time, owner.gender, owner.birth_location)
+    return search_days(chart, date.fromisoformat(start), date.fromisoformat(end), **rules)
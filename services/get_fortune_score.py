@@ -3,16 +3,30 @@
 - 目前只支持维度：'流日'
 - 评分唯一键：YYYY-MM-DD（Asia/Shanghai）
 - 未做任何“自然触发”，仅在调用时执行“查库或预测再写库”
+- LLM 调用失败时回退到本地规则打分（utils/local_scorer.py，source=local，不入库）
+- SCORE_LOCAL_PRIOR=true 时先算本地分作为参考分交给 LLM 微调
+- score_range_local()：日期区间批量本地打分（不调用 LLM）
 """
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Dict, Any
+import json
+import logging
+import os
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, Any, List
 
 from prompt.context_builder import BaziContextBuilder
 from agents.fortune_score_agent import FortuneScoreAgent
 from schemas import UserInput
 from db.db_manager import db as scores_repo
+from utils.local_scorer import LocalScorer
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# 区间批量打分最多天数
+MAX_LOCAL_RANGE_DAYS = 3660
 
 
 class OwnerConfigNotFound(Exception):
@@ -22,6 +36,7 @@ class OwnerConfigNotFound(Exception):
 
 _context_builder = BaziContextBuilder()
 _fortune_agent = FortuneScoreAgent()
+_use_local_prior = os.getenv("SCORE_LOCAL_PRIOR", "false").lower() in ("1", "true", "yes")
 
 
 def _today_key() -> str:
@@ -37,6 +52,7 @@ def _today_key() -> str:
         return datetime.now().strftime("%Y-%m-%d")
 
 
+@traced("service.get_fortune_score")
 def get_fortune_score(dimension: str, owner_data: Dict[str, Any] | None = None) -> Dict[str, Any]:
     """
     应用服务入口：获取三维评分（情感/健康/财富）
@@ -49,7 +65,7 @@ def get_fortune_score(dimension: str, owner_data: Dict[str, Any] | None = None)
     返回：
         {
           "result": {"emotion": int, "health": int, "wealth": int},
-          "source": "db" | "model",
+          "source": "db" | "model" | "local",
           "key": "YYYY-MM-DD"
         }
     异常：
@@ -86,20 +102,55 @@ def get_fortune_score(dimension: str, owner_data: Dict[str, Any] | None = None)
     # 3) 构建上下文 → 调用算法（流日干支注入在 Agent 内部处理）
     owner_input = UserInput(**owner_cfg)
     context = _context_builder.build_context(owner_input)
-    scores = _fortune_scores(context)
+    prior = _local_scorer(owner_input).score(date.fromisoformat(key)) if _use_local_prior else None
+    try:
+        scores = _fortune_scores(context, prior)
+    except Exception as e:
+        # 模型不可用：返回本地规则分，不入库，下次请求仍会尝试模型
+        logger.warning(f"[get_fortune_score] 模型打分失败，使用本地规则分: {e}")
+        scores = prior or _local_scorer(owner_input).score(date.fromisoformat(key))
+        return {"result": scores, "source": "local", "key": key}
 
     # 4) 入库并返回
     scores_repo.upsert_score(dimension=dim, key=key, scores=scores, source="model")
     return {"result": scores, "source": "model", "key": key}
 
 
-def _fortune_scores(context) -> Dict[str, int]:
+def _fortune_scores(context, prior: Dict[str, int] | None = None) -> Dict[str, int]:
     """
     内部封装：调用打分 Agent 获取三维分
     注意：流日干支注入在 FortuneScoreAgent 内部 _render_messages 中完成
     """
     # 仅支持流日
-    return _fortune_agent.predict_scores(context, dimension="流日")
+    return _fortune_agent.predict_scores(context, dimension="流日", prior=prior)
+
+
+def _local_scorer(owner_input: UserInput) -> LocalScorer:
+    return _cached_scorer(owner_input.model_dump_json())
+
+
+@lru_cache(maxsize=256)
+def _cached_scorer(owner_json: str) -> LocalScorer:
+    owner_input = UserInput(**json.loads(owner_json))
+    birth_time = _context_builder.resolve_birth_time(owner_input)
+    chart = _context_builder.engine.chart(birth_time, owner_input.gender, owner_input.birth_location)
+    return LocalScorer(chart)
+
+
+@traced("service.score_range_local")
+def score_range_local(owner_data: Dict[str, Any], start: str, end: str) -> List[Dict[str, Any]]:
+    """
+    日期区间 [start, end]（YYYY-MM-DD）逐日本地规则打分，不查库、不调用 LLM
+    返回 [{"key": "YYYY-MM-DD", "emotion": int, "health": int, "wealth": int}, ...]
+    异常：ValueError 日期非法或区间过长
+    """
+    start_date, end_date = date.fromisoformat(start), date.fromisoformat(end)
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        raise ValueError("结束日期不能早于开始日期")
+    if days > MAX_LOCAL_RANGE_DAYS:
+        raise ValueError(f"区间最多 {MAX_LOCAL_RANGE_DAYS} 天")
+    return _local_scorer(UserInput(**owner_data)).score_range(start_date, end_date)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,179 @@
+"""
+本地后台任务队列（SQLite，无外部 broker）
+- submit() 入库后立即返回任务 ID，由后台线程池中的 worker 认领执行
+- 按优先级（越小越优先）与提交时间调度；执行失败按指数退避重试，超过最大次数进入死信（dead）
+- worker 执行期间持有租约并定期续期；进程退出后租约过期，任务会被其他 worker 重新认领
+- 处理函数通过 register(kind, handler) 注册，handler(payload) 的返回值需可 JSON 序列化
+
+配置（环境变量）：
+    JOB_WORKERS        worker 线程数，默认 2
+    JOB_MAX_ATTEMPTS   默认最大执行次数，默认 3
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from db.job_store import JobStore, job_store
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 5
+# 重试退避：base * 2^(n-1)，上限 cap，另加 0~base 的随机抖动
+RETRY_BACKOFF_BASE = 5.0
+RETRY_BACKOFF_CAP = 300.0
+# 执行租约（秒）；LLM 调用可能长达数分钟，执行期间每 LEASE_RENEW_INTERVAL 秒续期
+LEASE_SECONDS = 120.0
+LEASE_RENEW_INTERVAL = 30.0
+# 队列为空时的轮询间隔（有新任务提交时会立即唤醒）
+POLL_INTERVAL = 1.0
+
+Handler = Callable[[Dict[str, Any]], Any]
+
+
+class UnknownJobKind(ValueError):
+    pass
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** (attempts - 1)) + random.uniform(0, RETRY_BACKOFF_BASE)
+
+
+class JobQueue:
+    def __init__(self, store: JobStore, workers: Optional[int] = None) -> None:
+        self.store = store
+        self.workers = workers if workers is not None else int(os.getenv("JOB_WORKERS", "2"))
+        self.max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        self._handlers: Dict[str, Handler] = {}
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    @property
+    def kinds(self) -> List[str]:
+        return sorted(self._handlers)
+
+    def submit(
+            self,
+            kind: str,
+            payload: Dict[str, Any],
+            priority: int = DEFAULT_PRIORITY,
+            max_attempts: Optional[int] = None,
+    ) -> str:
+        if kind not in self._handlers:
+            raise UnknownJobKind(f"不支持的任务类型: {kind}")
+        job_id = self.store.submit(kind, payload, priority, max_attempts or self.max_attempts)
+        self._wakeup.set()
+        return job_id
+
+    def requeue(self, job_id: str) -> bool:
+        """死信任务重新排队"""
+        if not self.store.requeue(job_id):
+            return False
+        self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"[job_queue] 已启动 {self.workers} 个 worker，任务类型: {', '.join(self.kinds)}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止认领新任务；正在执行的任务不会被中断，未完成的会在租约过期后重新执行"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self.store.claim(LEASE_SECONDS)
+            except Exception as e:
+                logger.warning(f"[job_queue] 认领任务失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            try:
+                self._execute(job)
+            except Exception as e:
+                # worker 不因单个任务退出；未能结算的任务在租约过期后重新认领
+                logger.error(f"[job_queue] 任务 {job['id']} 执行异常: {e}", exc_info=True)
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        job_id, kind, attempts = job["id"], job["kind"], job["attempts"]
+        if attempts > job["max_attempts"]:
+            # 执行方中途退出、租约过期后被重新认领，且已用完次数
+            self._settle(job, job["error"] or "lease expired", None)
+            return
+        handler = self._handlers.get(kind)
+        if handler is None:
+            self._settle(job, f"未注册的任务类型: {kind}", None)
+            return
+
+        renew_stop = threading.Event()
+        renewer = threading.Thread(target=self._renew, args=(job_id, attempts, renew_stop), daemon=True)
+        renewer.start()
+        tracing.start_request()
+        try:
+            with tracing.span(f"job.{kind}", **{"job.id": job_id, "job.attempt": attempts}):
+                result = handler(job["payload"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retry_at = time.time() + retry_delay(attempts) if attempts < job["max_attempts"] else None
+            if retry_at is None:
+                logger.error(f"[job_queue] 任务 {job_id} ({kind}) 第 {attempts} 次执行失败，进入死信: {error}")
+            else:
+                logger.warning(f"[job_queue] 任务 {job_id} ({kind}) 第 {attempts} 次执行失败，稍后重试: {error}")
+            self._settle(job, error, retry_at)
+        else:
+            self._settle(job, None, None, result)
+        finally:
+            renew_stop.set()
+
+    def _settle(self, job: Dict[str, Any], error: Optional[str], retry_at: Optional[float], result: Any = None) -> None:
+        """
+        写入执行结果（error 为 None 时为成功）；结果无法序列化时直接进入死信。
+        写库失败只记录日志，任务在租约过期后重新认领
+        """
+        job_id, attempts = job["id"], job["attempts"]
+        try:
+            if error is None:
+                try:
+                    settled = self.store.complete(job_id, attempts, result)
+                except (TypeError, ValueError) as e:
+                    error = f"结果无法序列化: {type(e).__name__}: {e}"
+                    logger.error(f"[job_queue] 任务 {job_id} ({job['kind']}) {error}，进入死信")
+                    settled = self.store.fail(job_id, attempts, error, None)
+            else:
+                settled = self.store.fail(job_id, attempts, error, retry_at)
+        except Exception as e:
+            logger.error(f"[job_queue] 任务 {job_id} 结算失败: {e}", exc_info=True)
+            return
+        if not settled:
+            logger.warning(f"[job_queue] 任务 {job_id} 第 {attempts} 次执行的租约已失效，结果未写入")
+
+    def _renew(self, job_id: str, attempts: int, stop: threading.Event) -> None:
+        while not stop.wait(LEASE_RENEW_INTERVAL):
+            try:
+                if not self.store.renew(job_id, attempts, LEASE_SECONDS):
+                    return
+            except Exception as e:
+                logger.warning(f"[job_queue] 任务 {job_id} 租约续期失败: {e}")
+
+
+job_queue = JobQueue(job_store)
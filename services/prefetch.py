@@ -0,0 +1,150 @@
+"""
+周报预生成：周一凌晨为近期活跃的命主提前生成本周周报
+- 周日历每周一换新，换周后每个老用户第一次打开周报都要等完整生成；预生成把这次等待挪到低峰时段
+- 用户请求周报时 record_activity() 记录命主信息（db/prefetch_store.py），
+  超过 PREFETCH_ACTIVE_DAYS 天未再请求的记录在每周调度时删除
+- WeeklyPrefetcher 后台线程定期检查：本地时间为周一且处于 PREFETCH_HOURS 时段、本周尚未调度时，
+  取最近 PREFETCH_ACTIVE_DAYS 天内活跃的命主（最近活跃的优先，最多 PREFETCH_BUDGET 个），
+  以最低优先级向后台任务队列提交 prefetch_report 任务
+- 任务执行时以 caller=prefetch 调用模型（限流排队排在在线请求之后），结果按请求指纹入库；
+  本周内该命主首次打开周报（/analyze、/analyze/stream、/reports）时直接读库返回
+- 请求指纹包含本周日历与流月，换周或交节换月后旧结果自然不再命中
+
+配置（环境变量）：
+    PREFETCH_BUDGET       每周最多预生成的周报数，0 为关闭（默认）
+    PREFETCH_HOURS        周一的调度时段（本地时间，小时，左闭右开），默认 2-6
+    PREFETCH_ACTIVE_DAYS  多少天内请求过周报视为活跃，默认 14
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from db.prefetch_store import PrefetchStore, prefetch_store
+from schemas import BaziContext
+from services.job_queue import DEFAULT_PRIORITY, JobQueue, job_queue
+from services.stream_hub import request_key
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_KIND = "prefetch_report"
+# 排在所有在线提交的任务之后
+PREFETCH_PRIORITY = DEFAULT_PRIORITY + 5
+PREFETCH_CALLER = "prefetch"
+# 调度检查间隔（秒）
+CHECK_INTERVAL = 300.0
+
+
+def _parse_hours(spec: str) -> Tuple[int, int]:
+    start, _, end = spec.partition("-")
+    return int(start), int(end or int(start) + 1)
+
+
+def week_of(day: date) -> str:
+    """day 所在周的周一（YYYY-MM-DD）"""
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def report_key(context: BaziContext) -> str:
+    """与 /analyze/stream 报告任务相同的请求指纹"""
+    return request_key({"report": "weekly", **context.model_dump()})
+
+
+def owner_key(payload: Dict[str, Any]) -> str:
+    return request_key(payload)
+
+
+class WeeklyPrefetcher:
+    def __init__(self, queue: JobQueue, store: PrefetchStore) -> None:
+        self.queue = queue
+        self.store = store
+        self.budget = int(os.getenv("PREFETCH_BUDGET", "0"))
+        self.hours = _parse_hours(os.getenv("PREFETCH_HOURS", "2-6"))
+        self.active_days = float(os.getenv("PREFETCH_ACTIVE_DAYS", "14"))
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    def record_activity(self, payload: Dict[str, Any]) -> None:
+        """记录一次周报请求；失败只记录日志，不影响请求本身"""
+        if not self.enabled:
+            return
+        try:
+            self.store.touch(owner_key(payload), payload)
+        except Exception as e:
+            logger.warning(f"[prefetch] 记录活跃命主失败: {e}")
+
+    def lookup(self, context: BaziContext) -> Optional[str]:
+        """本周已预生成的周报（没有时返回 None）"""
+        if not self.enabled:
+            return None
+        try:
+            return self.store.get_report(report_key(context))
+        except Exception as e:
+            logger.warning(f"[prefetch] 读取预生成周报失败: {e}")
+            return None
+
+    def has_report(self, context: BaziContext) -> bool:
+        """本周是否已预生成（不计入读取次数）"""
+        return self.store.has_report(report_key(context))
+
+    def save(self, payload: Dict[str, Any], context: BaziContext, report: str) -> None:
+        self.store.put_report(report_key(context), week_of(date.today()), owner_key(payload), report)
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """到达调度时段且本周未调度时提交预生成任务，返回提交数"""
+        now = now or datetime.now()
+        start, end = self.hours
+        if now.weekday() != 0 or not start <= now.hour < end:
+            return 0
+        week = week_of(now.date())
+        if not self.store.claim_run(week):
+            return 0
+        try:
+            purged = self.store.purge_before(week)
+            since = time.time() - self.active_days * 86400
+            expired = self.store.purge_inactive(since)
+            owners = self.store.active_owners(since, self.budget)
+            for owner in owners:
+                self.queue.submit(PREFETCH_KIND, owner["payload"], PREFETCH_PRIORITY, max_attempts=2)
+            self.store.finish_run(week, len(owners))
+        except Exception:
+            # 撤销登记，下次检查时重新调度；已提交的任务执行时会跳过已生成的周报
+            self.store.release_run(week)
+            raise
+        logger.info(
+            f"[prefetch] {week} 提交 {len(owners)} 个周报预生成任务，清理上周结果 {purged} 条、不活跃命主 {expired} 个"
+        )
+        return len(owners)
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="weekly-prefetch", daemon=True)
+        self._thread.start()
+        logger.info(f"[prefetch] 已启动：每周一 {self.hours[0]}-{self.hours[1]} 时，最多 {self.budget} 个")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.warning(f"[prefetch] 调度失败: {e}")
+            if self._stopping.wait(CHECK_INTERVAL):
+                return
+
+
+# 模块级单例
+prefetcher = WeeklyPrefetcher(job_queue, prefetch_store)
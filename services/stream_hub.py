@@ -0,0 +1,282 @@
+"""
+流式输出中转（SSE）与报告生成任务
+- 生成任务在后台 asyncio 任务中运行，输出写入服务端缓冲区，与 HTTP 连接解耦：
+  客户端断开不会中断生成，重连时带 Last-Event-ID 即可从断点继续，不必重新付费生成
+- 每个流即一个任务（job），事件同时追加写入 SQLite（db/report_store.py）：
+  内存缓冲过期或进程重启后，仍可按任务 ID 回放已生成的内容
+- 相同请求（请求指纹一致）在生成期间合并到同一任务，不重复调用模型
+- 输出按大小或时间窗口合并（默认 256 字节 / 30ms 刷新一次），减少写次数与前端重渲染
+- 订阅方长时间没有新事件时发送心跳注释，防止代理或浏览器断开空闲连接
+
+事件格式：
+    id: <stream_id>:<seq>
+    event: start | delta | done | error
+    data: JSON（start: {"stream_id"}；delta: {"text"}；done: {"chars"}；error: {"message"}）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from db.report_store import ReportStore, report_store
+
+logger = logging.getLogger(__name__)
+
+# 合并窗口：缓冲超过该字节数或等待超过该秒数即刷新
+COALESCE_BYTES = 256
+COALESCE_DELAY = 0.03
+# 心跳间隔（秒）
+HEARTBEAT_INTERVAL = 15.0
+# 已结束的流在缓冲区中保留的时间（秒）与最多保留的流数量
+STREAM_TTL = 600.0
+MAX_STREAMS = 256
+
+Event = Tuple[int, str, dict]
+
+
+async def coalesce(
+        source: AsyncIterator[str],
+        max_bytes: int = COALESCE_BYTES,
+        max_delay: float = COALESCE_DELAY,
+) -> AsyncIterator[str]:
+    """
+    将细碎的增量合并后输出：缓冲达到 max_bytes，或首段进入缓冲后超过 max_delay 秒即刷新
+    等待上游时不会取消其 __anext__，上游停顿时已缓冲的内容也能按时刷新
+    """
+    it = source.__aiter__()
+    parts: List[str] = []
+    size = 0
+    deadline = 0.0
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            timeout = max(0.0, deadline - time.monotonic()) if parts else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield "".join(parts)
+                parts, size = [], 0
+                continue
+            task, pending = pending, None
+            try:
+                text = task.result()
+            except StopAsyncIteration:
+                break
+            if not text:
+                continue
+            if not parts:
+                deadline = time.monotonic() + max_delay
+            parts.append(text)
+            size += len(text.encode("utf-8"))
+            if size >= max_bytes:
+                yield "".join(parts)
+                parts, size = [], 0
+        if parts:
+            yield "".join(parts)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+def format_event(stream_id: str, seq: int, event: str, data: dict) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"id: {stream_id}:{seq}\nevent: {event}\ndata: {payload}\n\n"
+
+
+def request_key(payload: dict) -> str:
+    """请求指纹：内容相同的请求得到相同的 key"""
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], int]:
+    """解析 Last-Event-ID（<stream_id>:<seq>），无法解析时返回 (None, 0)"""
+    stream_id, _, seq = (value or "").strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None, 0
+    return stream_id, int(seq)
+
+
+class StreamBuffer:
+    """单个流的事件缓冲区（只在事件循环线程中访问）"""
+
+    def __init__(self, stream_id: str, key: Optional[str] = None) -> None:
+        self.stream_id = stream_id
+        self.key = key
+        self.events: List[Event] = []
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.persisted = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def append(self, event: str, data: dict) -> None:
+        self.events.append((len(self.events) + 1, event, data))
+        self._changed.set()
+
+    def finish(self, event: str, data: dict) -> None:
+        self.append(event, data)
+        self.finished_at = time.monotonic()
+
+    @property
+    def status(self) -> str:
+        if not self.finished:
+            return "running"
+        return "done" if self.events[-1][1] == "done" else "error"
+
+    def text(self) -> str:
+        return "".join(data["text"] for _, event, data in self.events if event == "delta")
+
+    async def wait(self, timeout: float) -> bool:
+        """等待新事件，超时返回 False"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+
+class StreamHub:
+    """进程内的流注册表：创建（或合并到）后台生成任务，按 ID 订阅、续传与回放"""
+
+    def __init__(self, store: Optional[ReportStore] = None) -> None:
+        self.store = store
+        self._streams: Dict[str, StreamBuffer] = {}
+        self._running: Dict[str, StreamBuffer] = {}
+
+    def get(self, stream_id: Optional[str]) -> Optional[StreamBuffer]:
+        return self._streams.get(stream_id) if stream_id else None
+
+    async def attach(self, stream_id: Optional[str]) -> Optional[StreamBuffer]:
+        """按 ID 取得流：优先内存缓冲，其次从任务库回放（只读快照）"""
+        buf = self.get(stream_id)
+        if buf is not None or not stream_id or self.store is None:
+            return buf
+        job = await asyncio.to_thread(self.store.get_job, stream_id)
+        if job is None:
+            return None
+        buf = StreamBuffer(stream_id, job["request_key"])
+        buf.events = await asyncio.to_thread(self.store.get_events, stream_id)
+        buf.persisted = len(buf.events)
+        if job["status"] != "running" and (not buf.events or buf.events[-1][1] not in ("done", "error")):
+            buf.events.append((len(buf.events) + 1, "error", {"message": job["error"] or job["status"]}))
+        buf.finished_at = time.monotonic()
+        return buf
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for sid, buf in list(self._streams.items()):
+            if buf.finished and now - buf.finished_at > STREAM_TTL:
+                del self._streams[sid]
+        finished = sorted((b for b in self._streams.values() if b.finished), key=lambda b: b.finished_at)
+        while len(self._streams) >= MAX_STREAMS and finished:
+            del self._streams[finished.pop(0).stream_id]
+
+    async def start(
+            self,
+            factory: Callable[[], AsyncIterator[str]],
+            key: Optional[str] = None,
+            on_finish: Optional[Callable[..., None]] = None,
+    ) -> Tuple[StreamBuffer, bool]:
+        """
+        启动后台生成：factory 返回文本增量的异步迭代器，输出经 coalesce 合并后写入缓冲区与任务库
+        key 相同且仍在生成中的任务直接复用；返回 (缓冲区, 是否合并到已有任务)
+        on_finish(status, error) 在生成结束时调用，可用于日志汇总
+        """
+        running = self._running.get(key) if key else None
+        if running is not None and not running.finished:
+            return running, True
+        self._evict()
+        buf = StreamBuffer(uuid.uuid4().hex, key)
+        self._streams[buf.stream_id] = buf
+        if key:
+            self._running[key] = buf
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.create_job, buf.stream_id, key or buf.stream_id)
+            except Exception as e:
+                logger.warning(f"[stream_hub] 任务 {buf.stream_id} 入库失败，仅保留内存缓冲: {e}")
+        buf.append("start", {"stream_id": buf.stream_id})
+        buf.task = asyncio.create_task(self._produce(buf, factory, on_finish))
+        return buf, False
+
+    async def _persist(self, buf: StreamBuffer) -> None:
+        """把尚未入库的事件追加写入任务库；失败只记录日志，不影响实时输出"""
+        if self.store is None or buf.persisted >= len(buf.events):
+            return
+        pending = buf.events[buf.persisted:]
+        try:
+            await asyncio.to_thread(self.store.append_events, buf.stream_id, pending)
+            buf.persisted += len(pending)
+        except Exception as e:
+            logger.warning(f"[stream_hub] 任务 {buf.stream_id} 事件入库失败: {e}")
+
+    async def _produce(self, buf: StreamBuffer, factory, on_finish) -> None:
+        chars = 0
+        status, error = "ok", None
+        try:
+            async for text in coalesce(factory()):
+                chars += len(text)
+                buf.append("delta", {"text": text})
+                await self._persist(buf)
+            buf.finish("done", {"chars": chars})
+        except asyncio.CancelledError as e:
+            status, error = "cancelled", e
+            buf.finish("error", {"message": "cancelled"})
+            raise
+        except Exception as e:
+            status, error = "error", e
+            logger.error(f"[stream_hub] {buf.stream_id} 生成失败: {e}", exc_info=True)
+            buf.finish("error", {"message": str(e)})
+        finally:
+            if buf.key and self._running.get(buf.key) is buf:
+                del self._running[buf.key]
+            await asyncio.shield(self._finish_job(buf, chars, error))
+            if on_finish is not None:
+                on_finish(status, error)
+
+    async def _finish_job(self, buf: StreamBuffer, chars: int, error: Optional[BaseException]) -> None:
+        await self._persist(buf)
+        if self.store is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self.store.finish_job, buf.stream_id, buf.status, chars, str(error) if error else None
+            )
+        except Exception as e:
+            logger.warning(f"[stream_hub] 任务 {buf.stream_id} 状态入库失败: {e}")
+
+    @staticmethod
+    async def follow(buf: StreamBuffer, after: int = 0) -> AsyncIterator[Optional[Event]]:
+        """依次产出 seq > after 的事件并跟随新事件，流结束后返回；空闲超过心跳间隔时产出 None"""
+        sent = after
+        while True:
+            while sent < len(buf.events):
+                event = buf.events[sent]
+                sent = event[0]
+                yield event
+            if buf.finished:
+                return
+            if not await buf.wait(HEARTBEAT_INTERVAL) and sent == len(buf.events):
+                yield None
+
+    @classmethod
+    async def subscribe(cls, buf: StreamBuffer, after: int = 0) -> AsyncIterator[str]:
+        """按 SSE 格式输出事件，空闲时发送心跳注释"""
+        async for item in cls.follow(buf, after):
+            if item is None:
+                yield ": heartbeat\n\n"
+            else:
+                seq, event, data = item
+                yield format_event(buf.stream_id, seq, event, data)
+
+
+hub = StreamHub(report_store)
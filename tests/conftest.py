@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 测试不调用真实模型；占位 key 仅用于通过客户端构造时的校验
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("LOG_FILE", "")
+
+
+class RecordingLease:
+    """记录结算值的限流凭证"""
+
+    def __init__(self, provider: str, model: str, tokens: int) -> None:
+        self.provider = provider
+        self.model = model
+        self.tokens = tokens
+        self.settled = []
+
+    def settle(self, actual_tokens):
+        self.settled.append(actual_tokens)
+
+
+@pytest.fixture
+def leases(monkeypatch):
+    """替换线路限流，返回本次测试发出的全部凭证"""
+    from utils import rate_limiter
+
+    issued = []
+
+    def acquire(provider, model, tokens, caller):
+        lease = RecordingLease(provider, model, tokens)
+        issued.append(lease)
+        return lease
+
+    async def aacquire(provider, model, tokens, caller):
+        return acquire(provider, model, tokens, caller)
+
+    monkeypatch.setattr(rate_limiter, "acquire", acquire)
+    monkeypatch.setattr(rate_limiter, "aacquire", aacquire)
+    return issued
+
+
+@pytest.fixture(autouse=True)
+def reset_health():
+    """各测试使用独立的线路健康度"""
+    from utils import llm_health
+
+    llm_health._registry.clear()
+    yield
+    llm_health._registry.clear()
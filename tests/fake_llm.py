@@ -0,0 +1,57 @@
+"""
+测试用的假模型：按预设 chunk 流式输出，可附带每个 chunk 的用量，也可在首个 chunk 前失败或延迟
+responses 非空时每次调用依次取用一组 chunk（用完后回到 chunks）；prompts 记录每次调用收到的消息
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+
+def usage(input_tokens: int, output_tokens: int) -> dict:
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+class FakeStreamingModel(BaseChatModel):
+    model_name: str = "fake"
+    chunks: List[Tuple[str, Optional[dict]]] = []
+    responses: List[List[Tuple[str, Optional[dict]]]] = Field(default_factory=list)
+    prompts: List[list] = Field(default_factory=list)
+    error: Optional[str] = None
+    delay: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _next(self, messages) -> List[Tuple[str, Optional[dict]]]:
+        self.calls += 1
+        self.prompts.append(list(messages))
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.responses.pop(0) if self.responses else self.chunks
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.delay)
+        chunks = self._next(messages)
+        meta = None
+        for _, chunk_usage in chunks:
+            if chunk_usage:
+                meta = {k: (meta or {}).get(k, 0) + v for k, v in chunk_usage.items()}
+        message = AIMessage(content="".join(text for text, _ in chunks), usage_metadata=meta)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.delay)
+        for text, chunk_usage in self._next(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=chunk_usage))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.delay)
+        for text, chunk_usage in self._next(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=chunk_usage))
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+import main
+from services.chat_service import MAX_MESSAGE_CHARS
+
+OWNER = {"name": "张三", "gender": "男", "birth_time": "1990-05-05 10:30:00", "birth_location": "浙江省/杭州市"}
+
+
+def test_sections_rejected_in_async_mode(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(main.job_queue, "submit", lambda *args, **kwargs: submitted.append(args) or "job")
+    client = TestClient(main.app)
+    response = client.post("/analyze?mode=async&sections=true", json=OWNER)
+    assert response.status_code == 400
+    assert "sections" in response.json()["error"]
+    assert submitted == []
+    assert client.post("/analyze?mode=async", json=OWNER).status_code == 202
+
+
+def test_invalid_chat_message_creates_no_session(monkeypatch):
+    created = []
+    monkeypatch.setattr(main.chat_service, "create_session", lambda owner: created.append(owner) or "session")
+    client = TestClient(main.app)
+    for message in ["  ", "问" * (MAX_MESSAGE_CHARS + 1)]:
+        response = client.post("/chat", json={"message": message, "owner": OWNER})
+        assert response.status_code == 400
+    assert created == []
@@ -0,0 +1,39 @@
+from utils.bazi_relations import (
+    BRANCH_GOD_MATRIX, HIDDEN_STEMS, TEN_GOD_NAMES, branch_ten_god, hidden_ten_gods, ten_god,
+)
+
+# 原大运十神算法（utils/cal_tools.py 中按五行拼接键查表），作为矩阵的对照
+GAN_WUXING = ["木", "木", "火", "火", "土", "土", "金", "金", "水", "水"]
+RELATION_NAMES = {
+    "木木": "比肩", "木木_": "劫财", "木火": "食神", "木火_": "伤官", "木土": "偏财", "木土_": "正财",
+    "木金": "七杀", "木金_": "正官", "木水": "偏印", "木水_": "正印", "火木": "偏印", "火木_": "正印",
+    "火火": "比肩", "火火_": "劫财", "火土": "食神", "火土_": "伤官", "火金": "偏财", "火金_": "正财",
+    "火水": "七杀", "火水_": "正官", "土木": "七杀", "土木_": "正官", "土火": "偏印", "土火_": "正印",
+    "土土": "比肩", "土土_": "劫财", "土金": "食神", "土金_": "伤官", "土水": "偏财", "土水_": "正财",
+    "金木": "偏财", "金木_": "正财", "金火": "七杀", "金火_": "正官", "金土": "偏印", "金土_": "正印",
+    "金金": "比肩", "金金_": "劫财", "金水": "食神", "金水_": "伤官", "水木": "食神", "水木_": "伤官",
+    "水火": "偏财", "水火_": "正财", "水土": "七杀", "水土_": "正官", "水金": "偏印", "水金_": "正印",
+    "水水": "比肩", "水水_": "劫财",
+}
+
+
+def _legacy_ten_god(day_gan: int, gan: int) -> str:
+    key = f"{GAN_WUXING[day_gan]}{GAN_WUXING[gan]}"
+    if day_gan % 2 != gan % 2:
+        key += "_"
+    return RELATION_NAMES[key]
+
+
+def test_ten_god_matrix_matches_legacy_table():
+    for day_gan in range(10):
+        for gan in range(10):
+            assert TEN_GOD_NAMES[ten_god(day_gan, gan)] == _legacy_ten_god(day_gan, gan), (day_gan, gan)
+
+
+def test_branch_gods_use_hidden_stems():
+    assert len(BRANCH_GOD_MATRIX) == 120
+    for day_gan in range(10):
+        for zhi in range(12):
+            gods = hidden_ten_gods(day_gan, zhi)
+            assert gods == tuple(ten_god(day_gan, g) for g in HIDDEN_STEMS[zhi])
+            assert branch_ten_god(day_gan, zhi) == gods[0]
@@ -0,0 +1,85 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.bazi_chart import pillars_from_tst
+from utils.bazi_reverse import find_birth_times
+from utils.ganzhi_index import MAX_YEAR, MIN_YEAR
+
+FMT = "%Y-%m-%d %H:%M"
+
+
+def _bazi(dt: datetime) -> str:
+    return " ".join(p.name for p in pillars_from_tst(dt))
+
+
+def _covering(windows, dt: datetime):
+    s = dt.strftime(FMT)
+    return [w for w in windows if w["start"] <= s < w["end"]]
+
+
+def _covers(windows, dt: datetime) -> bool:
+    return bool(_covering(windows, dt))
+
+
+def _assert_windows_exact(windows, bazi: str) -> None:
+    """每个窗口的首尾分钟都排出同一四柱"""
+    for w in windows:
+        start = datetime.strptime(w["start"], FMT)
+        last = datetime.strptime(w["end"], FMT) - timedelta(minutes=1)
+        assert _bazi(start) == bazi, w
+        assert _bazi(last) == bazi, w
+
+
+def test_january_before_lichun_in_range():
+    # 2000-01-15 仍属己卯年（1999 干支年），按公历年份应落在 2000-2010 内
+    assert find_birth_times("己卯 丁丑 壬申 乙巳", 2000, 2010) == [
+        {"start": "2000-01-15 09:00", "end": "2000-01-15 11:00", "day": "2000-01-15"}
+    ]
+
+
+@pytest.mark.parametrize("dt", [
+    datetime(2000, 1, 15, 9, 30),      # 立春前，干支年为上一年
+    datetime(1984, 2, 3, 12, 0),       # 立春前一天
+    datetime(1999, 12, 31, 23, 30),    # 早子时，日柱落在次年 1 月 1 日
+    datetime(2000, 1, 1, 0, 30),       # 子时后半段
+    datetime(2000, 12, 31, 23, 10),
+    datetime(MIN_YEAR + 1, 1, 1, 0, 10),
+    datetime(MAX_YEAR, 12, 31, 22, 0),
+])
+def test_boundary_round_trip(dt):
+    bazi = _bazi(dt)
+    windows = find_birth_times(bazi, dt.year, dt.year)
+    assert _covers(windows, dt)
+    _assert_windows_exact(windows, bazi)
+    for w in windows:
+        assert w["start"][:4] == str(dt.year)
+
+
+def test_year_range_excludes_neighbouring_years():
+    # 1999-12-31 23:30 的早子时不属于 2000 年
+    bazi = _bazi(datetime(1999, 12, 31, 23, 30))
+    assert not _covers(find_birth_times(bazi, 2000, 2000), datetime(1999, 12, 31, 23, 30))
+    assert _covers(find_birth_times(bazi, 1999, 1999), datetime(1999, 12, 31, 23, 30))
+
+
+def test_random_round_trip():
+    rng = random.Random(3)
+    span = (datetime(MAX_YEAR, 12, 31) - datetime(MIN_YEAR + 1, 1, 1)).days * 24 * 60
+    for _ in range(3000):
+        dt = datetime(MIN_YEAR + 1, 1, 1) + timedelta(minutes=rng.randrange(span))
+        bazi = _bazi(dt)
+        covering = _covering(find_birth_times(bazi), dt)
+        assert covering, (dt, bazi)
+        _assert_windows_exact(covering, bazi)
+        assert _covers(find_birth_times(bazi, dt.year, dt.year), dt), (dt, bazi)
+
+
+def test_invalid_pillars():
+    # 时干与日干不符（五鼠遁）时无解
+    assert find_birth_times("辛巳 庚子 庚辰 甲午") == []
+    with pytest.raises(ValueError):
+        find_birth_times("辛巳 庚子 庚辰")
+    with pytest.raises(ValueError):
+        find_birth_times("辛巳 庚子 庚辰 壬午", 2000, 1990)
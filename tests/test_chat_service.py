@@ -0,0 +1,62 @@
+import asyncio
+
+from agents.chat_agent import ChatAgent
+from db.chat_store import ChatStore
+from db.natal_store import NatalStore
+from fake_llm import FakeStreamingModel
+from schemas import BaziContext, UserInput
+from services import chat_service as chat_module
+from services.chat_service import ChatService
+from utils.llm_router import LLMRouter
+
+OWNER = UserInput(name="张三", gender="男", birth_time="1990-05-05 10:30:00", birth_location="浙江省/杭州市")
+
+
+class WeeklyBuilder:
+    """按当前周返回不同日历的排盘器"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.builds = 0
+
+    def build_context(self, owner):
+        self.builds += 1
+        return BaziContext(
+            nowtime="丙午年戊戌月", calendar=f"周一 {self.clock['week']}", name=owner.name, gender=owner.gender,
+            isTai="否", birth_correct="1990年5月5日10:30", city="杭州", bazi="庚午 庚辰 庚午 辛巳",
+            dayun_time="0岁 1990年 辛巳 劫财", qiyun_time="出生后0年2月20日 上大运", jiaoyun_time="1990年7月交大运",
+        )
+
+
+def _reply(service, session_id, message):
+    async def run():
+        return "".join([chunk async for chunk in service.stream_reply(session_id, message)])
+    return asyncio.run(run())
+
+
+def test_context_rerendered_after_week_rollover(tmp_path, monkeypatch):
+    clock = {"week": "2026-10-12"}
+    monkeypatch.setattr(chat_module, "week_of", lambda day: clock["week"])
+    monkeypatch.setattr(chat_module, "natal_store", NatalStore(str(tmp_path / "natal.sqlite3")))
+    model = FakeStreamingModel(chunks=[("好的", None)])
+    builder = WeeklyBuilder(clock)
+    service = ChatService(
+        ChatStore(str(tmp_path / "chat.sqlite3")), ChatAgent(router=LLMRouter(routes=[model])), builder,
+    )
+
+    session_id = service.create_session(OWNER)
+    assert _reply(service, session_id, "本周如何") == "好的"
+    assert builder.builds == 1
+    assert "2026-10-12" in model.prompts[-1][1].content
+
+    clock["week"] = "2026-10-19"
+    _reply(service, session_id, "这周呢")
+    assert builder.builds == 2
+    human = model.prompts[-1][1].content
+    assert "2026-10-19" in human and "2026-10-12" not in human
+    session = service.store.get_session(session_id)
+    assert session["week"] == "2026-10-19"
+    # 对话记录保留，同一周内不再重新排盘
+    assert len(service.history(session_id)["messages"]) == 4
+    _reply(service, session_id, "还有呢")
+    assert builder.builds == 2
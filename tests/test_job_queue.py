@@ -0,0 +1,71 @@
+import sqlite3
+import time
+
+from db.job_store import JobStore
+from services.job_queue import JobQueue
+
+
+def _wait(store, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    return store.get(job_id)
+
+
+def test_unserializable_result_does_not_kill_worker(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    queue = JobQueue(store, workers=1)
+    queue.register("bad", lambda payload: {"value": object()})
+    queue.register("ok", lambda payload: {"value": payload["n"]})
+    queue.start()
+    try:
+        bad = queue.submit("bad", {})
+        ok = queue.submit("ok", {"n": 1})
+        job = _wait(store, bad, ("dead",))
+        assert job["status"] == "dead"
+        assert "无法序列化" in job["error"]
+        assert _wait(store, ok, ("done",))["result"] == {"value": 1}
+        assert all(thread.is_alive() for thread in queue._threads)
+    finally:
+        queue.stop()
+
+
+def test_store_error_while_settling_keeps_worker_alive(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    queue = JobQueue(store, workers=1)
+    queue.register("ok", lambda payload: payload)
+    complete = store.complete
+    calls = []
+
+    def flaky_complete(job_id, attempts, result):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return complete(job_id, attempts, result)
+
+    monkeypatch.setattr(store, "complete", flaky_complete)
+    queue.start()
+    try:
+        queue.submit("ok", {"n": 1})
+        second = queue.submit("ok", {"n": 2})
+        assert _wait(store, second, ("done",))["status"] == "done"
+        assert all(thread.is_alive() for thread in queue._threads)
+    finally:
+        queue.stop()
+
+
+def test_stale_worker_cannot_overwrite_reclaimed_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.submit("ok", {})
+    first = store.claim(lease_seconds=-1)
+    # 租约已过期，被另一执行方重新认领
+    second = store.claim(lease_seconds=60)
+    assert (first["attempts"], second["attempts"]) == (1, 2)
+    assert not store.complete(job_id, first["attempts"], {"from": "stale"})
+    assert not store.fail(job_id, first["attempts"], "stale", None)
+    assert store.complete(job_id, second["attempts"], {"from": "current"})
+    job = store.get(job_id)
+    assert (job["status"], job["result"]) == ("done", {"from": "current"})
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from fake_llm import FakeStreamingModel
+from utils.llm_router import LLMRouter
+
+
+def test_slow_prepare_does_not_block_event_loop(leases, monkeypatch):
+    # 模拟 Gemini 上下文缓存未命中时 _prepare 内的同步网络调用
+    def slow_prepare(self, binding, msgs, llm):
+        time.sleep(0.3)
+        return llm, msgs
+
+    monkeypatch.setattr(LLMRouter, "_prepare", slow_prepare)
+    router = LLMRouter(routes=[FakeStreamingModel(chunks=[("好", None)])])
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        text = "".join([chunk async for chunk in router.astream("问")])
+        task.cancel()
+        return text, ticks
+
+    text, ticks = asyncio.run(run())
+    assert text == "好"
+    assert ticks >= 10
+
+
+class RecordingSpan:
+    def __init__(self):
+        self.attributes = {}
+        self.ended = False
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def error(self, exc):
+        self.attributes["error"] = repr(exc)
+
+    def end(self):
+        self.ended = True
+
+
+def test_span_ends_when_cancelled_while_rate_limited(monkeypatch):
+    from utils import llm_router
+
+    spans = []
+
+    def start_span(name, **attributes):
+        spans.append(RecordingSpan())
+        return spans[-1]
+
+    async def aacquire(provider, model, tokens, caller):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(llm_router.tracing, "start_span", start_span)
+    monkeypatch.setattr(llm_router.rate_limiter, "aacquire", aacquire)
+    router = LLMRouter(routes=[FakeStreamingModel(chunks=[("好", None)])])
+
+    async def run():
+        task = asyncio.create_task(router._aopen(router._current(), [("user", "问")], 10, "test"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert len(spans) == 1
+    assert spans[0].ended
+    assert spans[0].attributes["llm.cancelled"] is True
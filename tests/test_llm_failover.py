@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+import pytest
+
+from fake_llm import FakeStreamingModel, usage
+from utils.llm_health import get_health
+from utils.llm_router import LLMRouter
+
+
+def _model(name, text="", error=None, delay=0.0):
+    return FakeStreamingModel(model_name=name, chunks=[(text, None), ("", usage(10, 5))], error=error, delay=delay)
+
+
+def _collect(agen):
+    async def run():
+        return "".join([chunk async for chunk in agen])
+    return asyncio.run(run())
+
+
+def test_invoke_fails_over(leases):
+    bad, good = _model("bad", error="boom"), _model("good", "备用")
+    router = LLMRouter(routes=[bad, good], hedge=False)
+    assert router.invoke("问") == "备用"
+    assert (bad.calls, good.calls) == (1, 1)
+    assert get_health("fake", "bad").consecutive_failures == 1
+
+
+def test_invoke_raises_when_all_routes_fail(leases):
+    router = LLMRouter(routes=[_model("a", error="a down"), _model("b", error="b down")], hedge=False)
+    with pytest.raises(RuntimeError, match="b down"):
+        router.invoke("问")
+
+
+def test_unhealthy_route_is_tried_last(leases):
+    bad, good = _model("bad", error="boom"), _model("good", "备用")
+    router = LLMRouter(routes=[bad, good], hedge=False)
+    for _ in range(5):
+        router.invoke("问")
+    assert not get_health("fake", "bad").healthy
+    assert router.invoke("问") == "备用"
+    # 冷却中的线路排到最后，不再每次先失败一遍
+    assert bad.calls < 6
+
+
+def test_stream_fails_over_before_first_chunk(leases):
+    bad, good = _model("bad", error="boom"), _model("good", "备用")
+    router = LLMRouter(routes=[bad, good], hedge=False)
+    assert "".join(router.stream("问")) == "备用"
+    assert (bad.calls, good.calls) == (1, 1)
+
+
+def test_astream_fails_over_before_first_chunk(leases):
+    bad, good = _model("bad", error="boom"), _model("good", "备用")
+    router = LLMRouter(routes=[bad, good], hedge=False)
+    assert _collect(router.astream("问")) == "备用"
+    assert (bad.calls, good.calls) == (1, 1)
+
+
+def test_hedged_invoke_takes_faster_route(leases):
+    slow, fast = _model("slow", "主", delay=0.5), _model("fast", "对冲")
+    router = LLMRouter(routes=[slow, fast], hedge=True, hedge_after=0.05)
+    start = time.monotonic()
+    assert router.invoke("问") == "对冲"
+    assert time.monotonic() - start < 0.4
+    assert fast.calls == 1
+    # 落后的请求不会被中断，完成后仍更新健康度
+    deadline = time.monotonic() + 2.0
+    while get_health("fake", "slow").latency_ewma is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert get_health("fake", "slow").latency_ewma is not None
+
+
+def test_hedged_invoke_fails_over(leases):
+    bad, good = _model("bad", error="boom"), _model("good", "备用")
+    router = LLMRouter(routes=[bad, good], hedge=True, hedge_after=5.0)
+    assert router.invoke("问") == "备用"
+
+
+def test_hedged_astream_takes_faster_route(leases):
+    slow, fast = _model("slow", "主", delay=1.0), _model("fast", "对冲")
+    router = LLMRouter(routes=[slow, fast], hedge=True, hedge_after=0.05)
+    start = time.monotonic()
+    assert _collect(router.astream("问")) == "对冲"
+    assert time.monotonic() - start < 0.8
+
+
+def test_hedged_astream_fails_over(leases):
+    bad, good = _model("bad", error="boom"), _model("good", "备用")
+    router = LLMRouter(routes=[bad, good], hedge=True, hedge_after=5.0)
+    assert _collect(router.astream("问")) == "备用"
+
+
+def test_fallback_route_without_client_is_skipped(monkeypatch):
+    from utils import llm_pool
+
+    build = llm_pool._build_chat_client
+
+    def build_client(provider, *args):
+        if provider == "gemini":
+            raise ValueError("missing api key")
+        return build(provider, *args)
+
+    monkeypatch.setattr(llm_pool, "_build_chat_client", build_client)
+    monkeypatch.setenv("LLM_FALLBACK_ROUTES", "gemini:gemini-test,unknown")
+    router = LLMRouter(provider="deepseek", model="deepseek-test")
+    assert [(b.provider, b.model) for b in router._bindings] == [("deepseek", "deepseek-test")]
+    health = get_health("gemini", "gemini-test")
+    assert not health.healthy
+    assert health.snapshot()["unavailable"] == "missing api key"
+
+
+@pytest.mark.parametrize("mode", ["invoke", "stream", "astream"])
+def test_failed_attempt_refunds_lease(leases, mode):
+    router = LLMRouter(routes=[_model("bad", error="boom"), _model("good", "备用")], hedge=False)
+    if mode == "invoke":
+        router.invoke("问")
+    elif mode == "stream":
+        "".join(router.stream("问"))
+    else:
+        _collect(router.astream("问"))
+    assert [(lease.model, lease.settled) for lease in leases] == [("bad", [0]), ("good", [15])]
+
+
+def test_hedged_astream_settles_every_lease(leases):
+    router = LLMRouter(routes=[_model("slow", "主", delay=0.3), _model("fast", "对冲")], hedge=True, hedge_after=0.05)
+    _collect(router.astream("问"))
+    # 落败的慢线路在首 token 前被取消，退回预扣
+    assert sorted((lease.model, lease.settled) for lease in leases) == [("fast", [15]), ("slow", [0])]
+
+
+class _BrokenStream:
+    """首个 chunk 前失败的底层流，记录是否被关闭"""
+
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raise RuntimeError("connection reset")
+
+    def close(self):
+        self.closed = True
+
+
+class _BrokenModel:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def stream(self, messages):
+        return self._stream
+
+
+def test_stream_closes_failed_route(leases, monkeypatch):
+    bad, good = _model("bad"), _model("good", "备用")
+    broken = _BrokenStream()
+    prepare = LLMRouter._prepare
+
+    def fake_prepare(self, binding, msgs, llm):
+        if binding.model == "bad":
+            return _BrokenModel(broken), msgs
+        return prepare(self, binding, msgs, llm)
+
+    monkeypatch.setattr(LLMRouter, "_prepare", fake_prepare)
+    router = LLMRouter(routes=[bad, good], hedge=False)
+    assert "".join(router.stream("问")) == "备用"
+    assert broken.closed
@@ -0,0 +1,48 @@
+import asyncio
+
+from fake_llm import FakeStreamingModel, usage
+from utils.llm_router import LLMRouter
+
+# Gemini 式：每个 chunk 携带本段的增量用量；首个 chunk 只有用量没有文本
+GEMINI_CHUNKS = [("", usage(100, 0)), ("甲", usage(0, 3)), ("乙", usage(0, 4)), ("丙", usage(0, 5))]
+# OpenAI 兼容式：只有末尾 chunk 携带整次用量
+OPENAI_CHUNKS = [("甲", None), ("乙", None), ("", usage(100, 12))]
+
+
+def _router(chunks):
+    return LLMRouter(routes=[FakeStreamingModel(chunks=chunks)])
+
+
+def _collect(agen):
+    async def run():
+        return [chunk async for chunk in agen]
+    return asyncio.run(run())
+
+
+def test_stream_sums_per_chunk_usage(leases):
+    assert "".join(_router(GEMINI_CHUNKS).stream("问")) == "甲乙丙"
+    assert leases[-1].settled == [112]
+
+
+def test_astream_sums_per_chunk_usage(leases):
+    assert "".join(_collect(_router(GEMINI_CHUNKS).astream("问"))) == "甲乙丙"
+    assert leases[-1].settled == [112]
+
+
+def test_final_chunk_usage(leases):
+    assert "".join(_router(OPENAI_CHUNKS).stream("问")) == "甲乙"
+    assert "".join(_collect(_router(OPENAI_CHUNKS).astream("问"))) == "甲乙"
+    assert [lease.settled for lease in leases] == [[112], [112]]
+
+
+def test_stream_usage_reaches_metrics(leases, monkeypatch):
+    from utils import metrics
+
+    recorded = []
+    monkeypatch.setattr(metrics, "record_llm_call", lambda *args, **kwargs: recorded.append(args))
+    list(_router(GEMINI_CHUNKS).stream("问"))
+    _collect(_router(GEMINI_CHUNKS).astream("问"))
+    assert len(recorded) == 2
+    for args in recorded:
+        assert args[3] == "ok"
+        assert args[5] == {"input": 100, "output": 12, "total": 112, "cached": 0}
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from db.prefetch_store import PrefetchStore
+from services.prefetch import PREFETCH_KIND, WeeklyPrefetcher
+
+MONDAY_NIGHT = datetime(2026, 10, 19, 3, 0)
+
+
+class RecordingQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, kind, payload, priority, max_attempts=1):
+        self.jobs.append((kind, payload))
+
+
+def _prefetcher(tmp_path, monkeypatch):
+    monkeypatch.setenv("PREFETCH_BUDGET", "10")
+    monkeypatch.setenv("PREFETCH_ACTIVE_DAYS", "14")
+    store = PrefetchStore(str(tmp_path / "prefetch.sqlite3"))
+    return WeeklyPrefetcher(RecordingQueue(), store), store
+
+
+def test_weekly_run_drops_inactive_owners(tmp_path, monkeypatch):
+    prefetcher, store = _prefetcher(tmp_path, monkeypatch)
+    store.touch("recent", {"name": "recent"})
+    store.touch("stale", {"name": "stale"})
+    store.conn.execute("UPDATE owner_activity SET last_seen=? WHERE owner_key='stale'", (time.time() - 30 * 86400,))
+    store.conn.commit()
+
+    assert prefetcher.tick(MONDAY_NIGHT) == 1
+    assert prefetcher.queue.jobs == [(PREFETCH_KIND, {"name": "recent"})]
+    keys = [row[0] for row in store.conn.execute("SELECT owner_key FROM owner_activity")]
+    assert keys == ["recent"]
+    # 同一周只调度一次
+    assert prefetcher.tick(MONDAY_NIGHT) == 0
+
+
+def test_has_report_does_not_count_as_served(tmp_path, monkeypatch):
+    _, store = _prefetcher(tmp_path, monkeypatch)
+    store.put_report("key", "2026-10-19", "owner", "周报")
+    assert store.has_report("key")
+    assert store.stats("2026-10-19")["served"] == 0
+    assert store.get_report("key") == "周报"
+    assert store.stats("2026-10-19")["served"] == 1
+
+
+def test_failed_submission_releases_the_week(tmp_path, monkeypatch):
+    prefetcher, store = _prefetcher(tmp_path, monkeypatch)
+    store.touch("owner", {"name": "owner"})
+    submit = prefetcher.queue.submit
+
+    def broken_submit(*args, **kwargs):
+        raise RuntimeError("queue down")
+
+    monkeypatch.setattr(prefetcher.queue, "submit", broken_submit)
+    with pytest.raises(RuntimeError):
+        prefetcher.tick(MONDAY_NIGHT)
+
+    monkeypatch.setattr(prefetcher.queue, "submit", submit)
+    assert prefetcher.tick(MONDAY_NIGHT) == 1
+
+
+def test_prefetch_kind_not_accepted_by_jobs_api():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    assert PREFETCH_KIND in main.job_queue.kinds
+    response = TestClient(main.app).post("/jobs", json={"kind": PREFETCH_KIND, "payload": {}})
+    assert response.status_code == 400
@@ -0,0 +1,18 @@
+from utils.rate_limiter import RateLimiter
+
+
+def test_failed_call_refunds_reservation_once():
+    limiter = RateLimiter("test", None, 1000, ["stream", "default"])
+    lease = limiter.acquire(400, "default")
+    assert limiter.snapshot()["tpm_available"] == 600
+    lease.settle(0)
+    assert limiter.snapshot()["tpm_available"] == 1000
+    # 重复结算（如失败路径与收尾各调用一次）不会多退
+    lease.settle(0)
+    assert limiter.snapshot()["tpm_available"] == 1000
+
+
+def test_unknown_usage_keeps_reservation():
+    limiter = RateLimiter("test", None, 1000, ["default"])
+    limiter.acquire(400, "default").settle(None)
+    assert limiter.snapshot()["tpm_available"] == 600
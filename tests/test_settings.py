@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+import yaml
+from fastapi.testclient import TestClient
+
+from utils import settings_manager
+
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    path = tmp_path / "settings.yaml"
+    monkeypatch.setattr(settings_manager, "SETTINGS_FILE", path)
+    monkeypatch.setattr(settings_manager, "_raw", {})
+    monkeypatch.setattr(settings_manager, "_signature", None)
+    monkeypatch.setattr(settings_manager, "_version", 0)
+    return path
+
+
+def test_saving_a_key_keeps_provider_unset(settings_file, monkeypatch):
+    import main
+
+    monkeypatch.delenv("LLM_PROVIDER", raising=False)
+    settings_file.write_text(yaml.safe_dump({"gemini_api_key": "g"}), encoding="utf-8")
+    assert settings_manager.get_llm_provider() is None
+
+    response = TestClient(main.app).post("/settings", json={"deepseek_api_key": "d"})
+    assert response.status_code == 200
+    assert yaml.safe_load(settings_file.read_text(encoding="utf-8")) == {"gemini_api_key": "g", "deepseek_api_key": "d"}
+    assert settings_manager.get_llm_provider() is None
+
+
+def test_concurrent_updates_do_not_lose_fields(settings_file):
+    threads = [
+        threading.Thread(target=settings_manager.update_settings, args=({f"key_{i}": i},)) for i in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert yaml.safe_load(settings_file.read_text(encoding="utf-8")) == {f"key_{i}": i for i in range(20)}
+    assert [p.name for p in settings_file.parent.iterdir()] == ["settings.yaml"]
+
+
+def test_listener_errors_are_logged(settings_file, caplog, monkeypatch):
+    def broken(settings):
+        raise RuntimeError("listener down")
+
+    monkeypatch.setattr(settings_manager, "_listeners", [broken])
+    settings_manager.update_settings({"llm_provider": "deepseek"})
+    assert "listener down" in caplog.text
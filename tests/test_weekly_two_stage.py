@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from agents import weekly_fortune_agent as weekly
+from agents.weekly_fortune_agent import WeeklyFortuneAgent, natal_key
+from db.natal_store import NatalStore
+from fake_llm import FakeStreamingModel
+from schemas import BaziContext
+from utils.llm_router import LLMRouter
+
+CONTEXT = BaziContext(
+    nowtime="丙午年戊戌月",
+    calendar="\n".join(f"周{d} {gz}日 10月{19 + i}日" for i, (d, gz) in enumerate(zip("一二三四五六日", ["丙寅", "丁卯", "戊辰", "己巳", "庚午", "辛未", "壬申"]))),
+    name="张三",
+    gender="男",
+    isTai="否",
+    birth_correct="1990年5月5日10:30 庚午年四月十一巳时",
+    city="杭州",
+    bazi="庚午 庚辰 庚午 辛巳",
+    dayun_time="0岁 1990年 辛巳 劫财 -> 10岁 2000年 壬午 食神",
+    qiyun_time="出生后0年2月20日 上大运",
+    jiaoyun_time="1990年7月交大运",
+)
+NATAL = [("#### **命盘解读**\n\n", None), ("* **日主:** 庚金", None)]
+WEEKLY = [("#### **流日分析**\n\n", None), ("本周平稳", None)]
+HEAD = "### **张三专属五行能量周报（10月19日 - 10月25日）**"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = NatalStore(str(tmp_path / "natal.sqlite3"))
+    monkeypatch.setattr(weekly, "natal_store", store)
+    monkeypatch.setattr(weekly, "two_stage", True)
+    return store
+
+
+def _agent(*responses):
+    model = FakeStreamingModel(responses=[list(r) for r in responses])
+    return WeeklyFortuneAgent(router=LLMRouter(routes=[model])), model
+
+
+def _collect(agen):
+    async def run():
+        return "".join([chunk async for chunk in agen])
+    return asyncio.run(run())
+
+
+def test_first_report_streams_natal_and_caches(store):
+    agent, model = _agent(NATAL, WEEKLY)
+    report = _collect(agent.astream_report(CONTEXT))
+    assert report == f"{HEAD}\n\n---\n\n#### **命盘解读**\n\n* **日主:** 庚金\n\n---\n\n#### **流日分析**\n\n本周平稳"
+    assert store.get(natal_key(CONTEXT)) == "#### **命盘解读**\n\n* **日主:** 庚金"
+    assert model.calls == 2
+
+
+def test_cached_natal_is_spliced_not_regenerated(store):
+    store.put(natal_key(CONTEXT), "#### **命盘解读**\n\n* **日主:** 庚金")
+    agent, model = _agent(WEEKLY)
+    report = _collect(agent.astream_report(CONTEXT))
+    assert report.startswith(f"{HEAD}\n\n---\n\n#### **命盘解读**")
+    assert report.endswith("#### **流日分析**\n\n本周平稳")
+    assert model.calls == 1
+    system, human = model.prompts[0]
+    # 周报只写流日分析之后的部分：不带命盘解读的推演规则，也不带完整大运
+    assert "命盘格局" not in system.content
+    assert "* **日主:** 庚金" in human.content
+    assert CONTEXT.dayun_time not in human.content
+
+
+def test_generate_report_splices_summary(store):
+    store.put(natal_key(CONTEXT), "#### **命盘解读**\n\n* **日主:** 庚金")
+    agent, _ = _agent(WEEKLY)
+    assert agent.generate_report(CONTEXT) == (
+        f"{HEAD}\n\n---\n\n#### **命盘解读**\n\n* **日主:** 庚金\n\n---\n\n#### **流日分析**\n\n本周平稳"
+    )
+
+
+def test_natal_failure_falls_back_to_single_stage(store, monkeypatch):
+    agent, model = _agent([("", None)], WEEKLY)
+    report = _collect(agent.astream_report(CONTEXT))
+    assert report == "#### **流日分析**\n\n本周平稳"
+    assert store.get(natal_key(CONTEXT)) is None
+    # 单阶段：完整命盘信息与原系统提示词
+    system, human = model.prompts[1]
+    assert system.content == weekly.system_prompt
+    assert CONTEXT.dayun_time in human.content
+
+
+def test_concurrent_natal_summary_generates_once(store):
+    from concurrent.futures import ThreadPoolExecutor
+
+    model = FakeStreamingModel(chunks=NATAL, delay=0.05)
+    agent = WeeklyFortuneAgent(router=LLMRouter(routes=[model]))
+    with ThreadPoolExecutor(8) as pool:
+        summaries = list(pool.map(lambda _: agent.natal_summary(CONTEXT), range(8)))
+    assert set(summaries) == {"#### **命盘解读**\n\n* **日主:** 庚金"}
+    assert model.calls == 1
+    assert agent._natal_locks == {}
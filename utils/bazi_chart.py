@@ -0,0 +1,463 @@
+import sys
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+import sxtwl
+
+from utils.bazi_relations import (
+    ELEMENT_NAMES, HIDDEN_STEMS, SEXAGENARY_BRANCH_GODS, SEXAGENARY_STEM_GODS, TEN_GOD_NAMES,
+    element_counts, hidden_ten_gods, ten_god, year_cycle
+)
+
+"""
+惰性命盘（紧凑模型）
+
+BaziChart 只保存出生时间、性别与城市，各部分在首次访问时才计算并缓存：
+    true_solar_time  真太阳时（需要查询经度）
+    pillars          四柱
+    birth_lunar      出生时刻的农历数据
+    qiyun / jiaoyun  起运、交运（需要向前/向后查找节气）
+    dayun_list       十步大运及十神
+    liunian          十步大运下逐年的流年干支及十神（共 100 年）
+只需要四柱的调用方（如 /calc_bazi）不会触发节气查找、大运与农历计算。
+
+所有对象都使用 __slots__；天干、地支、十神只存整数下标，干支柱是 60 个共享实例，
+显示用的字符串全部预先生成并驻留（sys.intern），只在输出边缘渲染：
+    to_dict(parts)         接口 JSON，parts 取值见 CHART_PARTS
+        pillars  bazi / year / month / day / hour / true_solar_time
+        lunar    lunar（农历显示字符串）
+        luck     dayun / qiyun / jiaoyun
+        relations  四柱十神、地支藏干十神与五行个数（查表见 utils/bazi_relations.py）
+        liunian  每步大运及其下十个流年
+    render_dayun_info()    BaziEngine.calculate_dayun 的旧版嵌套字典
+"""
+
+CHART_PARTS = ("pillars", "lunar", "luck", "relations", "liunian")
+
+TIAN_GAN = tuple(sys.intern(s) for s in "甲乙丙丁戊己庚辛壬癸")
+DI_ZHI = tuple(sys.intern(s) for s in "子丑寅卯辰巳午未申酉戌亥")
+LUNAR_MONTH_NAMES = tuple(sys.intern(s) for s in (
+    "正月", "二月", "三月", "四月", "五月", "六月", "七月", "八月", "九月", "十月", "冬月", "腊月"
+))
+LUNAR_DAY_NAMES = tuple(sys.intern(s) for s in (
+    "初一", "初二", "初三", "初四", "初五", "初六", "初七", "初八", "初九", "初十",
+    "十一", "十二", "十三", "十四", "十五", "十六", "十七", "十八", "十九", "二十",
+    "廿一", "廿二", "廿三", "廿四", "廿五", "廿六", "廿七", "廿八", "廿九", "三十"
+))
+
+# "节"的索引: 立春(3), 惊蛰(5), 清明(7), 立夏(9), 芒种(11), 小暑(13), 立秋(15), 白露(17), 寒露(19), 立冬(21), 大雪(23), 小寒(1)
+JIE_INDEXES = frozenset({1, 3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23})
+
+
+class Pillar:
+    """干支柱（不可变，全部 60 个实例共享，通过 pillar(gan, zhi) 取得）"""
+    __slots__ = ("gan", "zhi", "name")
+
+    def __init__(self, gan: int, zhi: int):
+        self.gan = gan
+        self.zhi = zhi
+        self.name = sys.intern(TIAN_GAN[gan] + DI_ZHI[zhi])
+
+    @property
+    def gan_name(self) -> str:
+        return TIAN_GAN[self.gan]
+
+    @property
+    def zhi_name(self) -> str:
+        return DI_ZHI[self.zhi]
+
+    def __repr__(self) -> str:
+        return f"Pillar({self.name})"
+
+
+_PILLARS = tuple(tuple(Pillar(g, z) if g % 2 == z % 2 else None for z in range(12)) for g in range(10))
+
+
+def pillar(gan: int, zhi: int) -> Pillar:
+    return _PILLARS[gan % 10][zhi % 12]
+
+
+# 六十甲子下标 -> 干支柱
+SEXAGENARY = tuple(pillar(i % 10, i % 12) for i in range(60))
+PILLAR_BY_NAME = {p.name: p for p in SEXAGENARY}
+
+
+def pillars_from_tst(true_solar_time: datetime) -> Tuple[Pillar, Pillar, Pillar, Pillar]:
+    """
+    核心排盘逻辑：根据真太阳时计算四柱 (已修正早子时问题)。
+    """
+    day_pillar_dt = true_solar_time
+    if true_solar_time.hour == 23:
+        day_pillar_dt = true_solar_time + timedelta(days=1)
+
+    day_for_year_month = sxtwl.fromSolar(true_solar_time.year, true_solar_time.month, true_solar_time.day)
+    day_for_day = sxtwl.fromSolar(day_pillar_dt.year, day_pillar_dt.month, day_pillar_dt.day)
+
+    year_gz = day_for_year_month.getYearGZ()
+    month_gz = day_for_year_month.getMonthGZ()
+    day_gz = day_for_day.getDayGZ()
+
+    hour_zhi = (true_solar_time.hour + 1) // 2 % 12
+    hour_gan = (day_gz.tg % 5 * 2 + hour_zhi) % 10
+
+    return (
+        pillar(year_gz.tg, year_gz.dz),
+        pillar(month_gz.tg, month_gz.dz),
+        pillar(day_gz.tg, day_gz.dz),
+        pillar(hour_gan, hour_zhi),
+    )
+
+
+class LunarDate:
+    """农历日期与时辰"""
+    __slots__ = ("year", "month", "day", "is_leap", "hour_zhi", "year_pillar")
+
+    def __init__(self, dt: datetime):
+        day = sxtwl.fromSolar(dt.year, dt.month, dt.day)
+        year_gz = day.getYearGZ()
+        self.year = day.getLunarYear()
+        self.month = day.getLunarMonth()
+        self.day = day.getLunarDay()
+        self.is_leap = bool(day.isLunarLeap())
+        self.hour_zhi = (dt.hour + 1) // 2 % 12
+        self.year_pillar = pillar(year_gz.tg, year_gz.dz)
+
+    @property
+    def month_name(self) -> str:
+        return ("闰" if self.is_leap else "") + LUNAR_MONTH_NAMES[self.month - 1]
+
+    def display(self) -> str:
+        return f"{self.year_pillar.name}年{self.month_name}月{LUNAR_DAY_NAMES[self.day - 1]}{DI_ZHI[self.hour_zhi]}时"
+
+    def to_dict(self) -> dict:
+        """旧版农历原始数据结构（BaziEngine._get_lunar_data）"""
+        yp = self.year_pillar
+        return {
+            "year": self.year,
+            "month": self.month,
+            "day": self.day,
+            "hour": self.hour_zhi,
+            "is_leap_month": self.is_leap,
+            "ganzhi": {"year_gan": yp.gan_name, "year_zhi": yp.zhi_name, "year_ganzhi": yp.name},
+            "display": {
+                "month_name": self.month_name,
+                "day_name": LUNAR_DAY_NAMES[self.day - 1],
+                "hour_name": DI_ZHI[self.hour_zhi],
+                "full_string": self.display(),
+            },
+        }
+
+
+class Qiyun:
+    """起运：出生后 years 年 months 月 days 日上大运，age 为起运周岁"""
+    __slots__ = ("years", "months", "days", "age")
+
+    def __init__(self, years: int, months: int, days: int, age: int):
+        self.years = years
+        self.months = months
+        self.days = days
+        self.age = age
+
+    def to_dict(self) -> dict:
+        return {
+            "year": self.years,
+            "month": self.months,
+            "day": self.days,
+            "age_at_start_of_luck": self.age,  # 精确周岁
+            "xusui_at_start_of_luck": self.age + 1  # 参考虚岁（简单加1）
+        }
+
+
+class LuckPillar:
+    """一步大运：age 岁（year 年）起，god 为相对日主的十神下标"""
+    __slots__ = ("age", "year", "pillar", "god")
+
+    def __init__(self, age: int, year: int, pillar_: Pillar, god: int):
+        self.age = age
+        self.year = year
+        self.pillar = pillar_
+        self.god = god
+
+    @property
+    def god_name(self) -> str:
+        return TEN_GOD_NAMES[self.god]
+
+    def to_dict(self, full: bool = False) -> dict:
+        item = {"age": self.age, "year": self.year, "ganzhi": self.pillar.name, "ming_li": self.god_name}
+        if full:
+            item["gan"] = self.pillar.gan_name
+            item["zhi"] = self.pillar.zhi_name
+        return item
+
+
+class Liunian:
+    """
+    流年时间线：从首步大运起连续的年份，按列存储（每列一个 bytes，每年一个字节）
+        cycles       六十甲子下标（由 year_cycle 切片得到）
+        stem_gods    流年天干相对日主的十神下标
+        branch_gods  流年地支本气相对日主的十神下标
+    十神两列由 cycles 经 bytes.translate 整体查表得到，不逐年计算
+    """
+    __slots__ = ("first_year", "birth_year", "cycles", "stem_gods", "branch_gods")
+
+    def __init__(self, first_year: int, birth_year: int, count: int, day_master: int):
+        self.first_year = first_year
+        self.birth_year = birth_year
+        self.cycles = year_cycle(first_year, count)
+        self.stem_gods = self.cycles.translate(SEXAGENARY_STEM_GODS[day_master])
+        self.branch_gods = self.cycles.translate(SEXAGENARY_BRANCH_GODS[day_master])
+
+    def __len__(self) -> int:
+        return len(self.cycles)
+
+    def year_dict(self, i: int) -> dict:
+        year = self.first_year + i
+        return {
+            "year": year,
+            "age": year - self.birth_year,
+            "ganzhi": SEXAGENARY[self.cycles[i]].name,
+            "ming_li": TEN_GOD_NAMES[self.stem_gods[i]],
+            "zhi_ming_li": TEN_GOD_NAMES[self.branch_gods[i]],
+        }
+
+    def year_string(self, i: int) -> str:
+        year = self.first_year + i
+        return (f"{year}年 {year - self.birth_year}岁 {SEXAGENARY[self.cycles[i]].name} "
+                f"{TEN_GOD_NAMES[self.stem_gods[i]]}/{TEN_GOD_NAMES[self.branch_gods[i]]}")
+
+
+class _lazy:
+    """__slots__ 类的惰性属性：首次访问时计算，结果存入同名加下划线的槽位"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.__doc__ = fn.__doc__
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.fn(obj)
+            setattr(obj, self.slot, value)
+            return value
+
+
+def normalize_parts(parts: Optional[Iterable[str]]) -> tuple:
+    """校验并去重 parts（保持 CHART_PARTS 的顺序）；为空时返回全部"""
+    if not parts:
+        return CHART_PARTS
+    requested = {p.strip() for p in parts if p and p.strip()}
+    unknown = requested - set(CHART_PARTS)
+    if unknown:
+        raise ValueError(f"不支持的命盘部分: {', '.join(sorted(unknown))}（可选: {', '.join(CHART_PARTS)}）")
+    return tuple(p for p in CHART_PARTS if p in requested) or CHART_PARTS
+
+
+class BaziChart:
+    __slots__ = (
+        "engine", "birth_time", "male", "city_name",
+        "_true_solar_time", "_birth_day", "_pillars", "_birth_lunar", "_is_forward", "_qiyun", "_jiaoyun",
+        "_dayun_list", "_liunian",
+    )
+
+    def __init__(self, engine, birth_time: datetime, gender: str, city_name: str):
+        self.engine = engine
+        self.birth_time = birth_time
+        self.male = gender == "男"
+        self.city_name = sys.intern(city_name)
+
+    @property
+    def gender(self) -> str:
+        return "男" if self.male else "女"
+
+    @_lazy
+    def true_solar_time(self) -> datetime:
+        longitude, _ = self.engine.get_location_info(self.city_name)
+        return self.engine.get_true_solar_time(self.birth_time, longitude)
+
+    @_lazy
+    def birth_day(self):
+        tst = self.true_solar_time
+        return sxtwl.fromSolar(tst.year, tst.month, tst.day)
+
+    @_lazy
+    def pillars(self) -> Tuple[Pillar, Pillar, Pillar, Pillar]:
+        """四柱（年、月、日、时；已修正早子时）"""
+        return pillars_from_tst(self.true_solar_time)
+
+    @property
+    def day_master(self) -> int:
+        """日主天干下标"""
+        return self.pillars[2].gan
+
+    @_lazy
+    def birth_lunar(self) -> LunarDate:
+        return LunarDate(self.true_solar_time)
+
+    @_lazy
+    def is_forward(self) -> bool:
+        """阳年男、阴年女顺排"""
+        return (self.birth_day.getYearGZ().tg % 2 == 0) == self.male
+
+    @_lazy
+    def qiyun(self) -> Qiyun:
+        """起运：出生到最近一个"节"（顺排向后、逆排向前）的天数，三天折一年"""
+        step = 1 if self.is_forward else -1
+        temp_day = self.birth_day
+        # 如果出生当天就是节，则从下一天（逆排为前一天）开始找
+        if temp_day.hasJieQi() and temp_day.getJieQi() in JIE_INDEXES:
+            temp_day = temp_day.after(1) if step > 0 else temp_day.before(1)
+        while not (temp_day.hasJieQi() and temp_day.getJieQi() in JIE_INDEXES):
+            temp_day = temp_day.after(1) if step > 0 else temp_day.before(1)
+
+        jieqi_time_info = sxtwl.JD2DD(temp_day.getJieQiJD())
+        # 秒数四舍五入可能得到 60，用 timedelta 进位
+        jieqi_datetime = datetime(
+            int(jieqi_time_info.Y), int(jieqi_time_info.M), int(jieqi_time_info.D),
+            int(jieqi_time_info.h), int(jieqi_time_info.m)
+        ) + timedelta(seconds=int(round(jieqi_time_info.s)))
+        days_diff = abs(jieqi_datetime - self.true_solar_time).total_seconds() / (3600 * 24)
+
+        qiyun_years_float = days_diff / 3
+        qiyun_year = int(qiyun_years_float)
+        remaining_days_after_years = (qiyun_years_float - qiyun_year) * 360  # 按一年360天算
+        return Qiyun(
+            qiyun_year,
+            int(remaining_days_after_years / 30),
+            int(remaining_days_after_years % 30),
+            int(round(qiyun_years_float)),
+        )
+
+    @_lazy
+    def jiaoyun(self) -> Tuple[int, int]:
+        """交运年、月"""
+        jiaoyun_year = self.birth_time.year + self.qiyun.age
+        jiaoyun_month = self.birth_time.month + self.qiyun.months
+        while jiaoyun_month > 12:
+            jiaoyun_month -= 12
+            jiaoyun_year += 1
+        return jiaoyun_year, jiaoyun_month
+
+    @_lazy
+    def dayun_list(self) -> Tuple[LuckPillar, ...]:
+        """十步大运：从月柱起按顺/逆排（偏移量从1开始），十神以日主天干计算"""
+        month = self.pillars[1]
+        day_master = self.day_master
+        sign = 1 if self.is_forward else -1
+        result = []
+        for i in range(10):
+            offset = sign * (i + 1)
+            p = pillar(month.gan + offset, month.zhi + offset)
+            age_start = self.qiyun.age + i * 10
+            result.append(LuckPillar(age_start, self.birth_time.year + age_start, p, ten_god(day_master, p.gan)))
+        return tuple(result)
+
+    @_lazy
+    def liunian(self) -> Liunian:
+        """十步大运覆盖的 100 个流年（第 i 步大运对应第 i*10 至 i*10+9 行）"""
+        first = self.dayun_list[0]
+        return Liunian(first.year, self.birth_time.year, len(self.dayun_list) * 10, self.day_master)
+
+    def current_dayun(self, now: Optional[datetime] = None) -> Optional[LuckPillar]:
+        current_age = (now or datetime.now()).year - self.birth_time.year
+        for i, item in enumerate(self.dayun_list):
+            if current_age >= item.age and (i == 9 or current_age < item.age + 10):
+                return item
+        return None
+
+    # ---- 以下为输出边缘：渲染字符串 ----
+
+    def bazi_string(self) -> str:
+        return " ".join(p.name for p in self.pillars)
+
+    def dayun_string(self) -> str:
+        """提示词用的大运串，如 "4岁 2005年 辛丑 劫财 -> ..." """
+        return " -> ".join(f"{d.age}岁 {d.year}年 {d.pillar.name} {d.god_name}" for d in self.dayun_list)
+
+    def relations(self) -> dict:
+        """四柱相对日主的十神（日柱天干为日主本身）、地支藏干十神与五行个数"""
+        day_master = self.day_master
+        result = {}
+        for key, p in zip(("year", "month", "day", "hour"), self.pillars):
+            hidden = HIDDEN_STEMS[p.zhi]
+            result[key] = {
+                "gan_god": "日主" if key == "day" else TEN_GOD_NAMES[ten_god(day_master, p.gan)],
+                "hidden": [
+                    {"gan": TIAN_GAN[g], "god": TEN_GOD_NAMES[god]}
+                    for g, god in zip(hidden, hidden_ten_gods(day_master, p.zhi))
+                ],
+            }
+        counts = element_counts(self.pillars)
+        return {
+            "day_master": TIAN_GAN[day_master],
+            "pillars": result,
+            "elements": {ELEMENT_NAMES[i]: n for i, n in enumerate(counts)},
+        }
+
+    def liunian_dicts(self) -> list:
+        """每步大运及其下十个流年"""
+        timeline = self.liunian
+        return [
+            {**d.to_dict(), "liunian": [timeline.year_dict(i * 10 + j) for j in range(10)]}
+            for i, d in enumerate(self.dayun_list)
+        ]
+
+    def liunian_string(self, from_year: int, count: int) -> str:
+        """提示词用：from_year 起 count 个流年（超出大运范围的年份略过），每行带所在大运"""
+        timeline = self.liunian
+        lines = []
+        for year in range(from_year, from_year + count):
+            i = year - timeline.first_year
+            if 0 <= i < len(timeline):
+                lines.append(f"{timeline.year_string(i)}（{self.dayun_list[i // 10].pillar.name}运）")
+        return "\n".join(lines)
+
+    def to_dict(self, parts: Optional[Iterable[str]] = None) -> dict:
+        """按需输出（只计算 parts 涉及的部分）"""
+        result = {}
+        for part in normalize_parts(parts):
+            if part == "pillars":
+                year, month, day, hour = self.pillars
+                result.update({
+                    "bazi": self.bazi_string(),
+                    "year": year.name, "month": month.name, "day": day.name, "hour": hour.name,
+                    "true_solar_time": self.true_solar_time.strftime('%Y-%m-%d %H:%M'),
+                })
+            elif part == "lunar":
+                result["lunar"] = self.birth_lunar.display()
+            elif part == "luck":
+                result["dayun"] = [d.to_dict() for d in self.dayun_list]
+                result["qiyun"] = self.qiyun.to_dict()
+                result["jiaoyun"] = {"year": self.jiaoyun[0], "month": self.jiaoyun[1]}
+            elif part == "relations":
+                result["relations"] = self.relations()
+            elif part == "liunian":
+                result["liunian"] = self.liunian_dicts()
+        return result
+
+
+def render_dayun_info(chart: BaziChart) -> dict:
+    """渲染为 BaziEngine.calculate_dayun 的旧版嵌套字典（仅供兼容旧调用方）"""
+    tst = chart.true_solar_time
+    year, month, day, hour = chart.pillars
+    dayun_list = [d.to_dict(full=True) for d in chart.dayun_list]
+    current = chart.current_dayun()
+    return {
+        "birth_solar": {
+            "year": tst.year, "month": tst.month, "day": tst.day,
+            "hour": tst.hour, "minute": tst.minute, "second": tst.second,
+            "timestamp": tst.timestamp(), "iso_format": tst.isoformat(),
+            "display": tst.strftime('%Y-%m-%d %H:%M')
+        },
+        "birth_lunar": chart.birth_lunar.to_dict(),
+        "bazi": {"year": year.name, "month": month.name, "day": day.name, "hour": hour.name},
+        "dayun_list": dayun_list,
+        "qiyun_data": chart.qiyun.to_dict(),
+        "jiaoyun_data": {"year": chart.jiaoyun[0], "month": chart.jiaoyun[1]},
+        "current_dayun": dayun_list[chart.dayun_list.index(current)] if current is not None else None,
+    }
@@ -0,0 +1,136 @@
+import sys
+from typing import Tuple
+
+"""
+十神与五行查表
+
+模块加载时一次性生成的整数矩阵（bytes，按行展开），查询只是下标运算：
+    TEN_GOD_MATRIX      10x10  日主天干 -> 天干 的十神下标
+    BRANCH_GOD_MATRIX   10x12  日主天干 -> 地支本气 的十神下标
+    HIDDEN_GOD_MATRIX   10x12x3  日主天干 -> 地支藏干（本气、中气、余气）的十神下标，缺位为 NONE
+    STEM_ELEMENT / BRANCH_ELEMENT  天干、地支的五行下标
+    SEXAGENARY_STEM_GODS / SEXAGENARY_BRANCH_GODS  按日主天干的 bytes.translate 表，
+        把一段六十甲子下标序列一次转换为天干 / 地支本气十神序列（流年时间线用）
+    BRANCH_RELATION_MATRIX  12x12  地支之间的六冲 / 六合 / 六害位标记
+
+下标约定：
+    天干 0-9 甲乙丙丁戊己庚辛壬癸，地支 0-11 子丑寅卯辰巳午未申酉戌亥
+    五行 0-4 木火土金水（见 ELEMENT_NAMES），十神 0-9 见 TEN_GOD_NAMES
+"""
+
+NONE = 255
+
+ELEMENT_NAMES = tuple(sys.intern(s) for s in "木火土金水")
+# 十神下标：五行生克关系 * 2 + 阴阳是否相异（同性为偏，异性为正）
+TEN_GOD_NAMES = tuple(sys.intern(s) for s in (
+    "比肩", "劫财", "食神", "伤官", "偏财", "正财", "七杀", "正官", "偏印", "正印"
+))
+
+STEM_ELEMENT = bytes(g // 2 for g in range(10))
+BRANCH_ELEMENT = bytes([4, 2, 0, 0, 2, 1, 1, 2, 3, 3, 2, 4])
+
+# 地支藏干（本气、中气、余气）
+HIDDEN_STEMS: Tuple[Tuple[int, ...], ...] = (
+    (9,),         # 子：癸
+    (5, 9, 7),    # 丑：己癸辛
+    (0, 2, 4),    # 寅：甲丙戊
+    (1,),         # 卯：乙
+    (4, 1, 9),    # 辰：戊乙癸
+    (2, 6, 4),    # 巳：丙庚戊
+    (3, 5),       # 午：丁己
+    (5, 3, 1),    # 未：己丁乙
+    (6, 8, 4),    # 申：庚壬戊
+    (7,),         # 酉：辛
+    (4, 7, 3),    # 戌：戊辛丁
+    (8, 0),       # 亥：壬甲
+)
+
+
+def _ten_god(day_gan: int, gan: int) -> int:
+    relation = (gan // 2 - day_gan // 2) % 5  # 0 同我 1 我生 2 我克 3 克我 4 生我
+    return relation * 2 + (day_gan % 2 != gan % 2)
+
+
+TEN_GOD_MATRIX = bytes(_ten_god(d, g) for d in range(10) for g in range(10))
+BRANCH_GOD_MATRIX = bytes(_ten_god(d, HIDDEN_STEMS[z][0]) for d in range(10) for z in range(12))
+HIDDEN_GOD_MATRIX = bytes(
+    _ten_god(d, HIDDEN_STEMS[z][i]) if i < len(HIDDEN_STEMS[z]) else NONE
+    for d in range(10) for z in range(12) for i in range(3)
+)
+
+
+def ten_god(day_gan: int, gan: int) -> int:
+    """以日主天干 day_gan 看天干 gan 的十神下标"""
+    return TEN_GOD_MATRIX[day_gan * 10 + gan]
+
+
+def branch_ten_god(day_gan: int, zhi: int) -> int:
+    """以日主天干看地支（本气）的十神下标"""
+    return BRANCH_GOD_MATRIX[day_gan * 12 + zhi]
+
+
+def hidden_ten_gods(day_gan: int, zhi: int) -> Tuple[int, ...]:
+    """以日主天干看地支各藏干的十神下标（本气在前）"""
+    start = (day_gan * 12 + zhi) * 3
+    return tuple(g for g in HIDDEN_GOD_MATRIX[start:start + 3] if g != NONE)
+
+
+def element_counts(pillars) -> Tuple[int, ...]:
+    """四柱天干地支（不含藏干）的五行个数，按 木火土金水 顺序"""
+    counts = [0] * 5
+    for p in pillars:
+        counts[STEM_ELEMENT[p.gan]] += 1
+        counts[BRANCH_ELEMENT[p.zhi]] += 1
+    return tuple(counts)
+
+
+# 六十甲子：下标 i 对应天干 i % 10、地支 i % 12；公历年 year 的流年下标为 (year - 4) % 60
+SEXAGENARY_CYCLE = bytes(range(60))
+
+
+def year_index(year: int) -> int:
+    return (year - 4) % 60
+
+
+def _sexagenary_table(god_of) -> bytes:
+    """bytes.translate 用的 256 字节表：六十甲子下标 -> 十神下标"""
+    return bytes(god_of(i) if i < 60 else 0 for i in range(256))
+
+
+# 按日主天干索引：SEXAGENARY_STEM_GODS[day_gan] 把六十甲子下标序列整体转换为天干十神序列
+SEXAGENARY_STEM_GODS = tuple(_sexagenary_table(lambda i, d=d: ten_god(d, i % 10)) for d in range(10))
+SEXAGENARY_BRANCH_GODS = tuple(_sexagenary_table(lambda i, d=d: branch_ten_god(d, i % 12)) for d in range(10))
+
+
+def year_cycle(first_year: int, count: int) -> bytes:
+    """first_year 起连续 count 年的六十甲子下标序列"""
+    start = year_index(first_year)
+    repeats = (start + count) // 60 + 1
+    return (SEXAGENARY_CYCLE * repeats)[start:start + count]
+
+
+def sexagenary_index(gan: int, zhi: int) -> int:
+    """天干、地支下标 -> 六十甲子下标（要求阴阳相同）"""
+    return (6 * gan - 5 * zhi) % 60
+
+
+# 地支关系位标记：六冲、六合、六害
+CLASH = 1
+HARMONY = 2
+HARM = 4
+BRANCH_RELATION_MATRIX = bytes(
+    (CLASH if (a - b) % 12 == 6 else 0)
+    | (HARMONY if (a + b) % 12 == 1 else 0)
+    | (HARM if (a + b) % 12 == 7 else 0)
+    for a in range(12) for b in range(12)
+)
+
+
+def branch_relation(a: int, b: int) -> int:
+    """两个地支之间的关系位（CLASH / HARMONY / HARM 的组合）"""
+    return BRANCH_RELATION_MATRIX[a * 12 + b]
+
+
+def stem_combines(a: int, b: int) -> bool:
+    """天干五合（甲己、乙庚、丙辛、丁壬、戊癸）"""
+    return (a - b) % 10 == 5
@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+from typing import List, Tuple
+
+from utils.bazi_chart import PILLAR_BY_NAME, Pillar
+from utils.bazi_relations import sexagenary_index
+from utils.ganzhi_index import MAX_YEAR, MIN_YEAR, year_columns
+
+"""
+四柱反查出生时间
+
+给定四柱（如 "辛巳 庚子 庚辰 壬午"），在公历年份区间内找出所有排出该四柱的日期与时辰窗口（真太阳时）。
+排盘规则与 utils/bazi_chart.pillars_from_tst 一致：年柱以立春换年、月柱以节换月（按日），
+23 点起为次日日柱（早子时），年柱、月柱仍取当天。
+
+不逐时穷举：
+- 时柱：时干由日干与时支决定（五鼠遁），不符直接无解
+- 月柱：月干由年干与月支决定（五虎遁），不符直接无解
+- 年柱：六十年一循环，只检查 (year - 4) % 60 相符的年份（及其次年立春前的一段）
+- 日柱：六十天一循环，在候选年份的逐日干支索引中按 60 天步长跳查，再核对该日的月柱、年柱
+"""
+
+
+def parse_bazi(text: str) -> Tuple[Pillar, Pillar, Pillar, Pillar]:
+    """解析四柱文本（空格分隔或连写），返回 (年, 月, 日, 时)"""
+    compact = "".join((text or "").split())
+    if len(compact) != 8:
+        raise ValueError("四柱格式应为 4 组干支，如：辛巳 庚子 庚辰 壬午")
+    pillars = []
+    for i in range(0, 8, 2):
+        name = compact[i:i + 2]
+        p = PILLAR_BY_NAME.get(name)
+        if p is None:
+            raise ValueError(f"无效的干支: {name}")
+        pillars.append(p)
+    return tuple(pillars)
+
+
+def _hour_window(day: date, zhi: int) -> Tuple[datetime, datetime]:
+    start = datetime(day.year, day.month, day.day) + timedelta(hours=zhi * 2 - 1)
+    return start, start + timedelta(hours=2)
+
+
+def _matches_on(d: date, month_idx: int, year_idx: int) -> bool:
+    if not MIN_YEAR <= d.year <= MAX_YEAR:
+        return False
+    _, months, years = year_columns(d.year)
+    i = d.timetuple().tm_yday - 1
+    return months[i] == month_idx and years[i] == year_idx
+
+
+def find_birth_times(text: str, start_year: int = MIN_YEAR, end_year: int = MAX_YEAR) -> List[dict]:
+    """
+    返回按时间排序的窗口列表 [{"start": "YYYY-MM-DD HH:MM", "end": ..., "day": "YYYY-MM-DD"}]
+    start/end 为真太阳时，左闭右开；day 为日柱所在的公历日
+    年份区间按出生时刻的公历年份计算（而非干支年）
+    """
+    year, month, day, hour = parse_bazi(text)
+    if start_year > end_year:
+        raise ValueError("结束年份不能早于开始年份")
+    if start_year < MIN_YEAR or end_year > MAX_YEAR:
+        raise ValueError(f"年份范围 {MIN_YEAR}-{MAX_YEAR}")
+
+    # 五鼠遁：时干 = (日干 % 5 * 2 + 时支) % 10；五虎遁：月干 = (年干 % 5 * 2 + 2 + (月支 - 2) % 12) % 10
+    if (day.gan % 5 * 2 + hour.zhi) % 10 != hour.gan:
+        return []
+    if (year.gan % 5 * 2 + 2 + (month.zhi - 2) % 12) % 10 != month.gan:
+        return []
+
+    year_idx = sexagenary_index(year.gan, year.zhi)
+    month_idx = sexagenary_index(month.gan, month.zhi)
+    day_idx = sexagenary_index(day.gan, day.zhi)
+
+    windows: List[Tuple[datetime, datetime, date]] = []
+    # 干支年从立春开始，跨入次年一、二月：start_year 年初可能仍属上一个干支年；
+    # end_year 12 月 31 日 23 点起的早子时，日柱落在次年 1 月 1 日
+    first = start_year - 1 + (year_idx - (start_year - 5)) % 60
+    for pillar_year in range(first, end_year + 1, 60):
+        for solar_year in (pillar_year, pillar_year + 1):
+            if not max(start_year, MIN_YEAR) <= solar_year <= min(end_year + 1, MAX_YEAR):
+                continue
+            days, months, years = year_columns(solar_year)
+            offset = (day_idx - days[0]) % 60
+            for i in range(offset, len(days), 60):
+                d = date(solar_year, 1, 1) + timedelta(days=i)
+                if hour.zhi != 0:
+                    if d.year <= end_year and months[i] == month_idx and years[i] == year_idx:
+                        windows.append((*_hour_window(d, hour.zhi), d))
+                    continue
+                # 子时：前一天 23 点起（年柱、月柱取前一天）与当天 0 点至 1 点；按出生时刻的公历年份筛选
+                prev = d - timedelta(days=1)
+                late = start_year <= prev.year <= end_year and _matches_on(prev, month_idx, year_idx)
+                early = d.year <= end_year and months[i] == month_idx and years[i] == year_idx
+                if late or early:
+                    start, end = _hour_window(d, 0)
+                    if not late:
+                        start += timedelta(hours=1)
+                    if not early:
+                        end -= timedelta(hours=1)
+                    windows.append((start, end, d))
+
+    windows.sort()
+    return [
+        {"start": s.strftime("%Y-%m-%d %H:%M"), "end": e.strftime("%Y-%m-%d %H:%M"), "day": d.isoformat()}
+        for s, e, d in windows
+    ]
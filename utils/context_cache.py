@@ -0,0 +1,86 @@
+"""
+Provider 上下文缓存
+- DeepSeek：服务端自动前缀缓存，无需显式调用，只要请求前缀（system 指令）保持字节级一致即可命中
+- Gemini：显式上下文缓存（google-genai caches API），将固定的 system 指令缓存为 cachedContent，
+  之后的请求只携带 cachedContent 名称与变化部分
+  - system 指令过短（低于 Gemini 最小缓存 token 数）时不缓存
+  - 创建失败会在一段时间内不再重试，退回普通请求
+  - 未安装 google-genai 或设置 GEMINI_CONTEXT_CACHE=false 时不启用
+  - 创建缓存是阻塞的网络调用：只按缓存键串行（同一 system 指令只创建一次），不同键互不等待；
+    异步调用方需在线程中调用 gemini_cached_content
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Gemini 显式缓存的最少 token 数（2.5 Flash 为 1024），按约 0.6 token/字符折算
+GEMINI_CACHE_MIN_CHARS = 1800
+GEMINI_CACHE_TTL_SECONDS = 3600
+# 距离过期不足该时间时视为过期，避免请求途中缓存失效
+GEMINI_CACHE_REFRESH_MARGIN = 60
+# 创建失败后的冷却时间
+GEMINI_CACHE_RETRY_AFTER = 600
+
+# _lock 只保护 _key_locks 字典本身，网络调用期间只持有对应键的锁
+_lock = threading.Lock()
+_key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_gemini_caches: Dict[Tuple[str, str, str], Tuple[str, float]] = {}
+_gemini_failures: Dict[Tuple[str, str, str], float] = {}
+
+
+def _enabled() -> bool:
+    return os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() not in ("0", "false", "no")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def gemini_cached_content(api_key: Optional[str], model: str, system_text: str) -> Optional[str]:
+    """获取（或创建）system 指令对应的 Gemini cachedContent 名称，不可用时返回 None"""
+    if not api_key or not _enabled() or len(system_text) < GEMINI_CACHE_MIN_CHARS:
+        return None
+
+    key = (_digest(api_key)[:16], model, _digest(system_text))
+    now = time.time()
+    cached = _gemini_caches.get(key)
+    if cached and cached[1] - GEMINI_CACHE_REFRESH_MARGIN > now:
+        return cached[0]
+    if now - _gemini_failures.get(key, 0.0) < GEMINI_CACHE_RETRY_AFTER:
+        return None
+
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        now = time.time()
+        cached = _gemini_caches.get(key)
+        if cached and cached[1] - GEMINI_CACHE_REFRESH_MARGIN > now:
+            return cached[0]
+        if now - _gemini_failures.get(key, 0.0) < GEMINI_CACHE_RETRY_AFTER:
+            return None
+        try:
+            from google.genai import types
+            from utils import llm_pool
+
+            client = llm_pool.get_genai_client(api_key)
+            cache = client.caches.create(
+                model=model if model.startswith("models/") else f"models/{model}",
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_text,
+                    ttl=f"{GEMINI_CACHE_TTL_SECONDS}s",
+                    display_name=f"zhoubazi-{key[2][:12]}",
+                ),
+            )
+        except Exception as e:
+            _gemini_failures[key] = now
+            logger.warning(f"[context_cache] Gemini 上下文缓存创建失败，退回普通请求: {e}")
+            return None
+
+        _gemini_caches[key] = (cache.name, now + GEMINI_CACHE_TTL_SECONDS)
+        logger.info(f"[context_cache] 已创建 Gemini 上下文缓存 {cache.name} (model={model})")
+        return cache.name
@@ -0,0 +1,153 @@
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import sxtwl
+
+from utils.bazi_relations import SEXAGENARY_CYCLE, sexagenary_index
+
+"""
+逐日干支 / 农历索引
+
+按公历年预先生成每天的数据，每列一个 bytes（每天一个字节），按年缓存（YearTable）：
+    days          日柱六十甲子下标（60 天一循环，直接由 SEXAGENARY_CYCLE 切片得到）
+    months        月柱（以节换月，由 sxtwl 逐日取得）
+    years         年柱（以立春换年）
+    lunar_months  农历月 1-12，闰月加 LEAP_FLAG
+    lunar_days    农历日 1-30
+    jieqi         当天交节气的节气下标 0-23（见 JIEQI_NAMES），无节气为 NO_JIEQI
+另有节气交接时刻 jieqi_times（{年内第几天: datetime}）与正月初一所在位置 new_year（用于推算农历年）。
+区间查询把所跨年份的列拼接后切片；规则判断可以对整列做 bytes.translate，一次得到整段区间的掩码。
+"""
+
+# 支持的公历年份范围
+MIN_YEAR = 1900
+MAX_YEAR = 2100
+
+LEAP_FLAG = 0x80
+NO_JIEQI = 255
+# sxtwl 节气下标（0 为冬至）
+JIEQI_NAMES = (
+    "冬至", "小寒", "大寒", "立春", "雨水", "惊蛰", "春分", "清明", "谷雨", "立夏", "小满", "芒种",
+    "夏至", "小暑", "大暑", "立秋", "处暑", "白露", "秋分", "寒露", "霜降", "立冬", "小雪", "大雪",
+)
+
+COLUMNS = ("days", "months", "years", "lunar_months", "lunar_days", "jieqi")
+
+
+def day_cycle_index(d: date) -> int:
+    """日柱六十甲子下标（按儒略日数推算）"""
+    return (d.toordinal() + 14) % 60
+
+
+def _cycle_slice(start: int, count: int) -> bytes:
+    repeats = (start + count) // 60 + 1
+    return (SEXAGENARY_CYCLE * repeats)[start:start + count]
+
+
+class YearTable:
+    """某公历年的逐日数据（只读）"""
+    __slots__ = ("year", "first", "days", "months", "years", "lunar_months", "lunar_days", "jieqi",
+                 "jieqi_times", "new_year")
+
+    def __init__(self, year: int):
+        self.year = year
+        self.first = date(year, 1, 1)
+        count = (date(year + 1, 1, 1) - self.first).days
+        months, years = bytearray(count), bytearray(count)
+        lunar_months, lunar_days = bytearray(count), bytearray(count)
+        jieqi = bytearray(b"\xff" * count)
+        jieqi_times: Dict[int, datetime] = {}
+        new_year = count
+
+        day = sxtwl.fromSolar(year, 1, 1)
+        for i in range(count):
+            month_gz = day.getMonthGZ()
+            year_gz = day.getYearGZ()
+            months[i] = sexagenary_index(month_gz.tg, month_gz.dz)
+            years[i] = sexagenary_index(year_gz.tg, year_gz.dz)
+            leap = day.isLunarLeap()
+            lunar_months[i] = day.getLunarMonth() | (LEAP_FLAG if leap else 0)
+            lunar_days[i] = day.getLunarDay()
+            if lunar_months[i] == 1 and lunar_days[i] == 1:
+                new_year = i
+            if day.hasJieQi():
+                jieqi[i] = day.getJieQi()
+                t = sxtwl.JD2DD(day.getJieQiJD())
+                jieqi_times[i] = datetime(int(t.Y), int(t.M), int(t.D), int(t.h), int(t.m)) + timedelta(
+                    seconds=int(round(t.s)))
+            day = day.after(1)
+
+        self.days = _cycle_slice(day_cycle_index(self.first), count)
+        self.months, self.years = bytes(months), bytes(years)
+        self.lunar_months, self.lunar_days = bytes(lunar_months), bytes(lunar_days)
+        self.jieqi = bytes(jieqi)
+        self.jieqi_times = jieqi_times
+        self.new_year = new_year
+
+    def lunar_year(self, i: int) -> int:
+        """第 i 天所在的农历年（正月初一之前属于上一年）"""
+        return self.year if i >= self.new_year else self.year - 1
+
+
+# 每年约 2KB，常用范围内的年份可以全部常驻
+@lru_cache(maxsize=256)
+def year_table(year: int) -> YearTable:
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        raise ValueError(f"年份超出范围 {MIN_YEAR}-{MAX_YEAR}: {year}")
+    return YearTable(year)
+
+
+def year_columns(year: int) -> Tuple[bytes, bytes, bytes]:
+    """某公历年每天的 (日柱, 月柱, 年柱) 下标列"""
+    table = year_table(year)
+    return table.days, table.months, table.years
+
+
+def _slices(start: date, end: date):
+    """按年切分 [start, end]，依次产出 (YearTable, lo, hi)"""
+    if end < start:
+        raise ValueError("结束日期不能早于开始日期")
+    for year in range(start.year, end.year + 1):
+        table = year_table(year)
+        lo = (start - table.first).days if year == start.year else 0
+        hi = (end - table.first).days + 1 if year == end.year else len(table.days)
+        yield table, lo, hi
+
+
+def range_columns(start: date, end: date) -> Tuple[bytes, bytes, bytes]:
+    """[start, end] 闭区间每天的 (日柱, 月柱, 年柱) 下标列"""
+    days, months, years = [], [], []
+    for table, lo, hi in _slices(start, end):
+        days.append(table.days[lo:hi])
+        months.append(table.months[lo:hi])
+        years.append(table.years[lo:hi])
+    return b"".join(days), b"".join(months), b"".join(years)
+
+
+def range_table(start: date, end: date) -> Dict[str, bytes]:
+    """[start, end] 闭区间的全部列（COLUMNS），键为列名"""
+    parts: Dict[str, list] = {name: [] for name in COLUMNS}
+    for table, lo, hi in _slices(start, end):
+        for name in COLUMNS:
+            parts[name].append(getattr(table, name)[lo:hi])
+    return {name: b"".join(chunks) for name, chunks in parts.items()}
+
+
+def iter_days(start: date, end: date):
+    """逐日产出 (date, YearTable, 年内下标)，用于流式输出（不拼接整段列）"""
+    for table, lo, hi in _slices(start, end):
+        for i in range(lo, hi):
+            yield table.first + timedelta(days=i), table, i
+
+
+def range_jieqi(start: date, end: date):
+    """[start, end] 内的节气交接：[(区间内第几天, 节气下标, 交接时刻)]"""
+    result = []
+    offset = 0
+    for table, lo, hi in _slices(start, end):
+        for i, moment in sorted(table.jieqi_times.items()):
+            if lo <= i < hi:
+                result.append((offset + i - lo, table.jieqi[i], moment))
+        offset += hi - lo
+    return result
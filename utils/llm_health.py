@@ -0,0 +1,130 @@
+"""
+LLM 路由健康度统计
+- 每个 (provider, model) 维护延迟 EWMA、错误率 EWMA 与最近延迟样本（用于估算 p95）
+- 连续失败后进入冷却期，冷却期内路由会把该线路排到最后
+- 同时记录整次调用延迟与首 token 延迟（流式），二者分别用于非流式与流式的对冲阈值
+- 客户端无法创建（如缺少 API key）的线路标记为不可用，直到重新加载配置后创建成功
+"""
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+# EWMA 平滑系数
+EWMA_ALPHA = 0.2
+# 错误率 EWMA 超过该值视为不健康
+ERROR_RATE_THRESHOLD = 0.5
+# 连续失败达到该次数后进入冷却
+MAX_CONSECUTIVE_FAILURES = 3
+# 冷却时长（秒），冷却结束后允许重新尝试
+COOLDOWN_SECONDS = 30.0
+# 参与 p95 计算的最近样本数，以及给出 p95 所需的最少样本数
+LATENCY_WINDOW = 200
+MIN_SAMPLES_FOR_P95 = 10
+
+
+def _p95(samples: Deque[float]) -> Optional[float]:
+    if len(samples) < MIN_SAMPLES_FOR_P95:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class ProviderHealth:
+    """单条线路的健康度"""
+
+    def __init__(self, provider: str, model: str) -> None:
+        self.provider = provider
+        self.model = model
+        self.latency_ewma: Optional[float] = None
+        self.ttft_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.last_failure_at: Optional[float] = None
+        self.unavailable: Optional[str] = None
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._ttfts: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ewma(old: Optional[float], value: float) -> float:
+        return value if old is None else (1 - EWMA_ALPHA) * old + EWMA_ALPHA * value
+
+    def record_success(self, latency: float) -> None:
+        """记录一次成功调用的整体延迟（秒）"""
+        with self._lock:
+            self.latency_ewma = self._ewma(self.latency_ewma, latency)
+            self.error_ewma = self._ewma(self.error_ewma, 0.0)
+            self.consecutive_failures = 0
+            self._latencies.append(latency)
+
+    def record_first_token(self, ttft: float) -> None:
+        """记录一次流式调用的首 token 延迟（秒），首 token 到达即视为线路可用"""
+        with self._lock:
+            self.ttft_ewma = self._ewma(self.ttft_ewma, ttft)
+            self.error_ewma = self._ewma(self.error_ewma, 0.0)
+            self.consecutive_failures = 0
+            self._ttfts.append(ttft)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.error_ewma = self._ewma(self.error_ewma, 1.0)
+            self.consecutive_failures += 1
+            self.last_failure_at = time.monotonic()
+
+    def set_unavailable(self, reason: Optional[str]) -> None:
+        """标记线路不可用（reason 为原因）；None 表示恢复可用"""
+        with self._lock:
+            self.unavailable = reason
+
+    @property
+    def healthy(self) -> bool:
+        with self._lock:
+            if self.unavailable is not None:
+                return False
+            if self.last_failure_at is None:
+                return True
+            cooling = time.monotonic() - self.last_failure_at < COOLDOWN_SECONDS
+            if cooling and self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                return False
+            return not (cooling and self.error_ewma > ERROR_RATE_THRESHOLD)
+
+    def latency_p95(self) -> Optional[float]:
+        with self._lock:
+            return _p95(self._latencies)
+
+    def ttft_p95(self) -> Optional[float]:
+        with self._lock:
+            return _p95(self._ttfts)
+
+    def snapshot(self) -> dict:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "healthy": self.healthy,
+            "latency_ewma": self.latency_ewma,
+            "ttft_ewma": self.ttft_ewma,
+            "error_ewma": round(self.error_ewma, 4),
+            "latency_p95": self.latency_p95(),
+            "ttft_p95": self.ttft_p95(),
+            "consecutive_failures": self.consecutive_failures,
+            "unavailable": self.unavailable,
+        }
+
+
+_registry: Dict[Tuple[str, str], ProviderHealth] = {}
+_registry_lock = threading.Lock()
+
+
+def get_health(provider: str, model: str) -> ProviderHealth:
+    """获取（或创建）进程级共享的线路健康度"""
+    key = (provider, model)
+    health = _registry.get(key)
+    if health is None:
+        with _registry_lock:
+            health = _registry.setdefault(key, ProviderHealth(provider, model))
+    return health
+
+
+def snapshot_all() -> list[dict]:
+    return [h.snapshot() for h in list(_registry.values())]
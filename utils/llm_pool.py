@@ -0,0 +1,147 @@
+"""
+LLM 客户端池
+- 进程内按 (provider, model, 温度, 超时, 重试次数) 复用 LangChain 客户端，避免重复创建与 TLS 握手
+- DeepSeek 客户端共享同一组 httpx 连接池（keep-alive）
+- API key 以指纹参与缓存键：key 未变化时直接复用，变化时才重建并淘汰旧客户端
+- API key 直接传入客户端，不再改写 os.environ
+"""
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_deepseek import ChatDeepSeek
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+logger = logging.getLogger(__name__)
+
+# 共享连接池上限
+HTTP_MAX_CONNECTIONS = 50
+HTTP_MAX_KEEPALIVE = 20
+HTTP_KEEPALIVE_EXPIRY = 60.0
+
+_lock = threading.Lock()
+_chat_clients: Dict[Tuple, BaseChatModel] = {}
+_genai_clients: Dict[str, Any] = {}
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _fingerprint(api_key: Optional[str]) -> str:
+    """API key 指纹，只用于判断 key 是否变化，不保存明文"""
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _shared_http_clients(timeout: Optional[float]) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """进程内共享的 httpx 客户端（调用方需持有 _lock）"""
+    global _http_client, _http_async_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_limits(), timeout=timeout)
+    if _http_async_client is None:
+        _http_async_client = httpx.AsyncClient(limits=_limits(), timeout=timeout)
+    return _http_client, _http_async_client
+
+
+def _build_chat_client(
+        provider: str,
+        model: str,
+        temperature: float,
+        timeout: Optional[int],
+        max_retries: int,
+        api_key: Optional[str],
+) -> BaseChatModel:
+    if provider == "deepseek":
+        http_client, http_async_client = _shared_http_clients(timeout)
+        kwargs: Dict[str, Any] = {}
+        if api_key:
+            kwargs["api_key"] = api_key
+        return ChatDeepSeek(
+            model=model,
+            temperature=temperature,
+            max_tokens=None,
+            timeout=timeout,
+            max_retries=max_retries,
+            # 流式输出时也返回 usage，用于限流结算与用量统计
+            stream_usage=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            **kwargs,
+        )
+    if provider == "gemini":
+        kwargs = {}
+        if api_key:
+            kwargs["google_api_key"] = api_key
+        return ChatGoogleGenerativeAI(
+            model=model,
+            temperature=temperature,
+            max_tokens=None,
+            timeout=timeout,
+            max_retries=max_retries,
+            **kwargs,
+        )
+    raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+def get_chat_client(
+        provider: str,
+        model: str,
+        temperature: float,
+        timeout: Optional[int],
+        max_retries: int,
+        api_key: Optional[str],
+) -> BaseChatModel:
+    """获取（或创建）共享的 LangChain 聊天客户端"""
+    base_key = (provider, model, temperature, timeout, max_retries)
+    key = base_key + (_fingerprint(api_key),)
+    client = _chat_clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _chat_clients.get(key)
+        if client is not None:
+            return client
+        # 同一配置下 key 已变化：淘汰旧客户端
+        for stale in [k for k in _chat_clients if k[:-1] == base_key]:
+            del _chat_clients[stale]
+        client = _build_chat_client(provider, model, temperature, timeout, max_retries, api_key)
+        _chat_clients[key] = client
+        logger.info(f"[llm_pool] 新建客户端 provider={provider}, model={model}")
+        return client
+
+
+def get_genai_client(api_key: str) -> Any:
+    """获取（或创建）共享的 google-genai 客户端，供思考模型调用"""
+    key = _fingerprint(api_key)
+    client = _genai_clients.get(key)
+    if client is not None:
+        return client
+
+    from google import genai
+
+    with _lock:
+        client = _genai_clients.get(key)
+        if client is None:
+            _genai_clients.clear()
+            client = genai.Client(api_key=api_key)
+            _genai_clients[key] = client
+        return client
+
+
+def clear() -> None:
+    """清空客户端池（连接池保留，供新客户端继续复用）"""
+    with _lock:
+        _chat_clients.clear()
+        _genai_clients.clear()
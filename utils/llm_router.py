@@ -1,26 +1,146 @@
-from typing import Iterator, List, Tuple, Union, Optional, AsyncIterator
+from typing import Callable, Dict, Iterator, List, NamedTuple, Sequence, Tuple, TypeVar, Union, Optional, AsyncIterator, Type
+import asyncio
+import contextvars
 import os
 import logging
-from langchain_deepseek import ChatDeepSeek
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pydantic import BaseModel
+from langchain_core.language_models.chat_models import BaseChatModel
 from dotenv import load_dotenv
+from utils import llm_pool
+from utils import metrics
+from utils import tracing
+from utils.llm_health import get_health
+from utils import rate_limiter
+from utils.rate_limiter import estimate_tokens
+from utils.context_cache import gemini_cached_content
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 try:
-    from utils.settings_manager import get_api_key
+    from utils.settings_manager import get_api_key, get_llm_provider, settings_version
     HAS_SETTINGS_MANAGER = True
 except ImportError:
     HAS_SETTINGS_MANAGER = False
     logger.warning("settings_manager not found, using env vars only")
 
+T = TypeVar("T")
+
 Message = Tuple[str, str]
 Messages = List[Message]
+# 线路：("provider", "model") 或直接传入的 LangChain 聊天模型（如本地 Fake 模型）
+Route = Union[Tuple[str, Optional[str]], BaseChatModel]
+
+# 对冲请求：无历史 p95 时的默认等待时间与最小等待时间（秒）
+HEDGE_DEFAULT_DELAY = 20.0
+HEDGE_MIN_DELAY = 1.0
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+
+def parse_routes(spec: str | None) -> List[Tuple[str, Optional[str]]]:
+    """解析 "deepseek:deepseek-chat,gemini" 形式的线路配置，model 可省略"""
+    routes: List[Tuple[str, Optional[str]]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        routes.append((provider.strip().lower(), model.strip() or None))
+    return routes
+
+
+def _usage(message) -> Optional[dict]:
+    """
+    从 LangChain 消息中提取用量：input / output / total / cached（命中上下文缓存的输入 token）
+    - Gemini 与 OpenAI 兼容接口的缓存命中数在 usage_metadata.input_token_details.cache_read
+    - DeepSeek 原始 usage 中为 prompt_cache_hit_tokens（非流式时保留在 response_metadata 中）
+    """
+    meta = getattr(message, "usage_metadata", None)
+    if not meta:
+        return None
+    cached = (meta.get("input_token_details") or {}).get("cache_read")
+    if not cached:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        cached = token_usage.get("prompt_cache_hit_tokens")
+    return {
+        "input": meta.get("input_tokens", 0),
+        "output": meta.get("output_tokens", 0),
+        "total": meta.get("total_tokens", 0),
+        "cached": cached or 0,
+    }
+
+
+def _add_usage(total: Optional[dict], delta: Optional[dict]) -> Optional[dict]:
+    """累加流式 chunk 的用量：Gemini 每个 chunk 携带增量，OpenAI 兼容接口只在末尾 chunk 携带一次"""
+    if not delta:
+        return total
+    if not total:
+        return dict(delta)
+    return {key: total.get(key, 0) + delta.get(key, 0) for key in ("input", "output", "total", "cached")}
+
+
+def _log_usage(binding: "_Binding", caller: str, usage: Optional[dict]) -> None:
+    if usage:
+        logger.info(
+            f"[LLMRouter] usage provider={binding.provider} model={binding.model} caller={caller} "
+            f"input={usage['input']} cached={usage['cached']} output={usage['output']}"
+        )
+
+
+def _span_attributes(binding: "_Binding", caller: str, attempt: int) -> dict:
+    return {"llm.provider": binding.provider, "llm.model": binding.model, "llm.caller": caller, "llm.attempt": attempt}
+
+
+def _span_usage(span: Optional[tracing.Span], usage: Optional[dict]) -> None:
+    if span is None or not usage:
+        return
+    span.set("llm.tokens.prompt", usage["input"])
+    span.set("llm.tokens.completion", usage["output"])
+    span.set("llm.tokens.cached", usage["cached"])
+
+
+def _span_end(span: Optional[tracing.Span], usage: Optional[dict] = None, error: Optional[BaseException] = None) -> None:
+    """结束流式调用的 span；客户端断开（GeneratorExit / 取消）记为 cancelled 而非错误"""
+    if span is None:
+        return
+    _span_usage(span, usage)
+    if isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+        span.set("llm.cancelled", True)
+    elif error is not None:
+        span.error(error)
+    span.end()
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, "content", None)
+    return content if isinstance(content, str) else ""
+
+
+class _Binding(NamedTuple):
+    """路由当前绑定的 provider / model / 客户端，整体替换以保证一致性"""
+    provider: str
+    model: str
+    llm: BaseChatModel
+    version: int
 
 
 class LLMRouter:
+    """
+    统一 LLM 路由
+    - 未显式指定 provider 时跟随配置文件中的 llm_provider（其次环境变量 LLM_PROVIDER，最后 default_provider）
+    - 配置变化（provider 或 API key）后，下一次调用自动切换到新客户端，无需重启或重建 Agent
+    - model 未指定时使用对应 provider 的默认模型
+    - 多线路模式：routes 为有序线路列表（未传时读取环境变量 LLM_FALLBACK_ROUTES 作为备用线路），
+      按健康度（延迟/错误率 EWMA）自动故障转移；hedge=True 时主线路超过 p95 延迟后向下一条线路发起对冲请求
+    """
+
+    # 进程级共享实例：(provider, default_provider, model, temperature, timeout, max_retries) -> LLMRouter
+    _shared: Dict[Tuple, "LLMRouter"] = {}
+    _shared_lock = threading.Lock()
 
     def __init__(
             self,
@@ -29,81 +149,495 @@ class LLMRouter:
             temperature: float = 0.5,
             timeout: int | None = 600,
             max_retries: int = 3,
+            default_provider: str = "deepseek",
+            routes: Sequence[Route] | None = None,
+            hedge: bool | None = None,
+            hedge_after: float | None = None,
     ) -> None:
-        self.provider = (provider or os.getenv("LLM_PROVIDER", "deepseek")).lower()
+        self._pinned_provider = provider.lower() if provider else None
+        self._pinned_model = model
+        self.default_provider = default_provider
         self.temperature = temperature
         self.timeout = timeout
         self.max_retries = max_retries
+        self._routes = list(routes) if routes else None
+        self.hedge = hedge if hedge is not None else os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes")
+        self.hedge_after = hedge_after
 
-        # 从配置文件获取 API key（优先级高于环境变量）
-        if HAS_SETTINGS_MANAGER:
-            if self.provider == "deepseek":
-                api_key = get_api_key("deepseek")
-                if api_key:
-                    os.environ["DEEPSEEK_API_KEY"] = api_key
-            elif self.provider == "gemini":
-                api_key = get_api_key("gemini")
-                if api_key:
-                    os.environ["GEMINI_API_KEY"] = api_key
-                    os.environ["GOOGLE_API_KEY"] = api_key  # langchain 可能用这个
-
-        if self.provider == "deepseek":
-            self.model = model or os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
-            self.llm = ChatDeepSeek(
-                model=self.model,
-                temperature=self.temperature,
-                max_tokens=None,
-                timeout=self.timeout,
-                max_retries=self.max_retries,
-            )
-        elif self.provider == "gemini":
-            self.model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-            self.llm = ChatGoogleGenerativeAI(
-                model=self.model,
-                temperature=self.temperature,
-                max_tokens=None,
-                timeout=self.timeout,
-                max_retries=self.max_retries,
-            )
-        else:
-            raise ValueError(f"Unsupported LLM provider: {self.provider}")
+        self._bind_lock = threading.Lock()
+        self._bindings = self._resolve_bindings()
 
         print(f"[LLMRouter] Initialized with provider={self.provider}, model={self.model}")
 
-    def invoke(self, messages: Union[str, Messages]) -> str:
-        """同步调用（保持不变）"""
+    @classmethod
+    def shared(
+            cls,
+            provider: str | None = None,
+            model: str | None = None,
+            temperature: float = 0.5,
+            timeout: int | None = 600,
+            max_retries: int = 3,
+            default_provider: str = "deepseek",
+    ) -> "LLMRouter":
+        """获取进程级共享的 LLMRouter，相同 (provider, model, 参数) 只初始化一次"""
+        key = (provider, default_provider, model, temperature, timeout, max_retries)
+        router = cls._shared.get(key)
+        if router is not None:
+            return router
+        with cls._shared_lock:
+            router = cls._shared.get(key)
+            if router is None:
+                router = cls(provider, model, temperature, timeout, max_retries, default_provider)
+                cls._shared[key] = router
+            return router
+
+    def _bind(self, provider: str, model: str | None, version: int) -> _Binding:
+        model = model or self._default_model(provider)
+        # 客户端来自进程级连接池，相同配置与 API key 下复用同一实例
+        llm = llm_pool.get_chat_client(
+            provider,
+            model,
+            self.temperature,
+            self.timeout,
+            self.max_retries,
+            self._api_key(provider),
+        )
+        return _Binding(provider, model, llm, version)
+
+    def _resolve_bindings(self) -> List[_Binding]:
+        version = settings_version() if HAS_SETTINGS_MANAGER else 0
+        if self._routes:
+            routes = self._routes
+        else:
+            provider = self._pinned_provider
+            if provider is None and HAS_SETTINGS_MANAGER:
+                provider = get_llm_provider()
+            provider = (provider or os.getenv("LLM_PROVIDER") or self.default_provider).lower()
+            routes = [(provider, self._pinned_model)]
+            routes += [r for r in parse_routes(os.getenv("LLM_FALLBACK_ROUTES")) if r[0] != provider]
+
+        bindings: List[_Binding] = []
+        for i, route in enumerate(routes):
+            if isinstance(route, BaseChatModel):
+                name = getattr(route, "model_name", None) or type(route).__name__
+                bindings.append(_Binding(route._llm_type, str(name), route, version))
+                continue
+            provider, model = route[0].lower(), route[1]
+            if i == 0:
+                bindings.append(self._bind(provider, model, version))
+                continue
+            # 备用线路创建失败（缺少 API key、不支持的 provider 等）只跳过该线路，不影响主线路
+            try:
+                binding = self._bind(provider, model, version)
+            except Exception as e:
+                model = model or (self._default_model(provider) if provider in ("deepseek", "gemini") else "-")
+                logger.warning(f"[LLMRouter] 备用线路 {provider}/{model} 初始化失败，已跳过: {e}")
+                get_health(provider, model).set_unavailable(str(e))
+                continue
+            get_health(binding.provider, binding.model).set_unavailable(None)
+            bindings.append(binding)
+        return bindings
+
+    def _current_bindings(self) -> List[_Binding]:
+        """返回当前全部线路；配置版本变化时重新解析并原子替换"""
+        bindings = self._bindings
+        if not HAS_SETTINGS_MANAGER or settings_version() == bindings[0].version:
+            return bindings
+        with self._bind_lock:
+            if settings_version() != self._bindings[0].version:
+                new_bindings = self._resolve_bindings()
+                old, new = self._bindings[0], new_bindings[0]
+                if (new.provider, new.model) != (old.provider, old.model):
+                    logger.info(f"[LLMRouter] 切换到 provider={new.provider}, model={new.model}")
+                self._bindings = new_bindings
+            return self._bindings
+
+    def _current(self) -> _Binding:
+        return self._current_bindings()[0]
+
+    def _candidates(self) -> List[_Binding]:
+        """按健康度排序的候选线路：健康线路保持配置顺序在前，冷却中的线路排到最后"""
+        bindings = self._current_bindings()
+        if len(bindings) == 1:
+            return bindings
+        return sorted(bindings, key=lambda b: not get_health(b.provider, b.model).healthy)
+
+    @property
+    def provider(self) -> str:
+        return self._current().provider
+
+    @property
+    def model(self) -> str:
+        return self._current().model
+
+    @property
+    def llm(self) -> BaseChatModel:
+        return self._current().llm
+
+    @staticmethod
+    def _default_model(provider: str) -> str:
+        if provider == "deepseek":
+            return os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+        if provider == "gemini":
+            return os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    @staticmethod
+    def _api_key(provider: str) -> Optional[str]:
+        """从配置文件获取 API key（优先级高于环境变量）"""
+        api_key = get_api_key(provider) if HAS_SETTINGS_MANAGER else None
+        if api_key:
+            return api_key
+        if provider == "deepseek":
+            return os.getenv("DEEPSEEK_API_KEY")
+        if provider == "gemini":
+            return os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        return None
+
+    def _hedge_delay(self, binding: _Binding, stream: bool) -> float:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        health = get_health(binding.provider, binding.model)
+        p95 = health.ttft_p95() if stream else health.latency_p95()
+        return max(HEDGE_MIN_DELAY, p95 if p95 is not None else HEDGE_DEFAULT_DELAY)
+
+    @staticmethod
+    def _timed(binding: _Binding, fn: Callable[[_Binding], T], tokens: int, caller: str, attempt: int = 0) -> T:
+        """
+        经线路限流放行后执行一次调用，记录健康度、用量指标并按实际 token 结算
+        attempt 为本次调用是第几次尝试（0 为首次，故障转移/对冲的后续尝试依次递增）
+        """
+        with tracing.span("llm.call", **_span_attributes(binding, caller, attempt)) as span:
+            with tracing.span("llm.rate_limit"):
+                lease = rate_limiter.acquire(binding.provider, binding.model, tokens, caller)
+            health = get_health(binding.provider, binding.model)
+            start = time.monotonic()
+            try:
+                result = fn(binding)
+            except Exception:
+                health.record_failure()
+                metrics.record_llm_call(binding.provider, binding.model, caller, "error", time.monotonic() - start, attempt=attempt)
+                lease.settle(0)
+                raise
+            latency = time.monotonic() - start
+            health.record_success(latency)
+            usage = _usage(result)
+            _log_usage(binding, caller, usage)
+            _span_usage(span, usage)
+            metrics.record_llm_call(binding.provider, binding.model, caller, "ok", latency, usage, attempt=attempt)
+            lease.settle(usage["total"] if usage else None)
+            return result
+
+    def _call(self, fn: Callable[[_Binding], T], tokens: int, caller: str) -> T:
+        """按候选顺序调用，失败自动转移到下一条线路；开启对冲时走 _call_hedged"""
+        candidates = self._candidates()
+        if self.hedge and len(candidates) > 1:
+            return self._call_hedged(fn, candidates, tokens, caller)
+        last_exc: Optional[Exception] = None
+        for attempt, binding in enumerate(candidates):
+            try:
+                return self._timed(binding, fn, tokens, caller, attempt)
+            except Exception as e:
+                last_exc = e
+                if len(candidates) > 1:
+                    logger.warning(f"[LLMRouter] {binding.provider}/{binding.model} 调用失败，尝试下一条线路: {e}")
+        assert last_exc is not None
+        raise last_exc
+
+    def _call_hedged(self, fn: Callable[[_Binding], T], candidates: List[_Binding], tokens: int, caller: str) -> T:
+        """
+        对冲调用：主线路超过阈值仍未返回时，向下一条线路并发发起同样的请求，取先成功者
+        落后的请求不会被中断，其结果仅用于更新健康度
+        """
+        remaining = list(candidates[1:])
+        primary = candidates[0]
+
+        def submit(binding: _Binding) -> Future:
+            # 在线程池中沿用当前上下文，请求级用量才能累加到发起方
+            ctx = contextvars.copy_context()
+            return _hedge_pool.submit(ctx.run, self._timed, binding, fn, tokens, caller, candidates.index(binding))
+
+        futures: Dict[Future, _Binding] = {submit(primary): primary}
+        done, _ = wait(futures, timeout=self._hedge_delay(primary, stream=False))
+        if not done and remaining:
+            backup = remaining.pop(0)
+            logger.info(f"[LLMRouter] {primary.provider}/{primary.model} 超过对冲阈值，发起对冲请求 -> {backup.provider}/{backup.model}")
+            futures[submit(backup)] = backup
+
+        last_exc: Optional[BaseException] = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                binding = futures.pop(fut)
+                exc = fut.exception()
+                if exc is None:
+                    for other in futures:
+                        other.cancel()
+                    return fut.result()
+                last_exc = exc
+                logger.warning(f"[LLMRouter] {binding.provider}/{binding.model} 调用失败: {exc}")
+            if not futures and remaining:
+                backup = remaining.pop(0)
+                futures[submit(backup)] = backup
+        assert last_exc is not None
+        raise last_exc
+
+    def invoke(self, messages: Union[str, Messages], caller: str = "default") -> str:
+        """同步调用；caller 标识调用方，用于限流的优先级与公平排队"""
+        msgs = self._normalize_messages(messages)
+
+        def run(binding: _Binding):
+            llm, call_msgs = self._prepare(binding, msgs, binding.llm)
+            return llm.invoke(call_msgs)
+
+        result = self._call(run, estimate_tokens(msgs), caller)
+        return getattr(result, "content", str(result))
+
+    def _prepare(self, binding: _Binding, msgs: Messages, llm):
+        """
+        接入 provider 上下文缓存：Gemini 线路且首条为 system 指令时，改用显式缓存的 cachedContent，
+        并从请求中去掉 system 消息；DeepSeek 为自动前缀缓存，原样发送即可
+        """
+        if binding.provider != "gemini" or not msgs or msgs[0][0] != "system":
+            return llm, msgs
+        name = gemini_cached_content(self._api_key("gemini"), binding.model, msgs[0][1])
+        if not name:
+            return llm, msgs
+        return llm.bind(cached_content=name), msgs[1:]
+
+    @staticmethod
+    def _json_llm(binding: _Binding, schema_json: dict, max_tokens: int):
+        if binding.provider == "deepseek":
+            return binding.llm.bind(response_format={"type": "json_object"}, max_tokens=max_tokens)
+        if binding.provider == "gemini":
+            generation_config = {"max_output_tokens": max_tokens}
+            # flash 系列的思考 token 同样计入输出上限，短输出场景直接关闭思考
+            if "flash" in binding.model:
+                generation_config["thinking_config"] = {"thinking_budget": 0}
+            return binding.llm.bind(
+                response_mime_type="application/json",
+                response_schema=schema_json,
+                generation_config=generation_config,
+            )
+        return binding.llm
+
+    def invoke_json(
+            self,
+            messages: Union[str, Messages],
+            schema: Union[Type[BaseModel], dict],
+            max_tokens: int = 256,
+            caller: str = "default",
+    ) -> str:
+        """
+        结构化输出调用：使用各 provider 原生的 JSON 模式，返回原始 JSON 文本
+        - deepseek: response_format=json_object（提示词中需包含 "json" 字样）
+        - gemini: response_mime_type=application/json + response_schema
+        - max_tokens 用于限制输出长度，适合短小的结构化结果
+        解析与校验由调用方负责
+        """
         msgs = self._normalize_messages(messages)
-        result = self.llm.invoke(msgs)
+        schema_json = schema.model_json_schema() if isinstance(schema, type) else schema
+
+        def run(binding: _Binding):
+            llm, call_msgs = self._prepare(binding, msgs, self._json_llm(binding, schema_json, max_tokens))
+            return llm.invoke(call_msgs)
+
+        result = self._call(run, estimate_tokens(msgs, max_tokens), caller)
         return getattr(result, "content", str(result))
 
-    def stream(self, messages):
+    def stream(self, messages, caller: str = "stream"):
+        """同步流式：首个 chunk 到达前失败可转移到下一条线路，之后的错误直接抛出"""
         msgs = self._normalize_messages(messages)
-        logger.info(f"[stream] model={self.model}")
-        for chunk in self.llm.stream(msgs):
-            logger.debug(f"[stream] chunk type: {type(chunk)}, content: {str(chunk)[:100]}")
-            if hasattr(chunk, "content") and isinstance(chunk.content, str):
-                yield chunk.content
+        tokens = estimate_tokens(msgs)
+        last_exc: Optional[Exception] = None
+        for attempt, binding in enumerate(self._candidates()):
+            logger.info(f"[stream] model={binding.model}")
+            span = tracing.start_span("llm.stream", **_span_attributes(binding, caller, attempt))
+            try:
+                lease = rate_limiter.acquire(binding.provider, binding.model, tokens, caller)
+            except BaseException as e:
+                _span_end(span, error=e)
+                raise
+            health = get_health(binding.provider, binding.model)
+            start = time.monotonic()
+            it = None
+            try:
+                llm, call_msgs = self._prepare(binding, msgs, binding.llm)
+                it = iter(llm.stream(call_msgs))
+                first = next(it, None)
+            except Exception as e:
+                # 释放失败线路的底层连接
+                getattr(it, "close", lambda: None)()
+                health.record_failure()
+                metrics.record_llm_call(binding.provider, binding.model, caller, "error", time.monotonic() - start, attempt=attempt)
+                _span_end(span, error=e)
+                lease.settle(0)
+                last_exc = e
+                logger.warning(f"[stream] {binding.provider}/{binding.model} 失败，尝试下一条线路: {e}")
+                continue
+            ttft = time.monotonic() - start
+            health.record_first_token(ttft)
+            if span is not None:
+                span.set("llm.ttft_s", round(ttft, 4))
+            usage: Optional[dict] = None
+            try:
+                if first is not None:
+                    usage = _add_usage(usage, _usage(first))
+                    text = _chunk_text(first)
+                    if text:
+                        yield text
+                    for chunk in it:
+                        usage = _add_usage(usage, _usage(chunk))
+                        text = _chunk_text(chunk)
+                        if text:
+                            yield text
+            except BaseException as e:
+                _span_end(span, usage, error=e)
+                # 已开始输出：按已收到的用量结算，未收到时保留预扣
+                lease.settle(usage["total"] if usage else None)
+                raise
+            latency = time.monotonic() - start
+            health.record_success(latency)
+            _log_usage(binding, caller, usage)
+            metrics.record_llm_call(binding.provider, binding.model, caller, "ok", latency, usage, ttft, attempt)
+            _span_end(span, usage)
+            lease.settle(usage["total"] if usage else None)
+            return
+        if last_exc is not None:
+            raise last_exc
+
+    async def _aopen(self, binding: _Binding, msgs: Messages, tokens: int, caller: str, attempt: int = 0):
+        """经限流放行后打开一条线路的异步流，等待首个非空 chunk；返回 (迭代器, 首段文本, 开始时间, 首 token 延迟, 限流凭证, span, 已读 chunk 的用量)"""
+        span = tracing.start_span("llm.stream", **_span_attributes(binding, caller, attempt))
+        try:
+            lease = await rate_limiter.aacquire(binding.provider, binding.model, tokens, caller)
+        except BaseException as e:
+            # 对冲败者可能在限流排队时被取消，span 同样需要结束
+            _span_end(span, error=e)
+            raise
+        health = get_health(binding.provider, binding.model)
+        start = time.monotonic()
+        first = ""
+        usage: Optional[dict] = None
+        try:
+            # Gemini 上下文缓存未命中时 _prepare 会同步创建缓存（网络调用），不能在事件循环上执行
+            llm, call_msgs = await asyncio.to_thread(self._prepare, binding, msgs, binding.llm)
+            it = llm.astream(call_msgs).__aiter__()
+            while not first:
+                chunk = await it.__anext__()
+                usage = _add_usage(usage, _usage(chunk))
+                first = _chunk_text(chunk)
+        except StopAsyncIteration:
+            pass
+        except BaseException as e:
+            if isinstance(e, Exception):
+                health.record_failure()
+                metrics.record_llm_call(binding.provider, binding.model, caller, "error", time.monotonic() - start, attempt=attempt)
+            _span_end(span, error=e)
+            lease.settle(usage["total"] if usage else 0)
+            raise
+        ttft = time.monotonic() - start
+        health.record_first_token(ttft)
+        if span is not None:
+            span.set("llm.ttft_s", round(ttft, 4))
+        return it, first, start, ttft, lease, span, usage
 
-    async def astream(self, messages):
+    async def _aopen_hedged(self, msgs: Messages, candidates: List[_Binding], tokens: int, caller: str):
+        """异步流对冲：主线路首 token 超过阈值时并发打开下一条线路，取先出首 token 者"""
+        remaining = list(candidates[1:])
+        primary = candidates[0]
+        tasks: Dict[asyncio.Task, _Binding] = {asyncio.ensure_future(self._aopen(primary, msgs, tokens, caller)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(primary, stream=True))
+        if not done and remaining:
+            backup = remaining.pop(0)
+            logger.info(f"[astream] {primary.provider}/{primary.model} 首 token 超过对冲阈值，发起对冲请求 -> {backup.provider}/{backup.model}")
+            tasks[asyncio.ensure_future(self._aopen(backup, msgs, tokens, caller, candidates.index(backup)))] = backup
+
+        last_exc: Optional[BaseException] = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    binding = tasks.pop(task)
+                    if task.exception() is None:
+                        return (binding,) + task.result()
+                    last_exc = task.exception()
+                    logger.warning(f"[astream] {binding.provider}/{binding.model} 失败: {last_exc}")
+                if not tasks and remaining:
+                    backup = remaining.pop(0)
+                    tasks[asyncio.ensure_future(self._aopen(backup, msgs, tokens, caller, candidates.index(backup)))] = backup
+        finally:
+            # 落败线路：已打开的流直接关闭，未完成的取消
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    it, _, _, _, lease, span, usage = task.result()
+                    asyncio.ensure_future(it.aclose())
+                    _span_end(span, error=asyncio.CancelledError())
+                    lease.settle(usage["total"] if usage else None)
+                else:
+                    task.cancel()
+        assert last_exc is not None
+        raise last_exc
+
+    async def astream(self, messages, caller: str = "stream"):
+        """异步流式：首个 chunk 到达前失败可转移（或对冲）到下一条线路，之后的错误直接抛出"""
         msgs = self._normalize_messages(messages)
-        logger.info(f"[astream] model={self.model}")
-        async for chunk in self.llm.astream(msgs):
-            logger.debug(f"[astream] chunk type: {type(chunk)}, content: {str(chunk)[:100]}")
-            if hasattr(chunk, "content") and isinstance(chunk.content, str):
-                yield chunk.content
+        tokens = estimate_tokens(msgs)
+        candidates = self._candidates()
+        if self.hedge and len(candidates) > 1:
+            binding, it, first, start, ttft, lease, span, usage = await self._aopen_hedged(msgs, candidates, tokens, caller)
+        else:
+            last_exc: Optional[Exception] = None
+            for attempt, binding in enumerate(candidates):
+                try:
+                    it, first, start, ttft, lease, span, usage = await self._aopen(binding, msgs, tokens, caller, attempt)
+                    break
+                except Exception as e:
+                    last_exc = e
+                    if len(candidates) > 1:
+                        logger.warning(f"[astream] {binding.provider}/{binding.model} 失败，尝试下一条线路: {e}")
+            else:
+                assert last_exc is not None
+                raise last_exc
+
+        logger.info(f"[astream] model={binding.model}")
+        try:
+            if first:
+                yield first
+            async for chunk in it:
+                usage = _add_usage(usage, _usage(chunk))
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+        except BaseException as e:
+            _span_end(span, usage, error=e)
+            lease.settle(usage["total"] if usage else None)
+            raise
+        finally:
+            aclose = getattr(it, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        latency = time.monotonic() - start
+        get_health(binding.provider, binding.model).record_success(latency)
+        _log_usage(binding, caller, usage)
+        metrics.record_llm_call(binding.provider, binding.model, caller, "ok", latency, usage, ttft, candidates.index(binding))
+        _span_end(span, usage)
+        lease.settle(usage["total"] if usage else None)
 
     def invoke_reasoning(self, messages: Union[str, Messages]) -> dict:
         """思考模型调用（保持不变）"""
         msgs = self._normalize_messages(messages)
+        binding = self._current()
 
-        if self.provider == "deepseek":
+        if binding.provider == "deepseek":
             model = os.getenv("DEEPSEEK_REASONING_MODEL", "deepseek-reasoner")
-            ds = ChatDeepSeek(
-                model=model,
-                temperature=self.temperature,
-                max_tokens=None,
-                timeout=self.timeout,
-                max_retries=self.max_retries,
+            ds = llm_pool.get_chat_client(
+                "deepseek",
+                model,
+                self.temperature,
+                self.timeout,
+                self.max_retries,
+                self._api_key("deepseek"),
             )
             ai_msg = ds.invoke(msgs)
             reasoning = None
@@ -112,14 +646,13 @@ class LLMRouter:
             content = getattr(ai_msg, "content", "") or ""
             return {"reasoning": reasoning, "content": content}
 
-        elif self.provider == "gemini":
+        elif binding.provider == "gemini":
             try:
-                from google import genai
                 from google.genai import types
-                api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+                api_key = self._api_key("gemini")
                 if not api_key:
                     raise ValueError("缺少 GEMINI_API_KEY/GOOGLE_API_KEY 环境变量")
-                client = genai.Client(api_key=api_key)
+                client = llm_pool.get_genai_client(api_key)
 
                 prompt = self._join_as_prompt(msgs)
                 resp = client.models.generate_content(
@@ -147,11 +680,11 @@ class LLMRouter:
                 return {"reasoning": reasoning, "content": "".join(content_parts) if content_parts else ""}
 
             except Exception:
-                ai_msg = self.llm.invoke(msgs)
+                ai_msg = binding.llm.invoke(msgs)
                 return {"reasoning": None, "content": getattr(ai_msg, "content", "") or ""}
 
         else:
-            raise ValueError(f"Unsupported LLM provider: {self.provider}")
+            raise ValueError(f"Unsupported LLM provider: {binding.provider}")
 
     @staticmethod
     def build_messages(system: str | None, user: str) -> Messages:
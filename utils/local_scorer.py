@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+from typing import Dict, FrozenSet, List, Tuple
+
+from utils.bazi_relations import (
+    BRANCH_ELEMENT, CLASH, HARM, HARMONY, STEM_ELEMENT,
+    branch_relation, branch_ten_god, element_counts, stem_combines, ten_god,
+)
+from utils.ganzhi_index import range_columns, year_columns
+
+"""
+本地规则打分（不调用 LLM）
+
+按命盘与流日/流月/流年干支的关系给出 情感 / 健康 / 财富 三维分（0-100 整数）：
+- 五行平衡：以日主五行在原局中的得助程度判断身强身弱，得出喜用五行；
+  流日干支五行为喜用则加分、为忌则减分，补原局最少的五行对健康加分
+- 十神：流日天干、地支本气相对日主的十神（财星看财富，男看财星、女看官杀为感情星，七杀伤身 ...）
+- 刑冲合害：与日支（夫妻宫）六合加分、六冲 / 六害减分，与日主天干五合加分，冲原局地支伤健康
+
+命盘固定后，六十甲子各自的得分只与命盘有关：构造时一次性算好 60 项的分值表，
+之后任一天的打分只是三次查表（日柱、月柱、年柱，取自 utils/ganzhi_index.py）加和，可用于：
+    LLM 不可用时的兜底
+    历史日期区间的批量打分
+    作为参考分交给 LLM 微调
+"""
+
+BASE_SCORE = 60
+# 日柱、月柱、年柱对当日分数的权重
+DAY_WEIGHT = 1.0
+MONTH_WEIGHT = 0.4
+YEAR_WEIGHT = 0.2
+
+Scores = Tuple[float, float, float]
+
+
+def favorable_elements(chart) -> Tuple[bool, FrozenSet[int]]:
+    """
+    (是否身强, 喜用五行下标集合)
+    同我、生我的五行个数（含日主本身，共 8 字）过半为身强，喜 食伤、财、官杀 的五行；否则喜 比劫、印 的五行
+    """
+    counts = element_counts(chart.pillars)
+    dm_element = STEM_ELEMENT[chart.day_master]
+    strong = counts[dm_element] + counts[(dm_element - 1) % 5] >= 4
+    if strong:
+        return True, frozenset({(dm_element + 1) % 5, (dm_element + 2) % 5, (dm_element + 3) % 5})
+    return False, frozenset({dm_element, (dm_element - 1) % 5})
+
+
+class LocalScorer:
+    """某个命盘的本地打分器（构造后不可变，可跨线程复用）"""
+    __slots__ = ("table",)
+
+    def __init__(self, chart):
+        pillars = chart.pillars
+        day_master = chart.day_master
+        day_branch = pillars[2].zhi
+        natal_branches = tuple(p.zhi for p in pillars)
+
+        counts = element_counts(pillars)
+        strong, favorable = favorable_elements(chart)
+        weakest = min(range(5), key=lambda e: counts[e])
+        strongest = max(range(5), key=lambda e: counts[e])
+        spouse_category = 2 if chart.male else 3  # 男看财星，女看官杀
+
+        def element_effect(element: int) -> Tuple[float, float]:
+            """(运势加减, 健康加减)"""
+            luck = 4.0 if element in favorable else -4.0
+            health = 0.0
+            if element == weakest:
+                health += 5.0
+            elif element == strongest and counts[element] >= 3:
+                health -= 4.0
+            return luck, health
+
+        def god_effect(god: int, weight: float) -> Scores:
+            category = god // 2  # 0 比劫 1 食伤 2 财 3 官杀 4 印
+            emotion = health = wealth = 0.0
+            if category == 2:
+                wealth += 8.0 if strong else 3.0
+            elif category == 0:
+                wealth -= 8.0 if god == 1 else 4.0
+            elif category == 1:
+                wealth += 3.0
+            if category == spouse_category:
+                emotion += 6.0
+            if god == 3 and not chart.male:
+                emotion -= 4.0
+            if god == 6:
+                health -= 5.0
+            elif category == 4:
+                health += 4.0
+            return emotion * weight, health * weight, wealth * weight
+
+        def pillar_scores(index: int) -> Scores:
+            gan, zhi = index % 10, index % 12
+            emotion = health = wealth = 0.0
+
+            for element, weight in ((STEM_ELEMENT[gan], 1.0), (BRANCH_ELEMENT[zhi], 1.0)):
+                luck, h = element_effect(element)
+                emotion += luck * 0.5 * weight
+                health += (luck * 0.5 + h) * weight
+                wealth += luck * weight
+
+            for god, weight in ((ten_god(day_master, gan), 1.0), (branch_ten_god(day_master, zhi), 0.6)):
+                e, h, w = god_effect(god, weight)
+                emotion, health, wealth = emotion + e, health + h, wealth + w
+
+            relation = branch_relation(zhi, day_branch)
+            if relation & HARMONY:
+                emotion += 8.0
+            if relation & CLASH:
+                emotion -= 10.0
+                health -= 2.0
+            if relation & HARM:
+                emotion -= 4.0
+            if stem_combines(gan, day_master):
+                emotion += 5.0
+            for natal in natal_branches:
+                if branch_relation(zhi, natal) & CLASH:
+                    health -= 4.0
+            return emotion, health, wealth
+
+        self.table = tuple(pillar_scores(i) for i in range(60))
+
+    def score_indices(self, day: int, month: int, year: int) -> Dict[str, int]:
+        d, m, y = self.table[day], self.table[month], self.table[year]
+        return {
+            key: max(0, min(100, int(round(BASE_SCORE + d[k] * DAY_WEIGHT + m[k] * MONTH_WEIGHT + y[k] * YEAR_WEIGHT))))
+            for k, key in enumerate(("emotion", "health", "wealth"))
+        }
+
+    def score(self, d: date) -> Dict[str, int]:
+        days, months, years = year_columns(d.year)
+        i = d.timetuple().tm_yday - 1
+        return self.score_indices(days[i], months[i], years[i])
+
+    def score_range(self, start: date, end: date) -> List[Dict]:
+        """[start, end] 闭区间内逐日打分（干支取自逐日干支索引）"""
+        days, months, years = range_columns(start, end)
+        return [
+            {"key": (start + timedelta(days=i)).isoformat(), **self.score_indices(days[i], months[i], years[i])}
+            for i in range(len(days))
+        ]
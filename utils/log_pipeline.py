@@ -0,0 +1,123 @@
+"""
+非阻塞日志管线
+- setup_logging()：根 logger 只挂一个 QueueHandler，控制台与文件输出由后台 QueueListener 线程完成，
+  事件循环中的日志调用只做入队，不等待磁盘；队列满时丢弃并计数，不阻塞业务
+- StreamLog：流式输出的逐 chunk 日志按采样率记录（DEBUG），结束时输出一条结构化汇总（INFO）
+
+配置（环境变量）：
+    LOG_LEVEL              根日志级别，默认 INFO
+    LOG_FILE               日志文件，默认 app.log，置空则只输出到控制台
+    LOG_CHUNK_SAMPLE_EVERY 每隔多少个 chunk 记录一次 chunk 日志，默认 50，0 表示不记录
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_QUEUE_SIZE = 10000
+DEFAULT_CHUNK_SAMPLE_EVERY = 50
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录而不是阻塞调用方"""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: Optional[str] = None, log_file: Optional[str] = None) -> None:
+    """配置根 logger（可重复调用，只生效一次）"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        log_file = os.getenv("LOG_FILE", "app.log") if log_file is None else log_file
+
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_DroppingQueueHandler(log_queue))
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def _sample_every() -> int:
+    try:
+        return max(0, int(os.getenv("LOG_CHUNK_SAMPLE_EVERY", DEFAULT_CHUNK_SAMPLE_EVERY)))
+    except ValueError:
+        return DEFAULT_CHUNK_SAMPLE_EVERY
+
+
+class StreamLog:
+    """
+    单次流式输出的日志：
+    - chunk() 只累加计数，每 LOG_CHUNK_SAMPLE_EVERY 个 chunk 记录一条 DEBUG（含首个 chunk）
+    - finish() 输出一条汇总：chunk 数、字符数、首 chunk 延迟、总耗时、状态，结构化字段放在 record.stream
+    """
+    __slots__ = ("logger", "name", "fields", "every", "debug", "start", "first_at", "chunks", "chars", "done")
+
+    def __init__(self, logger: logging.Logger, name: str, **fields: Any) -> None:
+        self.logger = logger
+        self.name = name
+        self.fields = fields
+        self.every = _sample_every()
+        self.debug = self.every > 0 and logger.isEnabledFor(logging.DEBUG)
+        self.start = time.monotonic()
+        self.first_at: Optional[float] = None
+        self.chunks = 0
+        self.chars = 0
+        self.done = False
+
+    def chunk(self, text: str) -> None:
+        self.chunks += 1
+        self.chars += len(text)
+        if self.first_at is None:
+            self.first_at = time.monotonic()
+        if self.debug and (self.chunks - 1) % self.every == 0:
+            self.logger.debug(f"[{self.name}] chunk #{self.chunks}: {text[:30]!r}")
+
+    def finish(self, status: str = "ok", error: Optional[BaseException] = None) -> Dict[str, Any]:
+        """输出汇总记录（只输出一次），返回汇总字段"""
+        summary: Dict[str, Any] = dict(self.fields)
+        summary.update(
+            status=status,
+            chunks=self.chunks,
+            chars=self.chars,
+            ttfb=round(self.first_at - self.start, 3) if self.first_at is not None else None,
+            duration=round(time.monotonic() - self.start, 3),
+        )
+        if error is not None:
+            summary["error"] = f"{type(error).__name__}: {error}"
+        if not self.done:
+            self.done = True
+            text = " ".join(f"{k}={v}" for k, v in summary.items())
+            level = logging.ERROR if status == "error" else logging.INFO
+            self.logger.log(level, f"[{self.name}] summary {text}", extra={"stream": summary})
+        return summary
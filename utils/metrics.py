@@ -0,0 +1,181 @@
+"""
+进程内指标统计
+- 每次 LLM 调用记录：provider / model / 调用方、输入 / 输出 / 缓存命中 token、首 token 延迟、总延迟、重试次数
+- render_prometheus() 输出 Prometheus 文本格式，供 /metrics 接口暴露
+- 请求级用量：中间件通过 start_request_usage() 为每个 HTTP 请求创建累加器，
+  同一请求内（含 asyncio.to_thread 派生的线程）的 LLM 调用都会累加进去，可写入响应头
+"""
+import contextvars
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# 延迟直方图分桶（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: LabelValues, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label_values -> [各分桶计数..., +Inf 计数, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: LabelValues, value: float) -> None:
+        with self._lock:
+            slot = self._values.setdefault(label_values, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    slot[i] += 1
+            slot[-2] += 1
+            slot[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, slot in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, slot):
+                    lines.append(
+                        f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (_num(bound),))} {_num(count)}"
+                    )
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + ('+Inf',))} {_num(slot[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {_num(slot[-2])}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {_num(slot[-1])}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+_CALL_LABELS = ("provider", "model", "caller")
+
+llm_requests = Counter("llm_requests_total", "LLM 调用次数", _CALL_LABELS + ("status",))
+llm_tokens = Counter("llm_tokens_total", "LLM token 用量", _CALL_LABELS + ("type",))
+llm_retries = Counter("llm_retries_total", "LLM 故障转移/对冲产生的额外尝试次数", _CALL_LABELS)
+llm_latency = Histogram("llm_request_latency_seconds", "LLM 调用总延迟", _CALL_LABELS)
+llm_ttft = Histogram("llm_time_to_first_token_seconds", "LLM 流式调用首 token 延迟", _CALL_LABELS)
+
+_REGISTRY = [llm_requests, llm_tokens, llm_retries, llm_latency, llm_ttft]
+
+
+class RequestUsage:
+    """单个 HTTP 请求内的 LLM 用量累加器"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.latency = 0.0
+        self.ttft: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, status: str, usage: Optional[dict], latency: float, ttft: Optional[float], retried: bool) -> None:
+        with self._lock:
+            self.retries += int(retried)
+            self.latency += latency
+            if status != "ok":
+                return
+            self.calls += 1
+            if ttft is not None and self.ttft is None:
+                self.ttft = ttft
+            if usage:
+                self.prompt_tokens += usage.get("input", 0)
+                self.completion_tokens += usage.get("output", 0)
+                self.cached_tokens += usage.get("cached", 0)
+
+    def header_value(self) -> str:
+        parts = [
+            f"calls={self.calls}",
+            f"prompt={self.prompt_tokens}",
+            f"completion={self.completion_tokens}",
+            f"cached={self.cached_tokens}",
+            f"retries={self.retries}",
+            f"latency={self.latency:.3f}",
+        ]
+        if self.ttft is not None:
+            parts.append(f"ttft={self.ttft:.3f}")
+        return ";".join(parts)
+
+
+_request_usage: contextvars.ContextVar[Optional[RequestUsage]] = contextvars.ContextVar("llm_request_usage", default=None)
+
+
+def start_request_usage() -> RequestUsage:
+    """为当前请求上下文创建用量累加器"""
+    usage = RequestUsage()
+    _request_usage.set(usage)
+    return usage
+
+
+def record_llm_call(
+        provider: str,
+        model: str,
+        caller: str,
+        status: str,
+        latency: float,
+        usage: Optional[dict] = None,
+        ttft: Optional[float] = None,
+        attempt: int = 0,
+) -> None:
+    """
+    记录一次 LLM 调用
+    status: ok / error；attempt: 第几次尝试，大于 0 即为故障转移/对冲产生的重试
+    """
+    labels = (provider, model, caller)
+    llm_requests.inc(labels + (status,))
+    llm_latency.observe(labels, latency)
+    if ttft is not None:
+        llm_ttft.observe(labels, ttft)
+    if attempt:
+        llm_retries.inc(labels)
+    if usage:
+        llm_tokens.inc(labels + ("prompt",), usage.get("input", 0))
+        llm_tokens.inc(labels + ("completion",), usage.get("output", 0))
+        llm_tokens.inc(labels + ("cached",), usage.get("cached", 0))
+    request_usage = _request_usage.get()
+    if request_usage is not None:
+        request_usage.add(status, usage, latency, ttft, attempt > 0)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,271 @@
+"""
+LLM 客户端限流
+- 每个 (provider, model) 一个令牌桶限流器，同时限制每分钟请求数 (RPM) 与每分钟 token 数 (TPM)
+- token 按预估值预扣，调用结束后按实际用量多退少补
+- 等待队列按 (调用方优先级, 虚拟时间, 入队顺序) 排序：不同优先级按配置顺序放行，
+  同一优先级内各调用方轮流放行（公平队列），避免某一类请求把其他请求饿死
+- 同时支持线程内阻塞等待（run_in_executor 中的同步调用）与协程等待（astream）
+
+配置（环境变量）：
+    LLM_RATE_LIMITS      JSON，键为 "provider:model" 或 "provider"，如 {"deepseek": {"rpm": 300, "tpm": 1000000}}
+                         未配置的线路不限流
+    LLM_PRIORITY_ORDER   调用方优先级，逗号分隔，越靠前越优先，默认 stream,chat,analyze,score,prefetch
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY_ORDER = "stream,chat,analyze,score,prefetch"
+# 预估 token：每字符约 0.6 token（中文为主），另加预期输出
+TOKENS_PER_CHAR = 0.6
+DEFAULT_OUTPUT_TOKENS = 2000
+# 单次等待的最长时间，到点后重新检查队列状态
+MAX_WAIT_SLICE = 1.0
+
+
+def estimate_tokens(messages: List[Tuple[str, str]], max_output_tokens: Optional[int] = None) -> int:
+    """按字符数粗略预估一次调用的 token 用量（输入 + 预期输出）"""
+    chars = sum(len(text) for _, text in messages)
+    return int(math.ceil(chars * TOKENS_PER_CHAR)) + (max_output_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+class TokenBucket:
+    """按分钟额度匀速补充的令牌桶（调用方需持有外部锁）"""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class Lease:
+    """
+    一次放行的凭证，调用结束后用 RateLimiter.settle 结算实际 token（只结算一次）
+    失败的调用按 0 结算退回预扣；actual_tokens 为 None（用量未知）时保留预扣
+    """
+    __slots__ = ("limiter", "tokens", "caller", "settled")
+
+    def __init__(self, limiter: Optional["RateLimiter"], tokens: int, caller: str) -> None:
+        self.limiter = limiter
+        self.tokens = tokens
+        self.caller = caller
+        self.settled = False
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        if self.settled:
+            return
+        self.settled = True
+        if self.limiter is not None and actual_tokens is not None:
+            self.limiter.settle(self, actual_tokens)
+
+
+class _Waiter:
+    __slots__ = ("key", "tokens", "caller", "event", "loop", "future")
+
+    def __init__(self, key: tuple, tokens: int, caller: str) -> None:
+        self.key = key
+        self.tokens = tokens
+        self.caller = caller
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        elif self.loop is not None and self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if self.future is not None and not self.future.done():
+            self.future.set_result(None)
+
+
+class RateLimiter:
+    """单条线路的 RPM/TPM 限流器，带优先级公平队列"""
+
+    def __init__(self, name: str, rpm: Optional[float], tpm: Optional[float], priority_order: List[str]) -> None:
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.priority = {caller: i for i, caller in enumerate(priority_order)}
+        self._lock = threading.Lock()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0
+        self._caller_time: Dict[str, int] = {}
+
+    def _enqueue(self, tokens: int, caller: str) -> _Waiter:
+        if self.token_bucket is not None:
+            tokens = min(tokens, int(self.token_bucket.capacity))
+        rank = self.priority.get(caller, len(self.priority))
+        vt = max(self._virtual_time, self._caller_time.get(caller, 0)) + 1
+        self._caller_time[caller] = vt
+        waiter = _Waiter((rank, vt, next(self._seq)), tokens, caller)
+        heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _try_grant(self, waiter: _Waiter) -> float:
+        """队首且额度充足时放行并返回 0，否则返回建议等待秒数"""
+        now = time.monotonic()
+        for bucket in (self.requests, self.token_bucket):
+            if bucket is not None:
+                bucket.refill(now)
+        if self._queue[0] is not waiter:
+            return MAX_WAIT_SLICE
+        wait = max(
+            self.requests.wait_time(1) if self.requests else 0.0,
+            self.token_bucket.wait_time(waiter.tokens) if self.token_bucket else 0.0,
+        )
+        if wait > 0:
+            return min(wait, MAX_WAIT_SLICE)
+        if self.requests:
+            self.requests.tokens -= 1
+        if self.token_bucket:
+            self.token_bucket.tokens -= waiter.tokens
+        heapq.heappop(self._queue)
+        self._virtual_time = max(self._virtual_time, waiter.key[1])
+        if self._queue:
+            self._queue[0].wake()
+        return 0.0
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """等待被取消或异常时出队，并唤醒新的队首"""
+        with self._lock:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                if self._queue:
+                    self._queue[0].wake()
+
+    def acquire(self, tokens: int, caller: str = "default") -> Lease:
+        """阻塞等待放行（用于线程中的同步调用）"""
+        with self._lock:
+            waiter = self._enqueue(tokens, caller)
+            waiter.event = threading.Event()
+        try:
+            while True:
+                with self._lock:
+                    waiter.event.clear()
+                    wait = self._try_grant(waiter)
+                if wait == 0:
+                    return Lease(self, waiter.tokens, caller)
+                waiter.event.wait(wait)
+        except BaseException:
+            self._remove(waiter)
+            raise
+
+    async def aacquire(self, tokens: int, caller: str = "default") -> Lease:
+        """协程等待放行（用于事件循环中的流式调用）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._enqueue(tokens, caller)
+            waiter.loop = loop
+        try:
+            while True:
+                with self._lock:
+                    waiter.future = loop.create_future()
+                    wait = self._try_grant(waiter)
+                if wait == 0:
+                    return Lease(self, waiter.tokens, caller)
+                try:
+                    await asyncio.wait_for(waiter.future, timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._remove(waiter)
+            raise
+
+    def settle(self, lease: Lease, actual_tokens: int) -> None:
+        """按实际用量结算：预扣多了退回，少了补扣（允许暂时为负，后续请求顺延）"""
+        if self.token_bucket is None:
+            return
+        with self._lock:
+            self.token_bucket.refill(time.monotonic())
+            self.token_bucket.tokens = min(
+                self.token_bucket.capacity,
+                self.token_bucket.tokens + lease.tokens - actual_tokens,
+            )
+            if self._queue:
+                self._queue[0].wake()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "waiting": len(self._queue),
+                "rpm_available": round(self.requests.tokens, 2) if self.requests else None,
+                "tpm_available": round(self.token_bucket.tokens) if self.token_bucket else None,
+            }
+
+
+_limiters: Dict[Tuple[str, str], Optional[RateLimiter]] = {}
+_limiters_lock = threading.Lock()
+
+
+def _load_limits() -> dict:
+    raw = os.getenv("LLM_RATE_LIMITS", "").strip()
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        logger.warning("[rate_limiter] LLM_RATE_LIMITS 不是合法 JSON，忽略限流配置")
+        return {}
+
+
+def get_limiter(provider: str, model: str) -> Optional[RateLimiter]:
+    """获取线路限流器，未配置限额时返回 None（不限流）"""
+    key = (provider, model)
+    if key in _limiters:
+        return _limiters[key]
+    with _limiters_lock:
+        if key not in _limiters:
+            limits = _load_limits()
+            conf = limits.get(f"{provider}:{model}") or limits.get(provider)
+            limiter = None
+            if conf and (conf.get("rpm") or conf.get("tpm")):
+                order = [c.strip() for c in os.getenv("LLM_PRIORITY_ORDER", DEFAULT_PRIORITY_ORDER).split(",") if c.strip()]
+                limiter = RateLimiter(f"{provider}:{model}", conf.get("rpm"), conf.get("tpm"), order)
+            _limiters[key] = limiter
+        return _limiters[key]
+
+
+def acquire(provider: str, model: str, tokens: int, caller: str) -> Lease:
+    limiter = get_limiter(provider, model)
+    if limiter is None:
+        return Lease(None, tokens, caller)
+    return limiter.acquire(tokens, caller)
+
+
+async def aacquire(provider: str, model: str, tokens: int, caller: str) -> Lease:
+    limiter = get_limiter(provider, model)
+    if limiter is None:
+        return Lease(None, tokens, caller)
+    return await limiter.aacquire(tokens, caller)
+
+
+def snapshot_all() -> list[dict]:
+    return [limiter.snapshot() for limiter in list(_limiters.values()) if limiter is not None]
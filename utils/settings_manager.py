@@ -1,27 +1,82 @@
 """
 配置管理模块
 支持动态读取和保存 API keys 等配置信息
+- 解析结果缓存在内存中，按文件 mtime 检测变化，变化时才重新解析 YAML
+- 每次内容变化递增版本号，LLMRouter 据此切换到新的客户端
+- 修改配置用 update_settings()：以文件原始内容为底合并，不会把环境变量 / 默认值写回文件
 """
+import copy
+import logging
 import os
+import tempfile
+import threading
 import yaml
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 SETTINGS_FILE = Path(__file__).parent.parent / "config" / "settings.yaml"
 
+_lock = threading.Lock()
+_raw: dict = {}
+_signature: Optional[Tuple[int, int]] = None
+_version = 0
+_listeners: List[Callable[[dict], None]] = []
 
-def load_settings() -> dict:
-    """读取配置文件"""
-    if not SETTINGS_FILE.exists():
-        # 如果文件不存在，返回默认配置
-        return {
-            "gemini_api_key": os.getenv("GEMINI_API_KEY", ""),
-            "deepseek_api_key": os.getenv("DEEPSEEK_API_KEY", ""),
-            "llm_provider": os.getenv("LLM_PROVIDER", "gemini"),
-        }
 
+def _file_signature() -> Optional[Tuple[int, int]]:
+    """配置文件签名 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = SETTINGS_FILE.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_file() -> dict:
+    if not SETTINGS_FILE.exists():
+        return {}
     with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-        settings = yaml.safe_load(f) or {}
+        return yaml.safe_load(f) or {}
+
+
+def _set_raw(raw: dict, signature: Optional[Tuple[int, int]]) -> bool:
+    """更新缓存（调用方需持有 _lock），内容变化时返回 True"""
+    global _raw, _signature, _version
+    _signature = signature
+    if raw == _raw and _version:
+        return False
+    _raw = raw
+    _version += 1
+    return True
+
+
+def _notify(settings: dict) -> None:
+    for listener in list(_listeners):
+        try:
+            listener(settings)
+        except Exception as e:
+            logger.warning(f"[settings] 配置变化回调失败: {e}", exc_info=True)
+
+
+def _refresh() -> None:
+    """文件 mtime 变化时重新解析并更新缓存"""
+    signature = _file_signature()
+    if signature == _signature and _version:
+        return
+    with _lock:
+        if signature == _signature and _version:
+            return
+        changed = _set_raw(_read_file(), signature)
+    if changed:
+        _notify(load_settings())
+
+
+def load_settings() -> dict:
+    """读取配置（内存缓存，返回副本）"""
+    _refresh()
+    settings = copy.deepcopy(_raw)
 
     # 如果配置文件中没有，尝试从环境变量读取
     settings.setdefault("gemini_api_key", os.getenv("GEMINI_API_KEY", ""))
@@ -31,13 +86,56 @@ def load_settings() -> dict:
     return settings
 
 
-def save_settings(settings: dict) -> None:
-    """保存配置文件"""
-    # 确保配置目录存在
+def _write_file(settings: dict) -> None:
+    """写入配置文件（调用方需持有 _lock）：先写唯一命名的临时文件再替换，读取方不会读到半份文件"""
     SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{SETTINGS_FILE.name}.", suffix=".tmp", dir=SETTINGS_FILE.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yaml.safe_dump(settings, f, allow_unicode=True, default_flow_style=False)
+        os.replace(tmp_file, SETTINGS_FILE)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
 
-    with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-        yaml.safe_dump(settings, f, allow_unicode=True, default_flow_style=False)
+
+def save_settings(settings: dict) -> None:
+    """整体覆盖配置文件"""
+    with _lock:
+        _write_file(settings)
+        changed = _set_raw(copy.deepcopy(settings), _file_signature())
+    if changed:
+        _notify(load_settings())
+
+
+def update_settings(changes: dict) -> None:
+    """只修改 changes 中的字段，其余保持配置文件原样（不含 load_settings 补上的默认值）"""
+    with _lock:
+        raw = _read_file()
+        raw.update(changes)
+        _write_file(raw)
+        changed = _set_raw(copy.deepcopy(raw), _file_signature())
+    if changed:
+        _notify(load_settings())
+
+
+def settings_version() -> int:
+    """当前配置版本号，配置内容每变化一次递增一次"""
+    _refresh()
+    return _version
+
+
+def subscribe(listener: Callable[[dict], None]) -> None:
+    """注册配置变化回调，参数为最新配置"""
+    _listeners.append(listener)
+
+
+def get_llm_provider() -> Optional[str]:
+    """配置文件中显式指定的 llm_provider，未配置时返回 None"""
+    _refresh()
+    provider = _raw.get("llm_provider")
+    return provider.lower() if provider else None
 
 
 def get_api_key(provider: str) -> Optional[str]:
@@ -54,11 +152,5 @@ def get_api_key(provider: str) -> Optional[str]:
 
 def update_api_key(provider: str, api_key: str) -> None:
     """更新指定 provider 的 API key"""
-    settings = load_settings()
-
-    if provider == "gemini":
-        settings["gemini_api_key"] = api_key
-    elif provider == "deepseek":
-        settings["deepseek_api_key"] = api_key
-
-    save_settings(settings)
+    if provider in ("gemini", "deepseek"):
+        update_settings({f"{provider}_api_key": api_key})
@@ -0,0 +1,260 @@
+"""
+请求级链路追踪
+- span() 上下文管理器 / traced() 装饰器记录分层耗时，父子关系通过 contextvars 传递
+  （asyncio.to_thread 与复制了上下文的线程池任务会沿用请求内的当前 span）
+- 生成器（流式输出）跨 yield 不适合切换上下文，使用 start_span() 手动创建、end() 结束
+- 中间件以请求 ID 作为 trace ID，同一请求的所有 span 归入同一条链路
+- 结束的 span 由后台线程批量导出为 OpenTelemetry (OTLP/JSON) 格式：
+    TRACE_EXPORT_FILE   追加写入文件，每批一行
+    TRACE_EXPORT_URL    POST 到本地采集器，如 http://127.0.0.1:4318/v1/traces
+  两者均未配置时不记录 span，仅保留请求 ID
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+SERVICE_NAME = "zhoubazi"
+# 批量导出：攒够条数或超过间隔即写出
+EXPORT_BATCH_SIZE = 200
+EXPORT_INTERVAL = 2.0
+EXPORT_QUEUE_SIZE = 10000
+
+# OTLP 常量
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]) -> None:
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def error(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _exporter.submit(self)
+
+    def to_otlp(self) -> dict:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _Exporter:
+    """后台批量导出线程，队列满时丢弃 span，不阻塞业务"""
+
+    def __init__(self) -> None:
+        self.file = os.getenv("TRACE_EXPORT_FILE", "").strip() or None
+        self.url = os.getenv("TRACE_EXPORT_URL", "").strip() or None
+        self.enabled = bool(self.file or self.url)
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _drain(self, block: bool) -> List[Span]:
+        batch: List[Span] = []
+        deadline = time.monotonic() + EXPORT_INTERVAL
+        while len(batch) < EXPORT_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._drain(block=True)
+            if batch:
+                self._export(batch)
+
+    def flush(self) -> None:
+        batch = self._drain(block=False)
+        while batch:
+            self._export(batch)
+            batch = self._drain(block=False)
+
+    def _export(self, batch: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        }
+        try:
+            if self.file:
+                line = json.dumps(payload, ensure_ascii=False)
+                with open(self.file, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            if self.url:
+                import requests
+
+                requests.post(self.url, json=payload, timeout=5)
+        except Exception as e:
+            logger.warning(f"[tracing] span 导出失败，丢弃 {len(batch)} 条: {e}")
+
+
+_exporter = _Exporter()
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def enabled() -> bool:
+    return _exporter.enabled
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def start_request(request_id: Optional[str] = None) -> str:
+    """在当前上下文中开始一个请求；request_id 为 32 位十六进制时直接作为 trace ID，否则重新生成"""
+    rid = (request_id or "").strip().lower()
+    if len(rid) != 32 or any(c not in "0123456789abcdef" for c in rid):
+        rid = _new_trace_id()
+    _request_id.set(rid)
+    _current_span.set(None)
+    return rid
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Optional[Span]:
+    """创建当前 span 的子 span，但不将其设为当前 span；追踪未启用时返回 None"""
+    if not _exporter.enabled:
+        return None
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = _request_id.get() or _new_trace_id(), None
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """记录一段耗时，期间新建的 span 均作为其子 span"""
+    current = start_span(name, kind, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """函数装饰器：以 span 包裹整个调用（同步函数与协程均可）"""
+
+    def decorator(fn: F) -> F:
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+